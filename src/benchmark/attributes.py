@@ -0,0 +1,83 @@
+"""DynamoDB属性値形式への変換処理の性能計測
+従来のreplace_dataとboto3のTypeSerializer／TypeDeserializerによる変換と、attributesモジュールによる変換を比較する
+
+実行方法:
+    python -m benchmark.attributes --items 10000
+"""
+
+import argparse
+import time
+from decimal import Decimal
+from typing import Callable
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from benchmark import env
+
+env.setup()
+
+from aws.dynamodb import attributes  # noqa: E402
+from aws.dynamodb.users import User  # noqa: E402
+
+
+def legacy_replace_data(obj: object) -> object:
+    """従来の登録・更新用データの置換処理(比較用)"""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            obj[key] = legacy_replace_data(value)
+    elif isinstance(obj, list):
+        [legacy_replace_data(element) for element in obj]
+    elif obj == '':
+        obj = None
+    return obj
+
+
+def measure(label: str, items: int, func: Callable[[], object]) -> None:
+    """処理時間を計測して1件あたりの時間を出力する
+
+    Args:
+        label: 計測対象名
+        items: 件数
+        func: 計測対象の処理
+    """
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {elapsed / items * 1e6:8.2f}µs/件")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    args = parser.parse_args()
+
+    timestamp = Decimal("1640000000.123456")
+    users = [
+        User(user_id=f"U{index:032x}", created_time=timestamp,
+             updated_time=timestamp)
+        for index in range(args.items)
+    ]
+    serializer = TypeSerializer()
+    deserializer = TypeDeserializer()
+
+    def legacy_encode(user: User) -> dict:
+        item = legacy_replace_data(user.to_dict())
+        return {key: serializer.serialize(value) for key, value in item.items()}
+
+    def legacy_decode(item: dict) -> dict:
+        return {key: deserializer.deserialize(value) for key, value in item.items()}
+
+    encoded = [attributes.encode_item(user.to_dict()) for user in users]
+    print(f"件数: {args.items}")
+    measure("従来: 変換(replace_data+Serializer)", args.items,
+            lambda: [legacy_encode(user) for user in users])
+    measure("attributes: encode_item", args.items,
+            lambda: [attributes.encode_item(user.to_dict()) for user in users])
+    measure("従来: 復元(Deserializer)", args.items,
+            lambda: [legacy_decode(item) for item in encoded])
+    measure("attributes: decode_item", args.items,
+            lambda: [attributes.decode_item(item) for item in encoded])
+
+
+if __name__ == '__main__':
+    main()
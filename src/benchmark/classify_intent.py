@@ -0,0 +1,94 @@
+"""テキストメッセージの意図判定処理の性能計測
+従来のif/elif連鎖による判定と、正規表現による一括判定を比較する
+
+実行方法:
+    python -m benchmark.classify_intent --lengths 10 1000 5000
+"""
+
+import argparse
+import random
+import timeit
+
+from benchmark import env
+
+env.setup()
+
+from functions import intents  # noqa: E402
+
+FILLER = "今日はいい天気ですね。電車に乗って出かけます。"
+
+
+def legacy_classify(text: str) -> str:
+    """従来のif/elif連鎖による意図判定(比較用)
+
+    Args:
+        text: テキスト
+
+    Returns:
+        意図名
+    """
+    if ("jr" in text) or ("Jr" in text) or ("JR" in text) or ("西" in text):
+        return "west_jr"
+    elif ("阪急" in text) or ("はんきゅう" in text):
+        return "hankyu"
+    elif ("阪神" in text) or ("はんしん" in text):
+        return "hanshin"
+    elif ("全" in text) or ("教" in text) or ("確認" in text) or (
+            "遅延" in text) or ("現状" in text):
+        return "all"
+    elif ("使い方" in text):
+        return "how_to_use"
+    elif ("せん" in text) or ("ばか" in text) or ("あほ" in text) or (
+            "さよなら" in text) or ("それだと" in text) or ("違う" in text):
+        return "complaint"
+    elif ("ありがと" in text) or ("どうも" in text):
+        return "appreciation"
+    elif ("おはよ" in text):
+        return "greeting_morning"
+    elif ("こんばん" in text):
+        return "greeting_evening"
+    return "unsupported"
+
+
+def create_text(length: int, keyword: str) -> str:
+    """末尾にキーワードを含む性能計測用のテキストを作成する
+
+    Args:
+        length: 文字数
+        keyword: キーワード
+
+    Returns:
+        テキスト
+    """
+    filler = (FILLER * (length // len(FILLER) + 1))[:max(length - len(keyword), 0)]
+    return filler + keyword
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lengths', type=int, nargs='+',
+                        default=[10, 100, 1000, 5000])
+    parser.add_argument('--number', type=int, default=1000)
+    args = parser.parse_args()
+
+    classifier = intents.classifier
+    keywords = ["こんばんは", "阪急", "JR", "ほげ"]
+    for length in args.lengths:
+        texts = [create_text(length, keyword) for keyword in keywords]
+        random.Random(length).shuffle(texts)
+        for text in texts:
+            intent = classifier.classify(text)
+            assert (intent.name if intent else "unsupported") == legacy_classify(text)
+        legacy = min(timeit.repeat(
+            lambda: [legacy_classify(text) for text in texts],
+            number=args.number, repeat=3))
+        compiled = min(timeit.repeat(
+            lambda: [classifier.classify(text) for text in texts],
+            number=args.number, repeat=3))
+        per_call = args.number * len(texts)
+        print(f"文字数: {length:>6}, 従来: {legacy / per_call * 1e6:8.2f}µs, "
+              f"一括判定: {compiled / per_call * 1e6:8.2f}µs")
+
+
+if __name__ == '__main__':
+    main()
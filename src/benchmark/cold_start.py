@@ -0,0 +1,75 @@
+"""Lambda関数のコールドスタート時の読み込み時間の計測
+python -X importtimeを別プロセスで繰り返し実行し、モジュール毎の読み込み時間の中央値を出力する
+
+実行方法:
+    python -m benchmark.cold_start --module functions.reply --top 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from benchmark import env
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module: str) -> Dict[str, Tuple[int, int]]:
+    """別プロセスでモジュールを読み込み、モジュール毎の読み込み時間を計測する
+
+    Args:
+        module: 読み込むモジュール名
+
+    Raises:
+        subprocess.CalledProcessError: モジュールの読み込みに失敗
+
+    Returns:
+        モジュール名をキーとする(自身の読み込み時間, 累積の読み込み時間)(マイクロ秒)
+    """
+    code = f"from benchmark import env; env.setup(); import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIR, stderr=subprocess.PIPE, universal_newlines=True,
+        check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='functions.reply')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    self_times = defaultdict(list)
+    cumulative_times = defaultdict(list)
+    for _ in range(args.repeat):
+        for name, (self_us, cumulative_us) in measure_import(args.module).items():
+            self_times[name].append(self_us)
+            cumulative_times[name].append(cumulative_us)
+
+    medians = {
+        name: (statistics.median(self_times[name]),
+               statistics.median(cumulative_times[name]))
+        for name in cumulative_times
+    }
+    print(f"対象: {args.module}, 試行回数: {args.repeat}")
+    print(f"{'累積[ms]':>10} {'自身[ms]':>10}  モジュール")
+    ranking = sorted(medians.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in ranking[:args.top]:
+        print(f"{cumulative_us / 1000:10.2f} {self_us / 1000:10.2f}  {name}")
+
+
+if __name__ == '__main__':
+    env.setup()
+    main()
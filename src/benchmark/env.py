@@ -0,0 +1,30 @@
+"""性能計測用の実行環境設定モジュール
+AWSやLINEに接続せずにsrc/main配下のモジュールを読み込めるよう、ダミーの環境変数とパスを設定する
+"""
+
+import os
+import sys
+
+MAIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main")
+
+DUMMY_ENVIRONMENT = {
+    'AWS_CONNECT_TIMEOUT': '3',
+    'AWS_READ_TIMEOUT': '3',
+    'AWS_MAX_ATTEMPTS': '2',
+    'AWS_REGION_NAME': 'ap-northeast-1',
+    'AWS_USERS_TABLE': 'linebot_users-benchmark',
+    'AWS_ACCESS_KEY_ID': 'dummy',
+    'AWS_SECRET_ACCESS_KEY': 'dummy',
+    'LINE_CHANNEL_ACCESS_TOKEN': 'dummy',
+    'LINE_CHANNEL_SECRET': 'dummy',
+}
+
+
+def setup() -> None:
+    """ダミーの環境変数とsrc/mainへのパスを設定する
+    既に設定されている環境変数は上書きしない
+    """
+    for key, value in DUMMY_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    if MAIN_DIR not in sys.path:
+        sys.path.insert(0, MAIN_DIR)
@@ -0,0 +1,740 @@
+"""性能計測用のインメモリDynamoDB
+users_tableなどが使用する低レベルクライアントのAPIを、AWSに接続せずにメモリ上で模倣する
+対応する式はこのリポジトリで使用している構文(比較演算子、AND/OR/NOT、
+attribute_exists/attribute_not_exists/begins_with/contains、SET/ADD/REMOVE/DELETE)に限る
+グローバルセカンダリインデックスは、キーのみを射影するインデックスのパーティションキーの等価条件によるクエリに限る
+"""
+
+import re
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# 定数群
+# 1回のスキャンで返す最大データサイズ(DynamoDBの1MBの上限を模倣する)
+MAX_PAGE_BYTES = 1024 * 1024
+# BatchWriteItem／BatchGetItem／TransactWriteItemsで一度に処理できる最大件数
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_GET_MAX_KEYS = 100
+TRANSACT_WRITE_MAX_ITEMS = 100
+
+# 式の字句
+_TOKEN_PATTERN = re.compile(r"\s*(<>|<=|>=|[=<>(),.+\-]|[#:]?\w+)")
+_CONDITION_FUNCTIONS = ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains')
+# 対応するクエリのキー条件式(パーティションキーの等価条件)
+_KEY_CONDITION_PATTERN = re.compile(r"^\s*(?P<name>#?\w+)\s*=\s*(?P<value>:\w+)\s*$")
+
+Path = Tuple[str, ...]
+Getter = Callable[[dict], Optional[dict]]
+Condition = Callable[[dict], bool]
+
+
+class InMemoryDynamoDB:
+    """DynamoDBの低レベルクライアントのインメモリ実装
+    パーティションキーのみのテーブルを扱い、テーブルは初回アクセス時に作成する
+    全操作を1つのロックで直列化するため、複数スレッドから同時に呼び出せる
+    """
+
+    def __init__(self, key_name: str = 'user_id', latency: float = 0.0,
+                 indexes: Optional[Dict[str, Tuple[str, str]]] = None) -> None:
+        """
+        Args:
+            key_name: パーティションキーの属性名
+            latency: API呼び出し毎に模倣する通信時間の秒数
+            indexes: インデックス名毎の(パーティションキー, ソートキー)の属性名(全テーブル共通)
+        """
+        self.key_name = key_name
+        self.latency = latency
+        self.indexes = indexes or {}
+        # 操作名毎の呼び出し回数
+        self.calls: Counter = Counter()
+        self._tables: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        # テーブル毎、セグメント数毎の(セグメント毎のキーの並び, キー毎の位置)
+        self._layouts: Dict[str, Dict[int, Tuple[List[List[str]], Dict[str, int]]]] = \
+            defaultdict(dict)
+        # テーブルとインデックス毎、パーティションキーの値毎のソートキーの値とキーの対応
+        self._index_entries: Dict[Tuple[str, str], Dict[object, Dict[object, str]]] = \
+            defaultdict(lambda: defaultdict(dict))
+        self._lock = threading.RLock()
+
+    def load_items(self, table_name: str, items: Iterable[dict]) -> None:
+        """属性値形式の項目群を呼び出し回数に数えずに登録する(計測前のデータ投入用)
+
+        Args:
+            table_name: テーブル名
+            items: 属性値形式の項目のイテラブル
+        """
+        with self._lock:
+            for item in items:
+                self._store(table_name, item)
+
+    def count_items(self, table_name: str) -> int:
+        """テーブルの項目数を取得する
+
+        Args:
+            table_name: テーブル名
+
+        Returns:
+            項目数
+        """
+        return len(self._tables[table_name])
+
+    def get_item(self, TableName: str, Key: dict, ProjectionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[dict] = None,
+                 ConsistentRead: bool = False) -> dict:
+        self._call('GetItem')
+        with self._lock:
+            item = self._tables[TableName].get(self._key(Key))
+            if item is None:
+                return {}
+            return {'Item': _project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def put_item(self, TableName: str, Item: dict, ConditionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[dict] = None,
+                 ExpressionAttributeValues: Optional[dict] = None) -> dict:
+        self._call('PutItem')
+        with self._lock:
+            old_item = self._tables[TableName].get(self._key(Item))
+            self._check_condition('PutItem', old_item, ConditionExpression,
+                                  ExpressionAttributeNames, ExpressionAttributeValues)
+            self._store(TableName, _copy_item(Item))
+        return {}
+
+    def update_item(self, TableName: str, Key: dict, UpdateExpression: str,
+                    ConditionExpression: Optional[str] = None,
+                    ExpressionAttributeNames: Optional[dict] = None,
+                    ExpressionAttributeValues: Optional[dict] = None,
+                    ReturnValues: str = 'NONE') -> dict:
+        self._call('UpdateItem')
+        actions = _ExpressionParser(
+            UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues
+        ).parse_update()
+        with self._lock:
+            old_item = self._tables[TableName].get(self._key(Key))
+            self._check_condition('UpdateItem', old_item, ConditionExpression,
+                                  ExpressionAttributeNames, ExpressionAttributeValues)
+            new_item = _copy_item(old_item or Key)
+            updated_names = set()
+            for action, path, operand in actions:
+                _apply_action(new_item, action, path, operand, old_item or {})
+                updated_names.add(path[0])
+            self._store(TableName, new_item)
+        return _return_values(ReturnValues, old_item, new_item, updated_names)
+
+    def delete_item(self, TableName: str, Key: dict, ConditionExpression: Optional[str] = None,
+                    ExpressionAttributeNames: Optional[dict] = None,
+                    ExpressionAttributeValues: Optional[dict] = None,
+                    ReturnValues: str = 'NONE') -> dict:
+        self._call('DeleteItem')
+        with self._lock:
+            self._check_condition('DeleteItem', self._tables[TableName].get(self._key(Key)),
+                                  ConditionExpression, ExpressionAttributeNames,
+                                  ExpressionAttributeValues)
+            old_item = self._remove(TableName, self._key(Key))
+        if ReturnValues == 'ALL_OLD' and old_item:
+            return {'Attributes': old_item}
+        return {}
+
+    def scan(self, TableName: str, ProjectionExpression: Optional[str] = None,
+             FilterExpression: Optional[str] = None,
+             ExpressionAttributeNames: Optional[dict] = None,
+             ExpressionAttributeValues: Optional[dict] = None,
+             Segment: int = 0, TotalSegments: int = 1, Limit: Optional[int] = None,
+             ExclusiveStartKey: Optional[dict] = None) -> dict:
+        self._call('Scan')
+        condition = _ExpressionParser(
+            FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues
+        ).parse_condition() if FilterExpression else None
+        with self._lock:
+            table = self._tables[TableName]
+            keys, positions = self._get_layout(TableName, TotalSegments)
+            keys = keys[Segment]
+            start = positions[self._key(ExclusiveStartKey)] + 1 if ExclusiveStartKey else 0
+            items = []
+            scanned = 0
+            page_bytes = 0
+            index = start
+            while index < len(keys):
+                item = table.get(keys[index])
+                index += 1
+                if item is None:
+                    continue
+                scanned += 1
+                page_bytes += _item_size(item)
+                if condition is None or condition(item):
+                    items.append(_project(item, ProjectionExpression, ExpressionAttributeNames))
+                if scanned == Limit or page_bytes >= MAX_PAGE_BYTES:
+                    break
+            response = {'Items': items, 'Count': len(items), 'ScannedCount': scanned}
+            if index < len(keys):
+                response['LastEvaluatedKey'] = {self.key_name: {'S': keys[index - 1]}}
+        return response
+
+    def batch_write_item(self, RequestItems: dict) -> dict:
+        self._call('BatchWriteItem')
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                _check_batch_size('BatchWriteItem', requests, BATCH_WRITE_MAX_ITEMS)
+                keys = [self._key(request['PutRequest']['Item'] if 'PutRequest' in request
+                                  else request['DeleteRequest']['Key'])
+                        for request in requests]
+                if len(set(keys)) < len(keys):
+                    raise _client_error('BatchWriteItem', 'ValidationException',
+                                        "同じキーの書き込み要求が含まれています。")
+                for request in requests:
+                    if 'PutRequest' in request:
+                        self._store(table_name, _copy_item(request['PutRequest']['Item']))
+                    else:
+                        self._remove(table_name, self._key(request['DeleteRequest']['Key']))
+        return {'UnprocessedItems': {}}
+
+    def batch_get_item(self, RequestItems: dict) -> dict:
+        self._call('BatchGetItem')
+        responses = {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                _check_batch_size('BatchGetItem', request['Keys'], BATCH_GET_MAX_KEYS)
+                table = self._tables[table_name]
+                responses[table_name] = [
+                    _project(table[key], request.get('ProjectionExpression'),
+                             request.get('ExpressionAttributeNames'))
+                    for key in map(self._key, request['Keys']) if key in table
+                ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def query(self, TableName: str, IndexName: str, KeyConditionExpression: str,
+              ExpressionAttributeNames: Optional[dict] = None,
+              ExpressionAttributeValues: Optional[dict] = None,
+              Limit: Optional[int] = None, ExclusiveStartKey: Optional[dict] = None) -> dict:
+        self._call('Query')
+        if IndexName not in self.indexes:
+            raise _client_error('Query', 'ValidationException',
+                                f"インデックスが定義されていません。 インデックス: {IndexName}")
+        hash_name, range_name = self.indexes[IndexName]
+        match = _KEY_CONDITION_PATTERN.match(KeyConditionExpression)
+        name = match and (ExpressionAttributeNames or {}).get(
+            match.group('name'), match.group('name'))
+        if name != hash_name:
+            raise _validation_error(
+                f"対応していないキー条件式です。 式: {KeyConditionExpression}")
+        hash_value = _normalize((ExpressionAttributeValues or {})[match.group('value')])
+        with self._lock:
+            entries = self._index_entries[(TableName, IndexName)].get(hash_value, {})
+            range_values = sorted(entries)
+            if ExclusiveStartKey:
+                start = _normalize(ExclusiveStartKey[range_name])
+                range_values = [value for value in range_values if value > start]
+            page = range_values[:Limit] if Limit else range_values
+            table = self._tables[TableName]
+            items = [{key: _copy_value(table[entries[value]][key])
+                      for key in (self.key_name, hash_name, range_name)}
+                     for value in page]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}
+        if len(page) < len(range_values):
+            response['LastEvaluatedKey'] = dict(items[-1])
+        return response
+
+    def transact_write_items(self, TransactItems: List[dict]) -> dict:
+        self._call('TransactWriteItems')
+        _check_batch_size('TransactWriteItems', TransactItems, TRANSACT_WRITE_MAX_ITEMS)
+        with self._lock:
+            # 全ての条件式を評価してから書き込み、1件でも満たさない場合は何も書き込まない
+            reasons = []
+            for transact_item in TransactItems:
+                (operation, request), = transact_item.items()
+                key = self._key(request.get('Key') or request['Item'])
+                try:
+                    self._check_condition(
+                        operation, self._tables[request['TableName']].get(key),
+                        request.get('ConditionExpression'),
+                        request.get('ExpressionAttributeNames'),
+                        request.get('ExpressionAttributeValues'))
+                except ClientError:
+                    reasons.append({'Code': 'ConditionalCheckFailed',
+                                    'Message': "The conditional request failed"})
+                else:
+                    reasons.append({'Code': 'None'})
+            if any(reason['Code'] != 'None' for reason in reasons):
+                raise ClientError({
+                    'Error': {'Code': 'TransactionCanceledException',
+                              'Message': "Transaction cancelled"},
+                    'CancellationReasons': reasons
+                }, 'TransactWriteItems')
+            for transact_item in TransactItems:
+                (operation, request), = transact_item.items()
+                if operation == 'Put':
+                    self._store(request['TableName'], _copy_item(request['Item']))
+                elif operation == 'Delete':
+                    self._remove(request['TableName'], self._key(request['Key']))
+                elif operation == 'Update':
+                    old_item = self._tables[request['TableName']].get(self._key(request['Key']))
+                    new_item = _copy_item(old_item or request['Key'])
+                    for action, path, operand in _ExpressionParser(
+                            request['UpdateExpression'],
+                            request.get('ExpressionAttributeNames'),
+                            request.get('ExpressionAttributeValues')).parse_update():
+                        _apply_action(new_item, action, path, operand, old_item or {})
+                    self._store(request['TableName'], new_item)
+        return {}
+
+    def _call(self, operation: str) -> None:
+        """呼び出し回数を数え、通信時間を模倣する"""
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _key(self, item: dict) -> str:
+        """項目のパーティションキーの値を取得する"""
+        return item[self.key_name]['S']
+
+    def _store(self, table_name: str, item: dict) -> None:
+        """項目を登録し、新しいキーであればスキャン用の並びの末尾に追加する"""
+        key = self._key(item)
+        table = self._tables[table_name]
+        old_item = table.get(key)
+        if old_item is not None:
+            self._update_indexes(table_name, key, old_item, remove=True)
+        table[key] = item
+        self._update_indexes(table_name, key, item, remove=False)
+        for total_segments, (keys, positions) in self._layouts[table_name].items():
+            if key not in positions:
+                segment_keys = keys[_segment_of(key, total_segments)]
+                positions[key] = len(segment_keys)
+                segment_keys.append(key)
+
+    def _remove(self, table_name: str, key: str) -> Optional[dict]:
+        """項目を削除する(スキャン用の並びには残す)"""
+        old_item = self._tables[table_name].pop(key, None)
+        if old_item is not None:
+            self._update_indexes(table_name, key, old_item, remove=True)
+        return old_item
+
+    def _update_indexes(self, table_name: str, key: str, item: dict, remove: bool) -> None:
+        """インデックスのキーとなる属性を持つ項目を、インデックスに追加／削除する"""
+        for index_name, (hash_name, range_name) in self.indexes.items():
+            if hash_name not in item or range_name not in item:
+                continue
+            entries = self._index_entries[(table_name, index_name)][_normalize(item[hash_name])]
+            range_value = _normalize(item[range_name])
+            if remove:
+                entries.pop(range_value, None)
+            else:
+                entries[range_value] = key
+
+    def _get_layout(self, table_name: str,
+                    total_segments: int) -> Tuple[List[List[str]], Dict[str, int]]:
+        """セグメント毎のキーの並びを取得する(初回のみ作成する)
+        削除したキーは並びに残し、スキャン時に読み飛ばす
+        """
+        layouts = self._layouts[table_name]
+        if total_segments not in layouts:
+            keys = [[] for _ in range(total_segments)]
+            positions = {}
+            for key in self._tables[table_name]:
+                segment_keys = keys[_segment_of(key, total_segments)]
+                positions[key] = len(segment_keys)
+                segment_keys.append(key)
+            layouts[total_segments] = (keys, positions)
+        return layouts[total_segments]
+
+    def _check_condition(self, operation: str, item: Optional[dict],
+                         expression: Optional[str], names: Optional[dict],
+                         values: Optional[dict]) -> None:
+        """条件式を評価し、満たさない場合は条件付き更新の失敗として例外を送出する"""
+        if not expression:
+            return
+        condition = _ExpressionParser(expression, names, values).parse_condition()
+        if not condition(item or {}):
+            raise _client_error(operation, 'ConditionalCheckFailedException',
+                                "The conditional request failed")
+
+
+class _ExpressionParser:
+    """条件式／フィルタ式／更新式の構文解析クラス
+    解析結果は項目を引数に取る関数として返す
+    """
+
+    def __init__(self, expression: str, names: Optional[dict],
+                 values: Optional[dict]) -> None:
+        self._tokens = _TOKEN_PATTERN.findall(expression)
+        if "".join(self._tokens) != re.sub(r"\s+", "", expression):
+            raise _validation_error(f"式を解析できません。 式: {expression}")
+        self._position = 0
+        self._names = names or {}
+        self._values = values or {}
+
+    def parse_condition(self) -> Condition:
+        condition = self._parse_or()
+        self._expect_end()
+        return condition
+
+    def parse_update(self) -> List[Tuple[str, Path, Optional[Getter]]]:
+        actions = []
+        while self._peek() is not None:
+            action = self._next().upper()
+            while True:
+                path = self._parse_path()
+                if action == 'SET':
+                    self._expect('=')
+                    operand = self._parse_set_value()
+                elif action in ('ADD', 'DELETE'):
+                    operand = self._parse_operand()
+                elif action == 'REMOVE':
+                    operand = None
+                else:
+                    raise _validation_error(f"対応していない更新式です。 アクション: {action}")
+                actions.append((action, path, operand))
+                if not self._accept(','):
+                    break
+        return actions
+
+    def _parse_or(self) -> Condition:
+        left = self._parse_and()
+        while self._accept_keyword('OR'):
+            left = _either(left, self._parse_and())
+        return left
+
+    def _parse_and(self) -> Condition:
+        left = self._parse_not()
+        while self._accept_keyword('AND'):
+            left = _both(left, self._parse_not())
+        return left
+
+    def _parse_not(self) -> Condition:
+        if self._accept_keyword('NOT'):
+            inner = self._parse_not()
+            return lambda item: not inner(item)
+        if self._accept('('):
+            condition = self._parse_or()
+            self._expect(')')
+            return condition
+        if self._peek() in _CONDITION_FUNCTIONS:
+            return self._parse_function()
+        left = self._parse_operand()
+        operator = self._next()
+        if operator not in _COMPARATORS:
+            raise _validation_error(f"対応していない比較演算子です。 演算子: {operator}")
+        right = self._parse_operand()
+        compare = _COMPARATORS[operator]
+        return lambda item: compare(left(item), right(item))
+
+    def _parse_function(self) -> Condition:
+        function = self._next()
+        self._expect('(')
+        path = self._parse_path()
+        operand = self._parse_operand() if self._accept(',') else None
+        self._expect(')')
+        if function == 'attribute_exists':
+            return lambda item: _get_path(item, path) is not None
+        if function == 'attribute_not_exists':
+            return lambda item: _get_path(item, path) is None
+        if function == 'begins_with':
+            return lambda item: _begins_with(_get_path(item, path), operand(item))
+        return lambda item: _contains(_get_path(item, path), operand(item))
+
+    def _parse_set_value(self) -> Getter:
+        if self._peek() == 'if_not_exists':
+            self._next()
+            self._expect('(')
+            path = self._parse_path()
+            self._expect(',')
+            default = self._parse_operand()
+            self._expect(')')
+            operand = lambda item: _get_path(item, path) or default(item)  # noqa: E731
+        else:
+            operand = self._parse_operand()
+        if self._peek() in ('+', '-'):
+            sign = 1 if self._next() == '+' else -1
+            right = self._parse_operand()
+            left = operand
+            return lambda item: {'N': str(
+                Decimal(left(item)['N']) + sign * Decimal(right(item)['N']))}
+        return operand
+
+    def _parse_operand(self) -> Getter:
+        token = self._peek()
+        if token is not None and token.startswith(':'):
+            self._next()
+            if token not in self._values:
+                raise _validation_error(f"式の属性値が定義されていません。 属性値: {token}")
+            value = self._values[token]
+            return lambda item: value
+        path = self._parse_path()
+        return lambda item: _get_path(item, path)
+
+    def _parse_path(self) -> Path:
+        names = [self._parse_name()]
+        while self._accept('.'):
+            names.append(self._parse_name())
+        return tuple(names)
+
+    def _parse_name(self) -> str:
+        token = self._next()
+        if token.startswith('#'):
+            if token not in self._names:
+                raise _validation_error(f"式の属性名が定義されていません。 属性名: {token}")
+            return self._names[token]
+        if not re.fullmatch(r"\w+", token):
+            raise _validation_error(f"属性名ではありません。 字句: {token}")
+        return token
+
+    def _peek(self) -> Optional[str]:
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise _validation_error("式が途中で終了しています。")
+        self._position += 1
+        return token
+
+    def _accept(self, token: str) -> bool:
+        if self._peek() == token:
+            self._position += 1
+            return True
+        return False
+
+    def _accept_keyword(self, keyword: str) -> bool:
+        token = self._peek()
+        if token is not None and token.upper() == keyword:
+            self._position += 1
+            return True
+        return False
+
+    def _expect(self, token: str) -> None:
+        if not self._accept(token):
+            raise _validation_error(f"「{token}」が必要です。 字句: {self._peek()}")
+
+    def _expect_end(self) -> None:
+        if self._peek() is not None:
+            raise _validation_error(f"式の末尾に解析できない字句があります。 字句: {self._peek()}")
+
+
+def _either(left: Condition, right: Condition) -> Condition:
+    return lambda item: left(item) or right(item)
+
+
+def _both(left: Condition, right: Condition) -> Condition:
+    return lambda item: left(item) and right(item)
+
+
+def _normalize(value: dict) -> Tuple[str, object]:
+    """属性値を比較可能な(型, 値)に変換する"""
+    (attribute_type, attribute_value), = value.items()
+    if attribute_type == 'N':
+        return attribute_type, Decimal(attribute_value)
+    if attribute_type == 'NS':
+        return attribute_type, frozenset(Decimal(element) for element in attribute_value)
+    if attribute_type in ('SS', 'BS'):
+        return attribute_type, frozenset(attribute_value)
+    if attribute_type == 'L':
+        return attribute_type, [_normalize(element) for element in attribute_value]
+    if attribute_type == 'M':
+        return attribute_type, {key: _normalize(element)
+                                for key, element in attribute_value.items()}
+    return attribute_type, attribute_value
+
+
+def _compare(predicate: Callable[[object, object], bool],
+             ordered: bool) -> Callable[[Optional[dict], Optional[dict]], bool]:
+    """属性値の比較関数を作成する(存在しない属性や型の異なる属性との比較は偽とする)"""
+    def _apply(left: Optional[dict], right: Optional[dict]) -> bool:
+        if left is None or right is None:
+            return False
+        left_type, left_value = _normalize(left)
+        right_type, right_value = _normalize(right)
+        if left_type != right_type:
+            return False
+        if ordered and left_type not in ('N', 'S', 'B'):
+            return False
+        return predicate(left_value, right_value)
+
+    return _apply
+
+
+def _not_equals(left: Optional[dict], right: Optional[dict]) -> bool:
+    if left is None or right is None:
+        return left is not right
+    return _normalize(left) != _normalize(right)
+
+
+_COMPARATORS = {
+    '=': _compare(lambda left, right: left == right, ordered=False),
+    '<>': _not_equals,
+    '<': _compare(lambda left, right: left < right, ordered=True),
+    '<=': _compare(lambda left, right: left <= right, ordered=True),
+    '>': _compare(lambda left, right: left > right, ordered=True),
+    '>=': _compare(lambda left, right: left >= right, ordered=True),
+}
+
+
+def _begins_with(value: Optional[dict], prefix: dict) -> bool:
+    return value is not None and 'S' in value and value['S'].startswith(prefix['S'])
+
+
+def _contains(value: Optional[dict], operand: dict) -> bool:
+    if value is None:
+        return False
+    (attribute_type, attribute_value), = value.items()
+    if attribute_type == 'S':
+        return 'S' in operand and operand['S'] in attribute_value
+    if attribute_type == 'L':
+        target = _normalize(operand)
+        return any(_normalize(element) == target for element in attribute_value)
+    if attribute_type in ('SS', 'NS', 'BS'):
+        return _normalize(operand)[1] in _normalize(value)[1]
+    return False
+
+
+def _get_path(item: dict, path: Path) -> Optional[dict]:
+    """文書パスの属性値を取得する(存在しない場合はNone)"""
+    value = item.get(path[0])
+    for name in path[1:]:
+        if value is None or 'M' not in value:
+            return None
+        value = value['M'].get(name)
+    return value
+
+
+def _get_parent(item: dict, path: Path) -> dict:
+    """文書パスの親のマップを取得する
+
+    Raises:
+        ClientError: 親のマップが存在しない
+    """
+    parent = item
+    for name in path[:-1]:
+        value = parent.get(name)
+        if value is None or 'M' not in value:
+            raise _validation_error(
+                "The document path provided in the update expression is invalid for update")
+        parent = value['M']
+    return parent
+
+
+def _apply_action(item: dict, action: str, path: Path, operand: Optional[Getter],
+                  old_item: dict) -> None:
+    """更新式の1アクションを項目に適用する(値は更新前の項目から評価する)"""
+    parent = _get_parent(item, path)
+    name = path[-1]
+    if action == 'SET':
+        parent[name] = _copy_value(operand(old_item))
+    elif action == 'REMOVE':
+        parent.pop(name, None)
+    elif action == 'ADD':
+        value = operand(old_item)
+        current = parent.get(name)
+        if current is None:
+            parent[name] = _copy_value(value)
+        elif 'N' in value:
+            parent[name] = {'N': str(Decimal(current['N']) + Decimal(value['N']))}
+        else:
+            (set_type, elements), = value.items()
+            parent[name] = {set_type: list(dict.fromkeys(current[set_type] + elements))}
+    else:
+        current = parent.get(name)
+        if current is None:
+            return
+        (set_type, elements), = operand(old_item).items()
+        removed = set(elements)
+        remaining = [element for element in current[set_type] if element not in removed]
+        if remaining:
+            parent[name] = {set_type: remaining}
+        else:
+            parent.pop(name)
+
+
+def _return_values(return_values: str, old_item: Optional[dict], new_item: dict,
+                   updated_names: set) -> dict:
+    """更新結果のAttributesを作成する
+    UPDATED_OLD／UPDATED_NEWは更新したトップレベルの属性全体を返す
+    """
+    if return_values == 'ALL_OLD':
+        attributes = old_item or {}
+    elif return_values == 'ALL_NEW':
+        attributes = new_item
+    elif return_values == 'UPDATED_OLD':
+        attributes = {name: value for name, value in (old_item or {}).items()
+                      if name in updated_names}
+    elif return_values == 'UPDATED_NEW':
+        attributes = {name: value for name, value in new_item.items()
+                      if name in updated_names}
+    else:
+        return {}
+    return {'Attributes': _copy_item(attributes)} if attributes else {}
+
+
+def _project(item: dict, expression: Optional[str], names: Optional[dict]) -> dict:
+    """射影式に含まれるトップレベルの属性のみを複製する"""
+    if not expression:
+        return _copy_item(item)
+    projected = {}
+    for path in expression.split(','):
+        name = path.strip()
+        name = (names or {}).get(name, name)
+        if name in item:
+            projected[name] = _copy_value(item[name])
+    return projected
+
+
+def _copy_item(item: dict) -> dict:
+    return {name: _copy_value(value) for name, value in item.items()}
+
+
+def _copy_value(value: dict) -> dict:
+    """属性値を複製する(呼び出し元が変更しても保持している項目に影響しないようにする)"""
+    (attribute_type, attribute_value), = value.items()
+    if attribute_type == 'M':
+        return {'M': _copy_item(attribute_value)}
+    if attribute_type == 'L':
+        return {'L': [_copy_value(element) for element in attribute_value]}
+    if attribute_type in ('SS', 'NS', 'BS'):
+        return {attribute_type: list(attribute_value)}
+    return {attribute_type: attribute_value}
+
+
+def _item_size(item: dict) -> int:
+    """項目のおおよそのデータサイズ(バイト)を算出する"""
+    return sum(len(name) + _value_size(value) for name, value in item.items())
+
+
+def _value_size(value: dict) -> int:
+    (attribute_type, attribute_value), = value.items()
+    if attribute_type in ('S', 'B'):
+        return len(attribute_value)
+    if attribute_type == 'N':
+        return len(attribute_value) // 2 + 1
+    if attribute_type == 'M':
+        return 3 + _item_size(attribute_value)
+    if attribute_type == 'L':
+        return 3 + sum(_value_size(element) + 1 for element in attribute_value)
+    if attribute_type in ('SS', 'NS', 'BS'):
+        return sum(len(element) for element in attribute_value)
+    return 1
+
+
+def _segment_of(key: str, total_segments: int) -> int:
+    """キーが属する並列スキャンのセグメント番号を算出する"""
+    return zlib.crc32(key.encode('utf-8')) % total_segments
+
+
+def _check_batch_size(operation: str, requests: list, max_items: int) -> None:
+    if len(requests) > max_items:
+        raise _client_error(operation, 'ValidationException',
+                            f"一度に処理できる件数を超えています。 件数: {len(requests)}")
+
+
+def _validation_error(message: str) -> ClientError:
+    return _client_error('Expression', 'ValidationException', message)
+
+
+def _client_error(operation: str, code: str, message: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
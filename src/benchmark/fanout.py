@@ -0,0 +1,100 @@
+"""通知処理(一斉通知)の性能計測
+インメモリDynamoDBとスタブのLINE Messaging APIを使用して、ユーザ数毎の通知のスループットとピークメモリを計測する
+ピークメモリはtracemallocで計測するため、スループットを計測する実行とは別に実行する
+
+実行方法:
+    python -m benchmark.fanout --users 1000 10000 100000 1000000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from benchmark import offline
+
+from functions import notification
+
+# 定数群
+# 前回通知した鉄道遅延情報と、通知処理で取得する鉄道遅延情報のフィクスチャ
+NOTIFIED_FIXTURE = "delay_quiet"
+LATEST_FIXTURE = "delay_kansai"
+
+
+def prepare(environment: offline.OfflineEnvironment, users: int,
+            subscriber_ratio: float) -> None:
+    """通知対象のユーザと、通知が必要な鉄道遅延情報を用意する
+
+    Args:
+        environment: 計測環境
+        users: ユーザ数
+        subscriber_ratio: 運営会社を個別に購読するユーザの割合
+    """
+    environment.reset()
+    environment.seed_delay_info(NOTIFIED_FIXTURE)
+    environment.seed_users(users, subscriber_ratio)
+    environment.serve_delay_info(LATEST_FIXTURE)
+
+
+def run_notification() -> float:
+    """通知処理を実行する
+
+    Returns:
+        処理秒数
+    """
+    started = time.perf_counter()
+    notification.main({}, None)
+    return time.perf_counter() - started
+
+
+def measure_peak_memory() -> int:
+    """通知処理を実行し、実行中に確保したメモリのピークを計測する
+    計測は通知処理の直前から開始するため、データ投入済みのインメモリDynamoDBの使用量は含めない
+
+    Returns:
+        ピークメモリ(バイト)
+    """
+    tracemalloc.start()
+    try:
+        run_notification()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+',
+                        default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--subscriber-ratio', type=float, default=0.1)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--line-latency-ms', type=float, default=0.0)
+    parser.add_argument('--skip-memory', action='store_true')
+    args = parser.parse_args()
+
+    environment = offline.OfflineEnvironment(
+        args.dynamodb_latency_ms / 1000, args.line_latency_ms / 1000)
+    print(f"個別購読の割合: {args.subscriber_ratio}, "
+          f"通信時間: DynamoDB {args.dynamodb_latency_ms}ms / LINE {args.line_latency_ms}ms")
+    print(f"{'ユーザ数':>10} {'通知数':>10} {'処理秒数':>10} {'通知/秒':>10} "
+          f"{'ピーク[MB]':>10} {'DynamoDB':>10} {'LINE API':>10}")
+    try:
+        for users in args.users:
+            prepare(environment, users, args.subscriber_ratio)
+            elapsed = run_notification()
+            recipients = environment.stub.recipients
+            dynamodb_calls = environment.dynamodb_calls()
+            line_requests = environment.line_requests()
+            peak = "-"
+            if not args.skip_memory:
+                prepare(environment, users, args.subscriber_ratio)
+                peak = f"{measure_peak_memory() / 1024 / 1024:10.1f}"
+            print(f"{users:>10} {recipients:>10} {elapsed:10.2f} "
+                  f"{recipients / elapsed:10.0f} {peak:>10} "
+                  f"{dynamodb_calls:>10} {line_requests:>10}")
+    finally:
+        environment.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""鉄道遅延情報メッセージ作成処理の性能計測
+
+実行方法:
+    python -m benchmark.generate_messages --entries 10000 20000 50000
+"""
+
+import argparse
+import random
+import timeit
+
+from benchmark import env
+
+env.setup()
+
+import railway  # noqa: E402
+
+# 全国の遅延情報を模した路線名群
+OTHER_COMPANIES = ["JR東日本", "東京メトロ", "名古屋鉄道", "西日本鉄道", "近畿日本鉄道"]
+TARGET_LINES = [
+    ("JR西日本", "ＪＲ神戸線"),
+    ("JR西日本", "JR東西線"),
+    ("阪急電鉄", "神戸本線"),
+    ("阪神電気鉄道", "阪神本線"),
+]
+
+
+def create_delay_info_list(entries: int, target_ratio: float = 0.01) -> list:
+    """性能計測用の鉄道遅延情報リストを作成する
+
+    Args:
+        entries: 件数
+        target_ratio: 通知対象の路線の割合
+
+    Returns:
+        鉄道遅延情報リスト
+    """
+    rnd = random.Random(entries)
+    delay_info_list = []
+    for index in range(entries):
+        if rnd.random() < target_ratio:
+            company, name = rnd.choice(TARGET_LINES)
+        else:
+            company = rnd.choice(OTHER_COMPANIES)
+            name = f"路線{index}"
+        delay_info_list.append({
+            'name': name,
+            'company': company,
+            'lastupdate_gmt': 1640000000,
+            'source': "鉄道com RSS",
+        })
+    return delay_info_list
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+',
+                        default=[10000, 50000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        delay_info_list = create_delay_info_list(entries)
+        timings = timeit.repeat(
+            lambda: railway.delay_info._generate_delay_info_messages(
+                delay_info_list),
+            number=1, repeat=args.repeat)
+        best = min(timings)
+        print(f"件数: {entries:>8}, 最速: {best * 1000:8.2f}ms, "
+              f"1件あたり: {best / entries * 1e6:6.3f}µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""モデルの生成・変換処理の性能計測
+__slots__ベースのモデルと、従来のpydanticベースのモデルを比較する(pydanticが未インストールの場合は省略)
+
+実行方法:
+    python -m benchmark.models --users 100000
+"""
+
+import argparse
+import time
+from decimal import Decimal
+from typing import Callable, List
+
+from benchmark import env
+
+env.setup()
+
+from aws.dynamodb.delay_info import ALL  # noqa: E402
+from aws.dynamodb.users import User  # noqa: E402
+
+try:
+    from pydantic import BaseModel
+except ImportError:
+    BaseModel = None
+
+
+def create_items(users: int) -> List[dict]:
+    """DynamoDBから取得したユーザ情報を模したデータを作成する
+
+    Args:
+        users: ユーザ数
+
+    Returns:
+        ユーザ情報のデータリスト
+    """
+    timestamp = Decimal("1640000000.123456")
+    return [
+        {
+            'user_id': f"U{index:032x}",
+            'created_time': timestamp,
+            'updated_time': timestamp,
+            'companies': [Decimal(ALL)],
+        }
+        for index in range(users)
+    ]
+
+
+def measure(label: str, func: Callable[[], object]) -> None:
+    """処理時間を計測して出力する
+
+    Args:
+        label: 計測対象名
+        func: 計測対象の処理
+    """
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:10.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    args = parser.parse_args()
+
+    items = create_items(args.users)
+    print(f"ユーザ数: {args.users}")
+
+    users = [User.from_dict(item) for item in items]
+    measure("slots: from_dict", lambda: [User.from_dict(item) for item in items])
+    measure("slots: from_dict(validate=True)",
+            lambda: [User.from_dict(item, validate=True) for item in items])
+    measure("slots: to_dict", lambda: [user.to_dict() for user in users])
+    measure("slots: to_json_string", lambda: [user.to_json_string() for user in users])
+
+    if BaseModel is None:
+        print("pydanticが未インストールのため、従来のモデルとの比較を省略します。")
+        return
+
+    class PydanticUser(BaseModel):
+        user_id: str
+        created_time: Decimal
+        updated_time: Decimal
+        companies: List[int] = [ALL]
+
+    pydantic_users = [PydanticUser.parse_obj(item) for item in items]
+    measure("pydantic: parse_obj", lambda: [PydanticUser.parse_obj(item) for item in items])
+    measure("pydantic: dict", lambda: [user.dict() for user in pydantic_users])
+    measure("pydantic: json", lambda: [user.json(ensure_ascii=False) for user in pydantic_users])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""AWSやLINEに接続せずにLambda関数を実行するための計測環境
+インメモリDynamoDBとスタブサーバを起動し、src/main配下のモジュールの接続先を差し替える
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import uuid
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional
+
+from benchmark import env
+
+env.setup()
+# 計測対象の処理時間にレート制限の待機時間を含めないようにする
+os.environ.setdefault('LINE_API_RATE_LIMIT', '1000000')
+os.environ.setdefault('NOTIFICATION_DISPATCHER', 'local')
+
+from loguru import logger  # noqa: E402
+
+import railway  # noqa: E402
+from aws.dynamodb import attributes, users_table, utils  # noqa: E402
+from aws.dynamodb.delay_info import ALL, COMPANY_TYPES, DelayInfo  # noqa: E402
+from aws.dynamodb.notification_run import NotificationRun  # noqa: E402
+from benchmark.fake_dynamodb import InMemoryDynamoDB  # noqa: E402
+from benchmark.stub_server import DELAY_PATH, StubServer, load_fixture  # noqa: E402
+from utils import metrics  # noqa: E402
+
+# 定数群
+# 鉄道遅延情報の登録日時(再取得が必要な古い日時にする)
+STALE_TIMESTAMP = Decimal(1600000000)
+# users_tableのグローバルセカンダリインデックス(config/serverless.ymlの定義に合わせる)
+INDEXES = {users_table.SUBSCRIBERS_INDEX_NAME: ('subscribed_company', 'subscriber_id')}
+
+
+class OfflineEnvironment:
+    """インメモリDynamoDBとスタブサーバを使用する計測環境
+    呼び出し毎のメトリクスは標準出力に出力せず、直近の呼び出し分を保持する
+    """
+
+    def __init__(self, dynamodb_latency: float = 0.0, line_latency: float = 0.0) -> None:
+        """
+        Args:
+            dynamodb_latency: DynamoDBのAPI呼び出し毎に模倣する通信時間の秒数
+            line_latency: LINE Messaging APIのリクエスト毎に模倣する処理時間の秒数
+        """
+        self.dynamodb_latency = dynamodb_latency
+        self.dynamodb = InMemoryDynamoDB(latency=dynamodb_latency, indexes=INDEXES)
+        self.stub = StubServer(latency=line_latency).start()
+        self.last_metrics: Optional[dict] = None
+        os.environ['LINE_API_ENDPOINT'] = self.stub.url
+        railway.delay_info.DELAY_URL = f"{self.stub.url}{DELAY_PATH}"
+        utils.get_client = lambda: self.dynamodb
+        metrics.emit = self._keep_metrics
+        # ログは書式化まで行い、出力は破棄する
+        logger.remove()
+        logger.add(lambda message: None)
+
+    def reset(self) -> None:
+        """DynamoDBの内容、スタブの集計、コンテナ内キャッシュを初期化する"""
+        self.dynamodb = InMemoryDynamoDB(latency=self.dynamodb_latency, indexes=INDEXES)
+        self.stub.reset()
+        users_table.delay_info_cache.invalidate()
+
+    def close(self) -> None:
+        self.stub.stop()
+
+    def seed_delay_info(self, fixture: str, updated_time: Decimal = STALE_TIMESTAMP) -> None:
+        """記録済みの鉄道遅延情報リストから作成した鉄道遅延情報を登録する
+
+        Args:
+            fixture: フィクスチャ名
+            updated_time: 登録日時
+        """
+        self.seed_delay_info_list(json.loads(load_fixture(fixture)), updated_time)
+
+    def seed_delay_info_list(self, delay_info_list: list,
+                             updated_time: Decimal = STALE_TIMESTAMP) -> None:
+        """鉄道遅延情報リストから作成した鉄道遅延情報を登録する
+
+        Args:
+            delay_info_list: 鉄道遅延情報リスト
+            updated_time: 登録日時
+        """
+        messages = railway.delay_info._generate_delay_info_messages(delay_info_list)
+        delay_info = DelayInfo(
+            user_id='railway', messages=messages, updated_time=updated_time)
+        self.dynamodb.load_items(
+            users_table.USERS_TABLE_NAME, [attributes.encode_item(delay_info.to_dict())])
+
+    def seed_notification_run(self, delay_info_list: list) -> None:
+        """鉄道遅延情報リストを通知済みとする、完了済みの通知処理の実行記録を登録する
+
+        Args:
+            delay_info_list: 鉄道遅延情報リスト
+        """
+        run = NotificationRun(
+            user_id=users_table.NOTIFICATION_RUN_ID,
+            run_id=str(uuid.uuid4()),
+            messages=railway.delay_info._generate_delay_info_messages(delay_info_list),
+            completed=True,
+            started_time=STALE_TIMESTAMP,
+            updated_time=STALE_TIMESTAMP
+        )
+        self.dynamodb.load_items(
+            users_table.USERS_TABLE_NAME, [attributes.encode_item(run.to_dict())])
+
+    def seed_users(self, users: int, subscriber_ratio: float = 0.1) -> None:
+        """ユーザ情報と購読情報を登録する
+        subscriber_ratioの割合のユーザは運営会社を1つずつ個別に購読し、残りは全運営会社を通知対象とする
+
+        Args:
+            users: ユーザ数
+            subscriber_ratio: 運営会社を個別に購読するユーザの割合
+        """
+        subscriptions = []
+        stride = round(1 / subscriber_ratio) if subscriber_ratio else 0
+        # 項目数が多いため、同じ値の属性値は項目間で共有してメモリ使用量を抑える
+        timestamp = attributes.encode_value(STALE_TIMESTAMP)
+        all_companies = attributes.encode_value([ALL])
+
+        def _items() -> Iterator[dict]:
+            for index in range(users):
+                user_id = create_user_id(index)
+                item = {'user_id': {'S': user_id}, 'created_time': timestamp,
+                        'updated_time': timestamp}
+                if stride and index % stride == 0:
+                    company_type = COMPANY_TYPES[(index // stride) % len(COMPANY_TYPES)]
+                    subscriptions.append(attributes.encode_item(
+                        users_table.create_subscription_item(company_type, user_id)))
+                    item['companies'] = attributes.encode_value([company_type])
+                else:
+                    item['companies'] = all_companies
+                yield item
+
+        self.dynamodb.load_items(users_table.USERS_TABLE_NAME, _items())
+        self.dynamodb.load_items(users_table.USERS_TABLE_NAME, subscriptions)
+
+    def seed_user_ids(self, user_ids: Iterable[str]) -> None:
+        """全運営会社を通知対象とするユーザとしてユーザ情報を登録する
+
+        Args:
+            user_ids: ユーザIDのイテラブル
+        """
+        timestamp = attributes.encode_value(STALE_TIMESTAMP)
+        self.dynamodb.load_items(users_table.USERS_TABLE_NAME, (
+            {'user_id': {'S': user_id}, 'created_time': timestamp,
+             'updated_time': timestamp}
+            for user_id in user_ids))
+
+    def serve_delay_info(self, fixture: str) -> None:
+        """取得先が返す鉄道遅延情報リストを記録済みのフィクスチャに切り替える
+
+        Args:
+            fixture: フィクスチャ名
+        """
+        self.stub.set_delay_info(load_fixture(fixture))
+
+    def dynamodb_calls(self) -> int:
+        return sum(self.dynamodb.calls.values())
+
+    def line_requests(self, paths: Optional[List[str]] = None) -> int:
+        return sum(count for path, count in self.stub.requests.items()
+                   if path != DELAY_PATH and (paths is None or path in paths))
+
+    def _keep_metrics(self, recorder: metrics.Recorder) -> None:
+        self.last_metrics = recorder.snapshot()
+
+
+def create_webhook_request(body: str) -> dict:
+    """Webhookのリクエストボディから、ダミーのチャネルシークレットで署名したLambdaのリクエストイベントを作成する
+
+    Args:
+        body: リクエストボディ
+
+    Returns:
+        リクエストイベント
+    """
+    signature = base64.b64encode(hmac.new(
+        os.environ['LINE_CHANNEL_SECRET'].encode('utf-8'),
+        body.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+    return {'headers': {'x-line-signature': signature}, 'body': body}
+
+
+def create_user_id(index: int) -> str:
+    """LINEのユーザIDの形式を模したユーザIDを作成する
+
+    Args:
+        index: 連番
+
+    Returns:
+        ユーザID
+    """
+    return f"U{index:032x}"
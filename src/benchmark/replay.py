@@ -0,0 +1,247 @@
+"""記録したトレースの再生による負荷計測
+TRACE_RECORDING=1で記録したWebhookイベントと鉄道遅延情報リストの取得結果を、
+インメモリDynamoDBとスタブサーバに対して記録時の間隔を倍速で縮めて再生し、
+スループット、キャッシュのヒット率、取得先への呼び出し回数を出力する
+コンテナ1つ分を模倣するため、イベントは1件ずつ順に処理し、処理が予定時刻に間に合わない場合は遅れとして集計する
+
+トレースの抽出例:
+    aws logs filter-log-events --log-group-name /aws/lambda/linebot-reply \\
+        --filter-pattern '"_trace"' --query 'events[].message' --output text > trace.log
+
+実行方法:
+    python -m benchmark.replay --trace trace.log --speeds 1 10 100
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from benchmark import offline
+from benchmark.stub_server import DELAY_PATH
+
+from aws.dynamodb import delay_info, users_table
+from aws.dynamodb.cache import DelayInfoCache
+from functions import notification, reply
+from utils import trace
+
+# 定数群
+# 鉄道遅延情報の鮮度の有効秒数と、応答後に再取得する最大経過秒数(倍速に合わせて縮める前の値)
+ORIGINAL_TTL = delay_info.TEN_MINUTES
+ORIGINAL_MAX_STALENESS = reply.MAX_STALENESS_SECONDS
+# 通知処理の定期実行の間隔秒数(serverless.ymlのスケジュールに合わせる)
+NOTIFICATION_INTERVAL = 15 * 60
+# 再生するトレースレコードの種類(トレースレコードの種類に加えて通知処理の定期実行を扱う)
+KIND_NOTIFICATION = 'notification'
+# 鉄道遅延情報キャッシュのヒット数とミス数のメトリクス名
+CACHE_HITS_METRIC = 'aws.dynamodb.users_table.delay_info_cache.hits'
+CACHE_MISSES_METRIC = 'aws.dynamodb.users_table.delay_info_cache.misses'
+
+
+class ReplayResult(NamedTuple):
+    """1回の再生の集計結果"""
+
+    events: int
+    elapsed_seconds: float
+    max_lag_seconds: float
+    cache_hits: int
+    cache_misses: int
+    delay_requests: int
+    not_modified: int
+    dynamodb_calls: int
+    line_requests: int
+
+
+def read_trace(paths: Iterable[str]) -> List[dict]:
+    """ログからトレースレコードを抽出し、時刻順に並べる
+    行の途中から始まるトレースレコードも抽出する(ログの出力先が行頭に情報を付ける場合)
+
+    Args:
+        paths: ログファイルのパスのイテラブル
+
+    Returns:
+        トレースレコードのリスト
+    """
+    decoder = json.JSONDecoder()
+    marker = '{"' + trace.TRACE_KEY + '"'
+    entries = []
+    for path in paths:
+        with open(path, encoding='utf-8') as trace_file:
+            for line in trace_file:
+                start = line.find(marker)
+                if start < 0:
+                    continue
+                entry, _ = decoder.raw_decode(line, start)
+                entries.append(entry)
+    return sorted(entries, key=lambda entry: entry['time'])
+
+
+def create_timeline(entries: List[dict],
+                    notification_interval: float) -> List[Tuple[float, str, Optional[dict]]]:
+    """トレースレコードと通知処理の定期実行を、記録開始からの経過秒数順に並べる
+
+    Args:
+        entries: 時刻順のトレースレコードのリスト
+        notification_interval: 通知処理の実行間隔秒数(0の場合は実行しない)
+
+    Returns:
+        (経過秒数, 種類, トレースレコード)のリスト
+    """
+    started = entries[0]['time']
+    timeline = [(entry['time'] - started, entry[trace.TRACE_KEY], entry)
+                for entry in entries]
+    if notification_interval > 0:
+        duration = entries[-1]['time'] - started
+        timeline.extend(
+            (index * notification_interval, KIND_NOTIFICATION, None)
+            for index in range(1, int(duration // notification_interval) + 1))
+    return sorted(timeline, key=lambda item: item[0])
+
+
+def create_replay_body(body: dict) -> str:
+    """再生用のリクエストボディを作成する
+    再送と判定されないよう、WebhookイベントIDは再生毎に振り直す
+
+    Args:
+        body: 記録したリクエストボディ
+
+    Returns:
+        リクエストボディ
+    """
+    events = [dict(event, webhookEventId=uuid.uuid4().hex.upper())
+              for event in body['events']]
+    return json.dumps({'events': events}, ensure_ascii=False)
+
+
+def replay(environment: offline.OfflineEnvironment, entries: List[dict], speed: float,
+           users: int, notification_interval: float) -> ReplayResult:
+    """トレースを倍速で再生する
+    鉄道遅延情報の鮮度の有効秒数と最大経過秒数も倍速に合わせて縮め、記録時と同じ割合で再取得が発生するようにする
+
+    Args:
+        environment: 計測環境
+        entries: 時刻順のトレースレコードのリスト
+        speed: 倍速
+        users: 通知対象として追加で登録するユーザ数
+        notification_interval: 通知処理の実行間隔秒数(0の場合は実行しない)
+
+    Returns:
+        再生の集計結果
+    """
+    environment.reset()
+    # 最初に取得した鉄道遅延情報リストを、再生開始時点のDBの内容と取得先の応答にする
+    initial_list = next((entry['delay_info_list'] for entry in entries
+                         if 'delay_info_list' in entry), [])
+    environment.seed_delay_info_list(initial_list, Decimal(datetime.utcnow().timestamp()))
+    environment.seed_notification_run(initial_list)
+    environment.stub.set_delay_info(json.dumps(initial_list, ensure_ascii=False).encode('utf-8'))
+    environment.seed_users(users)
+    environment.seed_user_ids({
+        event['source']['userId']
+        for entry in entries if entry[trace.TRACE_KEY] == trace.KIND_WEBHOOK and entry['body']
+        for event in entry['body']['events'] if 'userId' in event.get('source', {})
+    })
+
+    original_cache = users_table.delay_info_cache
+    # 更新日時(Decimal型)に加算するため、Decimal型で縮める
+    ttl = Decimal(ORIGINAL_TTL) / Decimal(str(speed))
+    delay_info.TEN_MINUTES = ttl
+    reply.MAX_STALENESS_SECONDS = Decimal(ORIGINAL_MAX_STALENESS) / Decimal(str(speed))
+    users_table.delay_info_cache = DelayInfoCache(ttl)
+    events = 0
+    cache_hits = 0
+    cache_misses = 0
+    max_lag = 0.0
+    started = time.perf_counter()
+    try:
+        for offset, kind, entry in create_timeline(entries, notification_interval):
+            wait = offset / speed - (time.perf_counter() - started)
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                max_lag = max(max_lag, -wait)
+            if kind == trace.KIND_WEBHOOK and entry['body']:
+                events += len(entry['body']['events'])
+                reply.main(offline.create_webhook_request(
+                    create_replay_body(entry['body'])), None)
+                cache_hits += _count(environment.last_metrics, CACHE_HITS_METRIC)
+                cache_misses += _count(environment.last_metrics, CACHE_MISSES_METRIC)
+            elif kind == trace.KIND_DELAY_INFO and 'delay_info_list' in entry:
+                environment.stub.set_delay_info(json.dumps(
+                    entry['delay_info_list'], ensure_ascii=False).encode('utf-8'))
+            elif kind == KIND_NOTIFICATION:
+                notification.main({}, None)
+        elapsed = time.perf_counter() - started
+        return ReplayResult(
+            events=events,
+            elapsed_seconds=elapsed,
+            max_lag_seconds=max_lag,
+            cache_hits=cache_hits,
+            cache_misses=cache_misses,
+            delay_requests=environment.stub.requests[DELAY_PATH],
+            not_modified=environment.stub.not_modified,
+            dynamodb_calls=environment.dynamodb_calls(),
+            line_requests=environment.line_requests()
+        )
+    finally:
+        delay_info.TEN_MINUTES = ORIGINAL_TTL
+        reply.MAX_STALENESS_SECONDS = ORIGINAL_MAX_STALENESS
+        users_table.delay_info_cache = original_cache
+
+
+def _count(recorded_metrics: Optional[dict], name: str) -> int:
+    """呼び出し毎のメトリクスから件数を取得する
+
+    Args:
+        recorded_metrics: 呼び出し毎のメトリクス(記録されていない場合はNone)
+        name: メトリクス名
+
+    Returns:
+        件数(記録されていない場合は0)
+    """
+    if not recorded_metrics or name not in recorded_metrics:
+        return 0
+    return int(recorded_metrics[name][0])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trace', nargs='+', required=True)
+    parser.add_argument('--speeds', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--notification-interval', type=float,
+                        default=NOTIFICATION_INTERVAL)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--line-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    entries = read_trace(args.trace)
+    if not entries:
+        parser.error("トレースレコードが見つかりません。")
+    duration = entries[-1]['time'] - entries[0]['time']
+    print(f"トレースレコード数: {len(entries)}, 記録時間: {duration:.1f}秒, "
+          f"追加ユーザ数: {args.users}, 通知間隔: {args.notification_interval}秒")
+    print(f"{'倍速':>6} {'イベント':>8} {'処理秒数':>10} {'イベント/秒':>12} {'最大遅れ[ms]':>12} "
+          f"{'ヒット率':>8} {'delay.json':>10} {'(304)':>6} {'DynamoDB':>10} {'LINE API':>10}")
+    environment = offline.OfflineEnvironment(
+        args.dynamodb_latency_ms / 1000, args.line_latency_ms / 1000)
+    try:
+        for speed in args.speeds:
+            result = replay(environment, entries, speed, args.users,
+                            args.notification_interval)
+            lookups = result.cache_hits + result.cache_misses
+            hit_rate = result.cache_hits / lookups if lookups else 0.0
+            print(f"{speed:>6g} {result.events:>8} {result.elapsed_seconds:10.2f} "
+                  f"{result.events / result.elapsed_seconds:12.1f} "
+                  f"{result.max_lag_seconds * 1000:12.1f} {hit_rate:8.1%} "
+                  f"{result.delay_requests:>10} {result.not_modified:>6} "
+                  f"{result.dynamodb_calls:>10} {result.line_requests:>10}")
+    finally:
+        environment.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""応答処理のメッセージ種類毎の応答時間の計測
+インメモリDynamoDBとスタブのLINE Messaging APIを使用して、署名付きのWebhookイベントで応答処理を呼び出し、
+メッセージ種類毎の応答時間のp50／p99を出力する
+
+実行方法:
+    python -m benchmark.reply_latency --requests 200
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, List
+
+from benchmark import offline
+
+from functions import reply
+
+# 定数群
+# 登録済みのユーザ数
+SEEDED_USERS = 1000
+# メッセージ種類毎のWebhookイベントの作成処理(引数はユーザID)
+EVENT_FACTORIES: Dict[str, Callable[[str], dict]] = {
+    'text_delay': lambda user_id: _message_event(user_id, {'type': 'text', 'text': "JRの遅延"}),
+    'text_intent': lambda user_id: _message_event(user_id, {'type': 'text', 'text': "使い方"}),
+    'text_unsupported': lambda user_id: _message_event(user_id, {'type': 'text', 'text': "こんにちは"}),
+    'text_subscribe': lambda user_id: _message_event(user_id, {'type': 'text', 'text': "通知設定阪急"}),
+    'text_status': lambda user_id: _message_event(user_id, {'type': 'text', 'text': "通知設定"}),
+    'sticker': lambda user_id: _message_event(
+        user_id, {'type': 'sticker', 'packageId': "11537", 'stickerId': "52002734"}),
+    'image': lambda user_id: _message_event(
+        user_id, {'type': 'image', 'contentProvider': {'type': 'line'}}),
+    'audio': lambda user_id: _message_event(
+        user_id, {'type': 'audio', 'duration': 1000, 'contentProvider': {'type': 'line'}}),
+    'video': lambda user_id: _message_event(
+        user_id, {'type': 'video', 'duration': 1000, 'contentProvider': {'type': 'line'}}),
+    'location': lambda user_id: _message_event(
+        user_id, {'type': 'location', 'title': "大阪駅", 'address': "大阪市北区梅田",
+                  'latitude': 34.702485, 'longitude': 135.495951}),
+    'follow': lambda user_id: _event(user_id, 'follow', replyToken=uuid.uuid4().hex),
+    'unfollow': lambda user_id: _event(user_id, 'unfollow'),
+}
+
+
+def _event(user_id: str, event_type: str, **fields) -> dict:
+    return dict({
+        'type': event_type,
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': uuid.uuid4().hex.upper(),
+        'deliveryContext': {'isRedelivery': False},
+    }, **fields)
+
+
+def _message_event(user_id: str, message: dict) -> dict:
+    return _event(user_id, 'message', replyToken=uuid.uuid4().hex,
+                  message=dict(message, id=str(uuid.uuid4().int)[:18]))
+
+
+def create_request(line_event: dict) -> dict:
+    """Webhookイベントから署名付きのLambdaのリクエストイベントを作成する
+
+    Args:
+        line_event: Webhookイベント
+
+    Returns:
+        リクエストイベント
+    """
+    return offline.create_webhook_request(json.dumps(
+        {'destination': "U" + "0" * 32, 'events': [line_event]}, ensure_ascii=False))
+
+
+def measure(message_type: str, requests: int) -> List[float]:
+    """メッセージ種類毎に応答処理を繰り返し呼び出し、応答時間を計測する
+    フォロー解除は登録済みのユーザを順に使用し、その他は毎回別のユーザとする
+
+    Args:
+        message_type: メッセージ種類
+        requests: 呼び出し回数
+
+    Returns:
+        応答時間(秒)のリスト
+    """
+    factory = EVENT_FACTORIES[message_type]
+    timings = []
+    for index in range(requests):
+        user_id = offline.create_user_id(index % SEEDED_USERS)
+        request = create_request(factory(user_id))
+        started = time.perf_counter()
+        reply.main(request, None)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--types', nargs='+', default=list(EVENT_FACTORIES),
+                        choices=list(EVENT_FACTORIES))
+    parser.add_argument('--fixture', default='delay_kansai')
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0)
+    parser.add_argument('--line-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    environment = offline.OfflineEnvironment(
+        args.dynamodb_latency_ms / 1000, args.line_latency_ms / 1000)
+    print(f"呼び出し回数: {args.requests}, 鉄道遅延情報: {args.fixture}, "
+          f"通信時間: DynamoDB {args.dynamodb_latency_ms}ms / LINE {args.line_latency_ms}ms")
+    print(f"{'メッセージ種類':<18} {'p50[ms]':>10} {'p99[ms]':>10} {'DynamoDB/回':>12} {'LINE API/回':>12}")
+    try:
+        for message_type in args.types:
+            environment.reset()
+            # 鉄道遅延情報は登録直後(再取得が不要)の状態から計測する
+            environment.seed_delay_info(
+                args.fixture, Decimal(datetime.utcnow().timestamp()))
+            environment.seed_users(SEEDED_USERS)
+            environment.serve_delay_info(args.fixture)
+            timings = measure(message_type, args.requests)
+            p50 = statistics.median(timings)
+            p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+            print(f"{message_type:<18} {p50 * 1000:10.2f} {p99 * 1000:10.2f} "
+                  f"{environment.dynamodb_calls() / args.requests:12.2f} "
+                  f"{environment.line_requests() / args.requests:12.2f}")
+    finally:
+        environment.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""性能計測用のスタブサーバ
+LINE Messaging APIの送信系エンドポイントと、鉄道遅延情報リスト(delay.json)の取得先をローカルで模倣する
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# 定数群
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DELAY_PATH = "/delay.json"
+MESSAGE_PATH_PREFIX = "/v2/bot/message/"
+
+
+def load_fixture(name: str) -> bytes:
+    """記録済みの鉄道遅延情報リストを読み込む
+
+    Args:
+        name: フィクスチャ名(fixtures配下のファイル名から拡張子を除いたもの)
+
+    Returns:
+        鉄道遅延情報リストのJSON
+    """
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), 'rb') as fixture_file:
+        return fixture_file.read()
+
+
+class StubServer:
+    """LINE Messaging APIと鉄道遅延情報リストの取得先のスタブ
+    受信したリクエストの件数と宛先数を集計する
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Args:
+            latency: リクエスト毎に模倣する処理時間の秒数
+        """
+        self.latency = latency
+        # パス毎のリクエスト数
+        self.requests: Counter = Counter()
+        # 送信したメッセージの宛先数
+        self.recipients = 0
+        # 受理済みの再試行キーにより重複と判定したリクエスト数
+        self.conflicts = 0
+        # 鉄道遅延情報リストが前回から変更がないと応答したリクエスト数
+        self.not_modified = 0
+        self._retry_keys = set()
+        self._delay_body = b"[]"
+        self._delay_etag = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _create_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """スタブのURL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_delay_info(self, body: bytes) -> None:
+        """取得先が返す鉄道遅延情報リストを設定する
+
+        Args:
+            body: 鉄道遅延情報リストのJSON
+        """
+        with self._lock:
+            self._delay_body = body
+            self._delay_etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+    def reset(self) -> None:
+        """集計と受理済みの再試行キーを初期化する"""
+        with self._lock:
+            self.requests.clear()
+            self.recipients = 0
+            self.conflicts = 0
+            self.not_modified = 0
+            self._retry_keys.clear()
+
+    def _get_delay_info(self, if_none_match: Optional[str]) -> tuple:
+        with self._lock:
+            self.requests[DELAY_PATH] += 1
+            if if_none_match and if_none_match == self._delay_etag:
+                self.not_modified += 1
+                return 304, b"", self._delay_etag
+            return 200, self._delay_body, self._delay_etag
+
+    def _send_message(self, path: str, body: dict, retry_key: Optional[str]) -> int:
+        with self._lock:
+            self.requests[path] += 1
+            if retry_key:
+                if retry_key in self._retry_keys:
+                    self.conflicts += 1
+                    return 409
+                self._retry_keys.add(retry_key)
+            self.recipients += len(body['to']) if isinstance(body.get('to'), list) else 1
+        return 200
+
+
+def _create_handler(stub: StubServer) -> type:
+    """スタブに紐づくリクエストハンドラのクラスを作成する"""
+
+    class _Handler(BaseHTTPRequestHandler):
+        # 接続を使い回せるようにする
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self) -> None:
+            if self.path != DELAY_PATH:
+                self._respond(404, b'{"message": "Not found"}')
+                return
+            status, body, etag = stub._get_delay_info(self.headers.get('If-None-Match'))
+            self._respond(status, body, {'ETag': etag} if etag else {})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if stub.latency:
+                time.sleep(stub.latency)
+            if not self.path.startswith(MESSAGE_PATH_PREFIX):
+                self._respond(404, b'{"message": "Not found"}')
+                return
+            status = stub._send_message(
+                self.path, body, self.headers.get('X-Line-Retry-Key'))
+            if status == 409:
+                self._respond(409, b'{"message": "The retry key is already accepted"}')
+            else:
+                self._respond(200, b"{}")
+
+        def _respond(self, status: int, body: bytes, headers: Optional[dict] = None) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            # 計測結果の出力を妨げないよう、アクセスログは出力しない
+            pass
+
+    return _Handler
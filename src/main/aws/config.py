@@ -1,27 +1,44 @@
-"""AWS接続情報の設定用モジュール"""
+"""AWS接続情報の設定用モジュール
+コールドスタートを軽くするため、boto3のセッションは初回使用時に生成する
+"""
 
 import os
+from typing import TYPE_CHECKING
 
-from boto3.session import Session
-from botocore.config import Config
-
-config = Config(
-    connect_timeout=int(os.environ['AWS_CONNECT_TIMEOUT']),
-    read_timeout=int(os.environ['AWS_READ_TIMEOUT']),
-    retries={
-        'max_attempts': int(os.environ['AWS_MAX_ATTEMPTS'])
-    }
-)
-
-# ローカル用
-if os.getenv('MY_AWS_ACCESS_KEY_ID') and os.getenv('MY_AWS_SECRET_ACCESS_KEY'):
-    session = Session(
-        aws_access_key_id=os.environ['MY_AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['MY_AWS_SECRET_ACCESS_KEY'],
-        region_name=os.environ['AWS_REGION_NAME'],
+from utils.lazy import lazy
+
+if TYPE_CHECKING:
+    from boto3.session import Session
+    from botocore.config import Config
+
+
+@lazy
+def get_config() -> 'Config':
+    """AWS接続設定を取得する"""
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=int(os.environ['AWS_CONNECT_TIMEOUT']),
+        read_timeout=int(os.environ['AWS_READ_TIMEOUT']),
+        retries={
+            'max_attempts': int(os.environ['AWS_MAX_ATTEMPTS'])
+        }
     )
-# AWS Lambda用
-else:
-    session = Session(
+
+
+@lazy
+def get_session() -> 'Session':
+    """boto3のセッションを取得する"""
+    from boto3.session import Session
+
+    # ローカル用
+    if os.getenv('MY_AWS_ACCESS_KEY_ID') and os.getenv('MY_AWS_SECRET_ACCESS_KEY'):
+        return Session(
+            aws_access_key_id=os.environ['MY_AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['MY_AWS_SECRET_ACCESS_KEY'],
+            region_name=os.environ['AWS_REGION_NAME'],
+        )
+    # AWS Lambda用
+    return Session(
         region_name=os.environ['AWS_REGION_NAME']
     )
@@ -0,0 +1,132 @@
+"""DynamoDBの属性値形式への変換用モジュール
+モデルのdict型データとDynamoDBの低レベルAPIの属性値形式を、元のデータを変更せずに1回の走査で相互に変換する
+"""
+
+from decimal import Context, Decimal
+from typing import Any, Dict
+
+# DynamoDBの数値の最大精度(38桁)に丸めるためのコンテキスト
+NUMBER_CONTEXT = Context(prec=38, traps=[])
+
+
+def encode_item(item: Dict[str, Any]) -> Dict[str, dict]:
+    """dict型のデータを属性値形式に変換する
+    空文字はNULLに変換する
+
+    Args:
+        item: dict型のデータ
+
+    Raises:
+        TypeError: 変換できない型の値が含まれる
+
+    Returns:
+        属性値形式のデータ
+    """
+    return {key: encode_value(value) for key, value in item.items()}
+
+
+def decode_item(item: Dict[str, dict]) -> Dict[str, Any]:
+    """属性値形式のデータをdict型に変換する
+
+    Args:
+        item: 属性値形式のデータ
+
+    Raises:
+        TypeError: 変換できない型の属性値が含まれる
+
+    Returns:
+        dict型のデータ
+    """
+    return {key: decode_value(value) for key, value in item.items()}
+
+
+def encode_value(value: Any) -> dict:
+    """値を属性値形式に変換する
+    空文字列と空のセットはDynamoDBに登録できないため、NULLに変換する
+
+    Args:
+        value: 値
+
+    Raises:
+        TypeError: 変換できない型の値
+
+    Returns:
+        属性値
+    """
+    if value is None or value == '':
+        return {'NULL': True}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, Decimal, float)):
+        return {'N': _encode_number(value)}
+    if isinstance(value, dict):
+        return {'M': {key: encode_value(element) for key, element in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [encode_value(element) for element in value]}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, (set, frozenset)):
+        if not value:
+            return {'NULL': True}
+        if all(isinstance(element, str) for element in value):
+            return {'SS': list(value)}
+        if all(isinstance(element, (int, Decimal)) and not isinstance(element, bool)
+               for element in value):
+            return {'NS': [_encode_number(element) for element in value]}
+    raise TypeError(f"属性値形式に変換できない値です。型: {type(value).__name__}")
+
+
+def decode_value(value: dict) -> Any:
+    """属性値を値に変換する
+    数値はDecimal型、セットはset型に変換する
+
+    Args:
+        value: 属性値
+
+    Raises:
+        TypeError: 変換できない型の属性値
+
+    Returns:
+        値
+    """
+    (attribute_type, attribute_value), = value.items()
+    if attribute_type == 'S':
+        return attribute_value
+    if attribute_type == 'N':
+        return Decimal(attribute_value)
+    if attribute_type == 'M':
+        return {key: decode_value(element) for key, element in attribute_value.items()}
+    if attribute_type == 'L':
+        return [decode_value(element) for element in attribute_value]
+    if attribute_type == 'NULL':
+        return None
+    if attribute_type == 'BOOL':
+        return attribute_value
+    if attribute_type == 'SS':
+        return set(attribute_value)
+    if attribute_type == 'NS':
+        return {Decimal(element) for element in attribute_value}
+    if attribute_type == 'B':
+        return attribute_value
+    if attribute_type == 'BS':
+        return set(attribute_value)
+    raise TypeError(f"変換できない属性値です。型: {attribute_type}")
+
+
+def _encode_number(value: Any) -> str:
+    """数値を属性値の文字列に変換する
+    Decimal型のタイムスタンプなどは、DynamoDBの最大精度を超える桁を丸める
+
+    Args:
+        value: 数値
+
+    Returns:
+        数値の文字列
+    """
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        value = Decimal(repr(value))
+    return str(NUMBER_CONTEXT.plus(value))
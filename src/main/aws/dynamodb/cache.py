@@ -0,0 +1,55 @@
+"""DynamoDB取得結果のコンテナ内キャッシュ用モジュール"""
+
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from aws.dynamodb.delay_info import DelayInfo
+
+
+class DelayInfoCache:
+    """鉄道遅延情報のTTL付きキャッシュクラス
+    Lambdaのコンテナが再利用される間、モジュール変数として保持する
+    """
+
+    def __init__(self, ttl: int) -> None:
+        """
+        Args:
+            ttl: 鉄道遅延情報の更新日時からの有効秒数
+        """
+        self._ttl = ttl
+        self._delay_info: Optional[DelayInfo] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[DelayInfo]:
+        """有効期限内の鉄道遅延情報を取得する
+
+        Returns:
+            鉄道遅延情報(未キャッシュまたは有効期限切れの場合はNone)
+        """
+        with self._lock:
+            delay_info = self._delay_info
+            if delay_info and self._is_fresh(delay_info):
+                return delay_info
+            self._delay_info = None
+            return None
+
+    def set(self, delay_info: DelayInfo) -> None:
+        """鉄道遅延情報をキャッシュする
+
+        Args:
+            delay_info: 鉄道遅延情報
+        """
+        with self._lock:
+            self._delay_info = delay_info
+
+    def invalidate(self) -> None:
+        """キャッシュを破棄する"""
+        with self._lock:
+            self._delay_info = None
+
+    def _is_fresh(self, delay_info: DelayInfo) -> bool:
+        """鉄道遅延情報が有効期限内かどうか判定する"""
+        return (delay_info.updated_time + self._ttl) > Decimal(
+            datetime.utcnow().timestamp())
@@ -1,15 +1,29 @@
 """delay_infoエンティティ用モジュール"""
 
 from decimal import Decimal
+from typing import Dict, List, Optional
 
 from aws.exceptions import DynamoDBError
 
 from utils.base_class import Json
 
+# 鉄道遅延情報の鮮度の有効秒数
+TEN_MINUTES = 10 * 60
+
 ALL = 0
 WEST_JR = 1
 HANKYU = 2
 HANSHIN = 3
+# エリア毎の鉄道遅延情報メッセージ群で全運営会社を表すキー
+ALL_KEY = 'ALL'
+# 個別に通知設定可能な運営会社種類
+COMPANY_TYPES = (WEST_JR, HANKYU, HANSHIN)
+COMPANY_NAMES = {
+    ALL: "全路線",
+    WEST_JR: "JR西日本",
+    HANKYU: "阪急電鉄",
+    HANSHIN: "阪神電鉄",
+}
 
 
 class Messages(Json):
@@ -19,6 +33,10 @@ class Messages(Json):
     hankyu: str
     hanshin: str
     all: str
+    # 運営会社種類(文字列)毎の遅延している路線群のダイジェスト
+    digests: Dict[str, str] = {}
+    # 運営会社種類(文字列)毎の遅延している路線名リスト(全運営会社分は保持しない)
+    delay_lines: Dict[str, List[str]] = {}
 
     def extract_message(self, company_type: int) -> str:
         """鉄道遅延情報メッセージ群から対象の鉄道遅延情報メッセージを抽出する
@@ -44,6 +62,59 @@ class Messages(Json):
             raise DynamoDBError(f"運営会社種類が正しく設定されていません。運営会社種類: {company_type}")
         return extracted_message
 
+    def extract_digest(self, company_type: int) -> Optional[str]:
+        """対象の運営会社の遅延している路線群のダイジェストを抽出する
+
+        Args:
+            company_type: 運営会社種類
+
+        Returns:
+            ダイジェスト(未登録の場合はNone)
+        """
+        return self.digests.get(str(company_type))
+
+    def extract_delay_lines(self, company_type: int) -> Optional[List[str]]:
+        """対象の運営会社の遅延している路線名リストを抽出する
+        全運営会社の場合は、運営会社毎の路線名リストを連結する
+
+        Args:
+            company_type: 運営会社種類
+
+        Returns:
+            遅延している路線名リスト(未登録の場合はNone)
+        """
+        if company_type == ALL:
+            company_lines = [self.delay_lines.get(str(company))
+                             for company in COMPANY_TYPES]
+            if any(lines is None for lines in company_lines):
+                return None
+            return [line for lines in company_lines for line in lines]
+        return self.delay_lines.get(str(company_type))
+
+
+class AreaMessages(Json):
+    """エリア毎の鉄道遅延情報メッセージ群クラス
+    運営会社はエリア定義の運営会社キーで表し、全運営会社はALL_KEYで表す
+    """
+
+    area: str
+    # 運営会社キー毎のメッセージ
+    messages: Dict[str, str]
+    # 運営会社キー毎の遅延している路線群のダイジェスト
+    digests: Dict[str, str]
+    # 運営会社キー毎の遅延している路線名リスト(全運営会社分は保持しない)
+    delay_lines: Dict[str, List[str]]
+
+
+class AreaDelayInfo(Json):
+    """エリア毎の鉄道遅延情報クラス"""
+
+    user_id: str
+    updated_time: Decimal
+    messages: AreaMessages
+    # 全運営会社の遅延している路線群のダイジェスト
+    digest: Optional[str] = None
+
 
 class DelayInfo(Json):
     """鉄道遅延情報クラス"""
@@ -51,3 +122,6 @@ class DelayInfo(Json):
     user_id: str
     updated_time: Decimal
     messages: Messages
+    # 鉄道遅延情報リスト取得時の検証用ヘッダ
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
@@ -0,0 +1,153 @@
+"""シャード毎の配信記録用モジュール
+通知処理のシャード毎に最後に配信したメッセージのダイジェストと通知を終えた位置を保持し、
+実行記録の再作成や手動での再実行で同じメッセージを重複して配信しないようにする
+通知を終えた位置はシャードのユーザの並び順で表すため、配信記録の再利用はシャードに属するユーザが
+変わらないことを前提とする(シャードの分割数が変わった場合は再利用せず、ユーザの増減は有効秒数内のみ許容する)
+"""
+
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from aws.dynamodb import attributes, users_table, utils
+from utils import metrics
+
+# 定数群
+# 配信記録のIDの接頭辞(通知処理の実行記録と同じ接頭辞にし、ユーザ情報のスキャンから除く)
+LEDGER_ID_PREFIX = f"{users_table.NOTIFICATION_RUN_ID}_delivered_"
+# ダイジェストの文字数
+DIGEST_LENGTH = 16
+# 別の実行の配信記録を再利用する有効秒数
+# (同じ差分メッセージは時間をおいて再び発生しうるため、直近の配信記録のみを再利用する)
+LEDGER_TTL_SECONDS = 3600
+
+
+def create_ledger_id(shard_key: str) -> str:
+    """配信記録のIDを作成する
+
+    Args:
+        shard_key: シャードのキー
+
+    Returns:
+        配信記録のID
+    """
+    return f"{LEDGER_ID_PREFIX}{shard_key}"
+
+
+def create_message_digest(text: str) -> str:
+    """配信するメッセージのダイジェストを作成する
+
+    Args:
+        text: メッセージのテキスト
+
+    Returns:
+        ダイジェスト
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:DIGEST_LENGTH]
+
+
+class DeliveryLedger:
+    """1シャード分の配信記録クラス
+    ユーザ毎ではなく、先頭から連続して通知を終えたチャンクの位置をシャード毎に1項目で記録する
+    """
+
+    def __init__(self, shard_key: str, total_segments: int, text: str) -> None:
+        """
+        Args:
+            shard_key: シャードのキー
+            total_segments: 全運営会社を通知対象とするユーザのシャード数(スキャンのセグメント数)
+            text: 配信するメッセージのテキスト
+        """
+        self.ledger_id = create_ledger_id(shard_key)
+        self.total_segments = total_segments
+        self.digest = create_message_digest(text)
+        # この実行で、別の実行で配信済みのため除外したユーザ数(同じ実行の再開時は配信記録から引き継ぐ)
+        self.suppressed = 0
+        # この呼び出しで、別の実行で配信済みのため新たに除外したユーザ数
+        self.skipped = 0
+        # この呼び出しで配信を記録したユーザ数
+        self.recorded = 0
+        self._base_recipients = 0
+
+    @metrics.timed
+    def load(self, run_id: str) -> Optional[dict]:
+        """同じメッセージの配信記録を取得する
+        メッセージまたはシャードの分割数が異なる場合と、有効期限切れの場合は再利用しない
+        別の実行の配信記録の場合は、記録された位置までに配信済みのユーザをこの実行で除外したユーザとし、
+        この実行の配信記録として記録し直す(同じ実行の再開時に除外したユーザを数え直さないようにする)
+
+        Args:
+            run_id: 実行ID
+
+        Raises:
+            e: 配信記録の取得または記録し直しに失敗
+
+        Returns:
+            配信記録(cursor: 次に通知する位置, done: 完了済みかどうか)(再利用できない場合はNone)
+        """
+        try:
+            response = utils.get_client().get_item(
+                TableName=users_table.USERS_TABLE_NAME,
+                Key=attributes.encode_item({'user_id': self.ledger_id}),
+                ConsistentRead=True
+            )
+        except ClientError as e:
+            raise e
+        item = response.get('Item')
+        if not item:
+            return None
+        ledger = attributes.decode_item(item)
+        expires = ledger['updated_time'] + LEDGER_TTL_SECONDS
+        if ledger['digest'] != self.digest or \
+                ledger['total_segments'] != self.total_segments or \
+                expires < Decimal(datetime.utcnow().timestamp()):
+            return None
+        self._base_recipients = int(ledger['recipients'])
+        if ledger['run_id'] == run_id:
+            self.suppressed = int(ledger.get('suppressed', 0))
+        else:
+            self.suppressed = self.skipped = self._base_recipients
+            self._put(run_id, ledger.get('cursor'), 0, ledger['done'])
+        return {'cursor': ledger.get('cursor'), 'done': ledger['done']}
+
+    @metrics.timed
+    def record(self, run_id: str, cursor: object, delivered: int,
+               done: bool) -> None:
+        """通知を終えた位置までの配信を記録する
+        記録に失敗した場合は例外を送出し、呼び出し元は記録した位置以降のチャンクを未通知として扱う
+
+        Args:
+            run_id: 実行ID
+            cursor: 次に通知する位置
+            delivered: この呼び出しで通知に成功したユーザ数
+            done: シャードの通知が完了した場合はTrue
+
+        Raises:
+            e: 配信記録の登録に失敗
+        """
+        self._put(run_id, cursor, delivered, done)
+        self.recorded = delivered
+
+    def _put(self, run_id: str, cursor: object, delivered: int, done: bool) -> None:
+        """配信記録を登録する(引数はrecordと同じ)"""
+        ledger = {
+            'user_id': self.ledger_id,
+            'digest': self.digest,
+            'total_segments': self.total_segments,
+            'run_id': run_id,
+            'cursor': cursor,
+            'done': done,
+            'recipients': self._base_recipients + delivered,
+            'suppressed': self.suppressed,
+            'updated_time': Decimal(datetime.utcnow().timestamp()),
+        }
+        try:
+            utils.get_client().put_item(
+                TableName=users_table.USERS_TABLE_NAME,
+                Item=attributes.encode_item(ledger)
+            )
+        except ClientError as e:
+            raise e
@@ -0,0 +1,67 @@
+"""notification_runエンティティ用モジュール"""
+
+from decimal import Decimal
+from typing import Dict, Tuple
+
+from aws.dynamodb.delay_info import Messages
+
+from utils.base_class import Json
+
+
+class NotificationRun(Json):
+    """通知処理の実行記録クラス
+    通知対象をシャード(運営会社種類とスキャンのセグメント番号の組)に分割し、シャード毎の進捗を保持する
+    """
+
+    user_id: str
+    run_id: str
+    # 通知する鉄道遅延情報メッセージ群
+    # (差分のみを通知する場合も、遅延している路線名リストとダイジェストは通知時点の全路線分を保持する)
+    messages: Messages
+    # シャード毎の進捗(cursor: 次に通知する位置, done: 完了済みかどうか, chunks/recipients/failed/suppressed: 通知件数,
+    # lease_owner/lease_expires: 通知中のワーカのリース)
+    progress: Dict[str, dict] = {}
+    # 全運営会社を通知対象とするユーザのシャード数(スキャンのセグメント数)
+    total_segments: int = 1
+    # 未完了のシャード数
+    remaining_shards: int = 0
+    # 全シャードの通知が完了した場合のみTrue
+    completed: bool = False
+    started_time: Decimal
+    updated_time: Decimal
+
+
+def create_shard_key(company_type: int, segment: int) -> str:
+    """シャードのキーを作成する
+
+    Args:
+        company_type: 運営会社種類
+        segment: スキャンのセグメント番号
+
+    Returns:
+        シャードのキー
+    """
+    return f"{company_type}-{segment}"
+
+
+def parse_shard_key(shard_key: str) -> Tuple[int, int]:
+    """シャードのキーを運営会社種類とスキャンのセグメント番号に分解する
+
+    Args:
+        shard_key: シャードのキー
+
+    Returns:
+        運営会社種類とスキャンのセグメント番号
+    """
+    company_type, segment = shard_key.split("-")
+    return int(company_type), int(segment)
+
+
+def create_progress() -> dict:
+    """未着手のシャードの進捗を作成する
+
+    Returns:
+        シャードの進捗
+    """
+    return {'cursor': None, 'done': False,
+            'chunks': 0, 'recipients': 0, 'failed': 0, 'suppressed': 0}
@@ -1,6 +1,9 @@
 """usersエンティティ用モジュール"""
 
 from decimal import Decimal
+from typing import List
+
+from aws.dynamodb.delay_info import ALL
 
 from utils.base_class import Json
 
@@ -11,3 +14,5 @@ class User(Json):
     user_id: str
     created_time: Decimal
     updated_time: Decimal
+    # 通知対象の運営会社種類(ALLは全運営会社、空は通知なし)
+    companies: List[int] = [ALL]
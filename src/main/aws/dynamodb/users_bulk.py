@@ -0,0 +1,263 @@
+"""users_table一括操作用モジュール
+ステージ移行後などのテーブル再構築や、LINEの友だち一覧との突き合わせに使用する
+
+実行方法(src/main配下で実行):
+    python -m aws.dynamodb.users_bulk import < user_ids.txt
+    python -m aws.dynamodb.users_bulk export > user_ids.txt
+    python -m aws.dynamodb.users_bulk reconcile --from-line [--dry-run]
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Set
+
+from botocore.exceptions import ClientError
+from loguru import logger
+
+from aws.dynamodb import attributes, users_table, utils
+from aws.dynamodb.delay_info import COMPANY_TYPES
+from aws.dynamodb.users import User
+from aws.exceptions import DynamoDBError
+from utils import metrics
+from utils.iterables import chunked
+
+# 定数群
+# BatchWriteItemで一度に書き込める最大件数
+BATCH_WRITE_MAX_ITEMS = 25
+# 未処理の書き込みを再試行する最大回数と初回の待機秒数
+MAX_RETRIES = 8
+BASE_BACKOFF_SECONDS = 0.05
+# 進捗をログに出力する間隔(チャンク数)
+PROGRESS_INTERVAL = 40
+
+
+@dataclass
+class BulkWriteStats:
+    """一括書き込みの統計情報クラス"""
+
+    requested: int = 0
+    written: int = 0
+    chunks: int = 0
+    retries: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """1秒あたりの書き込み件数"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.written / self.elapsed_seconds
+
+
+@dataclass
+class ReconcileResult:
+    """友だち一覧との突き合わせ結果クラス"""
+
+    added: List[str]
+    removed: List[str]
+    put_stats: Optional[BulkWriteStats] = None
+    delete_stats: Optional[BulkWriteStats] = None
+
+
+def put_users(user_ids: Iterable[str]) -> BulkWriteStats:
+    """ユーザ情報を一括で登録する
+    登録済みのユーザの場合はput_userと同じく通知対象を全運営会社に戻し、購読情報も合わせて削除する
+
+    Args:
+        user_ids: ユーザIDのイテラブル
+
+    Raises:
+        DynamoDBError: 再試行しても書き込めない項目が残った
+
+    Returns:
+        一括書き込みの統計情報
+    """
+    timestamp_now = Decimal(datetime.utcnow().timestamp())
+
+    def _requests():
+        for user_id in user_ids:
+            yield {'PutRequest': {'Item': attributes.encode_item(User(
+                user_id=user_id,
+                created_time=timestamp_now,
+                updated_time=timestamp_now
+            ).to_dict())}}
+            yield from _create_subscription_delete_requests(user_id)
+
+    return _batch_write(_requests())
+
+
+def delete_users(user_ids: Iterable[str]) -> BulkWriteStats:
+    """ユーザ情報を一括で削除する
+    購読情報も合わせて削除する
+
+    Args:
+        user_ids: ユーザIDのイテラブル
+
+    Raises:
+        DynamoDBError: 再試行しても書き込めない項目が残った
+
+    Returns:
+        一括書き込みの統計情報
+    """
+    def _requests():
+        for user_id in user_ids:
+            yield {'DeleteRequest': {
+                'Key': attributes.encode_item({'user_id': user_id})
+            }}
+            yield from _create_subscription_delete_requests(user_id)
+
+    return _batch_write(_requests())
+
+
+def _create_subscription_delete_requests(user_id: str) -> Iterator[dict]:
+    """ユーザの全運営会社の購読情報の削除要求を作成する
+    一括書き込みではユーザ情報の通知対象を参照しないため、購読の有無によらず削除する
+
+    Args:
+        user_id: ユーザID
+
+    Yields:
+        購読情報の削除要求
+    """
+    for company_type in COMPANY_TYPES:
+        yield {'DeleteRequest': {'Key': attributes.encode_item(
+            users_table.create_subscription_key(company_type, user_id))}}
+
+
+def reconcile(follower_ids: Iterable[str],
+              dry_run: bool = False) -> ReconcileResult:
+    """テーブルのユーザ情報を友だち一覧と突き合わせ、過不足を登録／削除する
+
+    Args:
+        follower_ids: 友だちのユーザIDのイテラブル
+        dry_run: 差分の算出のみ行う場合はTrue
+
+    Raises:
+        DynamoDBError: 再試行しても書き込めない項目が残った
+
+    Returns:
+        突き合わせ結果
+    """
+    followers: Set[str] = set(follower_ids)
+    registered: Set[str] = set(users_table.scan_user_ids())
+    result = ReconcileResult(
+        added=sorted(followers - registered),
+        removed=sorted(registered - followers)
+    )
+    logger.info("友だち一覧との差分: [登録対象: {}件, 削除対象: {}件]",
+                len(result.added), len(result.removed))
+    if dry_run:
+        return result
+    result.put_stats = put_users(result.added)
+    result.delete_stats = delete_users(result.removed)
+    return result
+
+
+def _batch_write(requests: Iterable[dict]) -> BulkWriteStats:
+    """書き込み要求を25件ずつBatchWriteItemで書き込む
+    BatchWriteItemは同じキーの書き込み要求を含められないため、チャンク内で重複するキーは後の要求のみ書き込む
+    未処理の項目は指数バックオフで再試行する
+
+    Args:
+        requests: 書き込み要求のイテラブル
+
+    Raises:
+        e: 書き込みに失敗
+        DynamoDBError: 再試行しても書き込めない項目が残った
+
+    Returns:
+        一括書き込みの統計情報
+    """
+    stats = BulkWriteStats()
+    started = time.monotonic()
+    for chunk in chunked(requests, BATCH_WRITE_MAX_ITEMS):
+        chunk = list({_get_request_key(request): request for request in chunk}.values())
+        stats.requested += len(chunk)
+        stats.chunks += 1
+        pending = chunk
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = utils.get_client().batch_write_item(
+                    RequestItems={users_table.USERS_TABLE_NAME: pending})
+            except ClientError as e:
+                raise e
+            unprocessed = response.get('UnprocessedItems', {}).get(
+                users_table.USERS_TABLE_NAME, [])
+            stats.written += len(pending) - len(unprocessed)
+            if not unprocessed:
+                break
+            if attempt == MAX_RETRIES:
+                raise DynamoDBError(
+                    f"再試行しても書き込めない項目が残りました。件数: {len(unprocessed)}")
+            stats.retries += 1
+            metrics.add('aws.dynamodb.users_bulk.unprocessed_retries', 1)
+            pending = unprocessed
+            time.sleep(BASE_BACKOFF_SECONDS * (2 ** attempt))
+        if stats.chunks % PROGRESS_INTERVAL == 0:
+            _log_progress(stats, started)
+    stats.elapsed_seconds = time.monotonic() - started
+    _log_progress(stats, started)
+    return stats
+
+
+def _get_request_key(request: dict) -> str:
+    """書き込み要求の対象のキーを取得する
+
+    Args:
+        request: 書き込み要求
+
+    Returns:
+        キーのユーザID
+    """
+    if 'PutRequest' in request:
+        return request['PutRequest']['Item']['user_id']['S']
+    return request['DeleteRequest']['Key']['user_id']['S']
+
+
+def _log_progress(stats: BulkWriteStats, started: float) -> None:
+    """一括書き込みの進捗をログに出力する"""
+    elapsed = time.monotonic() - started
+    logger.info(
+        "一括書き込みの進捗: [書き込み件数: {}/{}, チャンク数: {}, 再試行回数: {}, "
+        "処理秒数: {:.3f}, スループット: {:.1f}件/秒]",
+        stats.written, stats.requested, stats.chunks, stats.retries,
+        elapsed, stats.written / elapsed if elapsed > 0 else 0.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('import', help="標準入力のユーザIDを一括登録する")
+    subparsers.add_parser('export', help="登録済みのユーザIDを標準出力に出力する")
+    reconcile_parser = subparsers.add_parser(
+        'reconcile', help="友だち一覧と突き合わせて過不足を登録／削除する")
+    reconcile_parser.add_argument(
+        '--from-line', action='store_true',
+        help="友だち一覧をLINEから取得する(未指定の場合は標準入力から読み込む)")
+    reconcile_parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        put_users(line.strip() for line in sys.stdin if line.strip())
+    elif args.command == 'export':
+        for user_id in users_table.scan_user_ids():
+            print(user_id)
+    else:
+        if args.from_line:
+            from line import line_bot_api
+            follower_ids = line_bot_api.iter_follower_ids()
+        else:
+            follower_ids = (line.strip() for line in sys.stdin if line.strip())
+        result = reconcile(follower_ids, dry_run=args.dry_run)
+        for user_id in result.added:
+            print(f"+{user_id}")
+        for user_id in result.removed:
+            print(f"-{user_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,64 @@
 """users_table操作用モジュール"""
 
 import os
+import queue
+import threading
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Optional
+from typing import Iterator, List, NamedTuple, Optional
 
 from botocore.exceptions import ClientError
 
-from aws.dynamodb import utils
-from aws.dynamodb.delay_info import DelayInfo, Messages
+from aws.dynamodb import attributes, utils
+from aws.dynamodb.cache import DelayInfoCache
+from aws.dynamodb.delay_info import (ALL, ALL_KEY, TEN_MINUTES, AreaDelayInfo,
+                                     AreaMessages, DelayInfo, Messages)
+from aws.dynamodb.notification_run import NotificationRun
 from aws.dynamodb.users import User
 from aws.exceptions import DynamoDBError
+from utils import metrics
 
-users_table = utils.db.Table(os.environ['AWS_USERS_TABLE'])
+# 定数群
+USERS_TABLE_NAME = os.environ['AWS_USERS_TABLE']
+# 並列スキャンのセグメント数
+SCAN_SEGMENTS = int(os.getenv('AWS_SCAN_SEGMENTS', '1'))
+# 並列スキャン時にメモリ上へ溜め込むユーザIDの最大件数
+SCAN_BUFFER_SIZE = 1000
+# 運営会社の購読情報のIDの接頭辞(IDは"subscribers_{運営会社種類}_{ユーザID}"とする)
+SUBSCRIBERS_PREFIX = "subscribers_"
+# 購読情報のみが持つ属性をキーとする、運営会社毎の購読者のグローバルセカンダリインデックス名
+SUBSCRIBERS_INDEX_NAME = "subscribers"
+# ユーザ情報と購読情報の更新が他の呼び出しと競合した場合の最大試行回数
+SUBSCRIPTION_MAX_ATTEMPTS = 3
+# 通知処理の実行記録のID
+NOTIFICATION_RUN_ID = "notification_run"
+# 鉄道遅延情報用データのID(エリア毎の鉄道遅延情報は"railway_{エリア名}"とする)
+RAILWAY_ID = "railway"
 
+# 鉄道遅延情報の再取得リースの有効秒数
+REFRESH_LEASE_SECONDS = 10
+# 通知処理の実行記録のリースの有効秒数(Lambdaのタイムアウト秒数より長くする)
+NOTIFICATION_RUN_LEASE_SECONDS = 60
+# 通知中のシャードの進捗を実行記録に記録する間隔秒数(リースの有効秒数より短くする)
+NOTIFICATION_RUN_CHECKPOINT_SECONDS = 20
 
+
+class UserIdPage(NamedTuple):
+    """ユーザIDのスキャン／クエリ結果の1ページ"""
+
+    user_ids: List[str]
+    # ページの最後に評価したユーザID(最後のページの場合はNone)
+    last_key: Optional[str]
+
+
+# 鉄道遅延情報のコンテナ内キャッシュ
+delay_info_cache = DelayInfoCache(TEN_MINUTES)
+
+
+@metrics.timed
 def put_user(user_id: str) -> User:
     """ユーザ情報を登録する
+    登録済みのユーザの場合は通知対象を全運営会社に戻し、購読情報も合わせて削除する
 
     Args:
         user_id: ユーザID
@@ -33,66 +75,186 @@ def put_user(user_id: str) -> User:
         created_time=timestamp_now,
         updated_time=timestamp_now
     )
+    item = attributes.encode_item(user.to_dict())
+    # 未登録のユーザは購読情報がないため、条件付き登録のみで登録する
     try:
-        users_table.put_item(
-            Item=utils.replace_data(user.to_dict())
+        utils.get_client().put_item(
+            TableName=USERS_TABLE_NAME,
+            Item=item,
+            ConditionExpression="attribute_not_exists(user_id)"
         )
+        return user
     except ClientError as e:
-        raise e
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise e
+    _write_with_subscriptions(
+        user_id, {'Put': {'TableName': USERS_TABLE_NAME, 'Item': item}}, user.companies)
     return user
 
 
-def update_user(user_id: str, messages: Messages) -> dict:
-    """ユーザ情報を更新する
+@metrics.timed
+def update_delay_info(messages: Messages, etag: Optional[str] = None,
+                      last_modified: Optional[str] = None) -> Optional[dict]:
+    """鉄道遅延情報を更新する
+    遅延している路線群のダイジェストが登録済みのものと同じ場合はメッセージ群を更新せず、
+    更新日時と検証用ヘッダのみ更新する
 
     Args:
-        user_id: ユーザID
         messages: 鉄道遅延情報メッセージ群
+        etag: 鉄道遅延情報リスト取得時のETag
+        last_modified: 鉄道遅延情報リスト取得時のLast-Modified
 
     Raises:
-        e: ユーザ情報の更新に失敗
+        e: 鉄道遅延情報の更新に失敗
 
     Returns:
-        ユーザ情報の更新結果
+        鉄道遅延情報の更新結果(メッセージ群を更新しなかった場合はNone)
     """
-    key = {'user_id': user_id}
-    expression = "set #messages=:messages, #updated_time=:updated_time"
+    key = {'user_id': 'railway'}
+    expression = "set #messages=:messages, #updated_time=:updated_time, " \
+        "#etag=:etag, #last_modified=:last_modified, #digest=:digest"
+    condition = "attribute_not_exists(#digest) OR #digest <> :digest"
     expression_name = {
         '#messages': 'messages',
-        '#updated_time': 'updated_time'
+        '#updated_time': 'updated_time',
+        '#etag': 'etag',
+        '#last_modified': 'last_modified',
+        '#digest': 'digest'
     }
     expression_value = {
         ':messages': messages.to_dict(),
         ':updated_time': Decimal(datetime.utcnow().timestamp()),
+        ':etag': etag,
+        ':last_modified': last_modified,
+        ':digest': messages.extract_digest(ALL),
     }
     return_value = "UPDATED_NEW"
     try:
-        response = users_table.update_item(
-            Key=key,
+        response = utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
             UpdateExpression=expression,
+            ConditionExpression=condition,
             ExpressionAttributeNames=expression_name,
-            ExpressionAttributeValues=utils.replace_data(expression_value),
+            ExpressionAttributeValues=attributes.encode_item(expression_value),
             ReturnValues=return_value
         )
     except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            touch_delay_info(etag, last_modified)
+            metrics.add('aws.dynamodb.users_table.delay_info.write_skipped', 1)
+            return None
         raise e
+    delay_info_cache.invalidate()
+    metrics.add('aws.dynamodb.users_table.delay_info.write_performed', 1)
+    if 'Attributes' in response:
+        response['Attributes'] = _decode_attributes(response)
     return response
 
 
-def update_delay_info(messages: Messages) -> dict:
-    """鉄道遅延情報を更新する
+@metrics.timed
+def touch_delay_info(etag: Optional[str] = None,
+                     last_modified: Optional[str] = None) -> Decimal:
+    """鉄道遅延情報の更新日時と検証用ヘッダのみを更新する
+    メッセージ群は書き込まず、他のコンテナでも最新であることを確認済みとして扱えるようにする
 
     Args:
-        messages: 鉄道遅延情報メッセージ群
+        etag: 鉄道遅延情報リスト取得時のETag
+        last_modified: 鉄道遅延情報リスト取得時のLast-Modified
+
+    Raises:
+        e: 鉄道遅延情報の更新に失敗
+
+    Returns:
+        更新日時
+    """
+    key = {'user_id': 'railway'}
+    expression = "set #updated_time=:updated_time, " \
+        "#etag=:etag, #last_modified=:last_modified"
+    expression_name = {
+        '#updated_time': 'updated_time',
+        '#etag': 'etag',
+        '#last_modified': 'last_modified'
+    }
+    updated_time = Decimal(datetime.utcnow().timestamp())
+    expression_value = {
+        ':updated_time': updated_time,
+        ':etag': etag,
+        ':last_modified': last_modified,
+    }
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        raise e
+    delay_info_cache.invalidate()
+    return updated_time
+
+
+def create_area_delay_info_key(area: str) -> dict:
+    """エリア毎の鉄道遅延情報のキーを作成する
+
+    Args:
+        area: エリア名
 
     Returns:
-        鉄道遅延情報の更新結果
+        エリア毎の鉄道遅延情報のキー
     """
-    return update_user("railway", messages)
+    return {'user_id': f"{RAILWAY_ID}_{area}"}
+
+
+@metrics.timed
+def update_area_delay_info(area_messages: AreaMessages) -> bool:
+    """エリア毎の鉄道遅延情報を更新する
+    遅延している路線群のダイジェストが登録済みのものと同じ場合は更新しない
 
+    Args:
+        area_messages: エリア毎の鉄道遅延情報メッセージ群
+
+    Raises:
+        e: エリア毎の鉄道遅延情報の更新に失敗
 
+    Returns:
+        更新した場合はTrue
+    """
+    key = create_area_delay_info_key(area_messages.area)
+    expression = "set #messages=:messages, #updated_time=:updated_time, #digest=:digest"
+    condition = "attribute_not_exists(#digest) OR #digest <> :digest"
+    expression_name = {
+        '#messages': 'messages',
+        '#updated_time': 'updated_time',
+        '#digest': 'digest'
+    }
+    expression_value = {
+        ':messages': area_messages.to_dict(),
+        ':updated_time': Decimal(datetime.utcnow().timestamp()),
+        ':digest': area_messages.digests[ALL_KEY],
+    }
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise e
+    return True
+
+
+@metrics.timed
 def delete_user(user_id: str) -> dict:
     """ユーザ情報を削除する
+    購読情報もユーザ情報と同じトランザクションで削除する
 
     Args:
         user_id: ユーザID
@@ -103,14 +265,253 @@ def delete_user(user_id: str) -> dict:
     Returns:
         ユーザ情報の削除結果
     """
-    key = {'user_id': user_id}
+    key = attributes.encode_item({'user_id': user_id})
+    old_item = _write_with_subscriptions(
+        user_id, {'Delete': {'TableName': USERS_TABLE_NAME, 'Key': key}}, [])
+    return {'Attributes': old_item} if old_item else {}
+
+
+@metrics.timed
+def update_subscription(user_id: str, companies: List[int]) -> List[int]:
+    """ユーザの通知対象の運営会社を更新する
+    購読情報もユーザ情報と同じトランザクションで追加／削除する
+
+    Args:
+        user_id: ユーザID
+        companies: 通知対象の運営会社種類リスト
+
+    Raises:
+        DynamoDBError: ユーザ情報が登録されていない
+        e: 通知対象の運営会社の更新に失敗
+
+    Returns:
+        更新前の通知対象の運営会社種類リスト
+    """
+    update = {'Update': {
+        'TableName': USERS_TABLE_NAME,
+        'Key': attributes.encode_item({'user_id': user_id}),
+        'UpdateExpression': "set #companies=:companies, #updated_time=:updated_time",
+        'ExpressionAttributeNames': {
+            '#companies': 'companies',
+            '#updated_time': 'updated_time'
+        },
+        'ExpressionAttributeValues': attributes.encode_item({
+            ':companies': companies,
+            ':updated_time': Decimal(datetime.utcnow().timestamp()),
+        })
+    }}
+    old_item = _write_with_subscriptions(user_id, update, companies, must_exist=True)
+    return [int(company) for company in old_item.get('companies', [ALL])]
+
+
+def create_subscription_key(company_type: int, user_id: str) -> dict:
+    """購読情報のキーを作成する
+
+    Args:
+        company_type: 運営会社種類
+        user_id: ユーザID
+
+    Returns:
+        購読情報のキー
+    """
+    return {'user_id': f"{SUBSCRIBERS_PREFIX}{company_type}_{user_id}"}
+
+
+def create_subscription_item(company_type: int, user_id: str) -> dict:
+    """購読情報を作成する
+    購読者のインデックスのキーとなる属性は購読情報のみが持つため、インデックスには購読情報のみが含まれる
+
+    Args:
+        company_type: 運営会社種類
+        user_id: ユーザID
+
+    Returns:
+        購読情報
+    """
+    return dict(create_subscription_key(company_type, user_id),
+                subscribed_company=company_type, subscriber_id=user_id)
+
+
+def _write_with_subscriptions(user_id: str, user_write: dict,
+                              companies: List[int],
+                              must_exist: bool = False) -> Optional[dict]:
+    """ユーザ情報の書き込みと購読情報の追加／削除を1つのトランザクションで行う
+    ユーザ情報の通知対象が読み込んだ時点から変わっていない場合のみ書き込み、
+    他の呼び出しと競合した場合は読み込みからやり直す
+
+    Args:
+        user_id: ユーザID
+        user_write: ユーザ情報の書き込み(TransactWriteItemsの1要素、条件式を除く)
+        companies: 書き込み後の通知対象の運営会社種類リスト
+        must_exist: ユーザ情報が登録されている場合のみ書き込む場合はTrue
+
+    Raises:
+        DynamoDBError: ユーザ情報が登録されていない、または競合して書き込めなかった
+        e: 書き込みに失敗
+
+    Returns:
+        書き込み前のユーザ情報(未登録の場合はNone)
+    """
+    for _ in range(SUBSCRIPTION_MAX_ATTEMPTS):
+        old_item = _get_user_item(user_id)
+        if old_item is None and must_exist:
+            raise DynamoDBError(f"ユーザ情報が登録されていません。ユーザID: {user_id}")
+        old_companies = old_item.get('companies') if old_item else None
+        (operation, request), = user_write.items()
+        condition = _create_companies_condition(old_item is not None, old_companies, request)
+        old_set = {int(company) for company in old_companies or []} - {ALL}
+        new_set = set(companies) - {ALL}
+        items = [{operation: dict(request, **condition)}]
+        items.extend(
+            {'Put': {'TableName': USERS_TABLE_NAME,
+                     'Item': attributes.encode_item(
+                         create_subscription_item(company_type, user_id))}}
+            for company_type in sorted(new_set - old_set))
+        items.extend(
+            {'Delete': {'TableName': USERS_TABLE_NAME,
+                        'Key': attributes.encode_item(
+                            create_subscription_key(company_type, user_id))}}
+            for company_type in sorted(old_set - new_set))
+        try:
+            _transact_write(items)
+        except ClientError as e:
+            if not _is_condition_failure(e):
+                raise e
+            metrics.add('aws.dynamodb.users_table.subscription_conflicts', 1)
+            continue
+        return old_item
+    raise DynamoDBError(f"他の呼び出しと競合したため、ユーザ情報を更新できませんでした。ユーザID: {user_id}")
+
+
+def _get_user_item(user_id: str) -> Optional[dict]:
+    """ユーザ情報を強い整合性で取得する
+
+    Raises:
+        e: ユーザ情報の取得に失敗
+
+    Returns:
+        ユーザ情報(未登録の場合はNone)
+    """
     try:
-        response = users_table.delete_item(Key=key)
+        response = utils.get_client().get_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item({'user_id': user_id}),
+            ConsistentRead=True
+        )
     except ClientError as e:
         raise e
-    return response
+    item = response.get('Item')
+    return attributes.decode_item(item) if item else None
+
+
+def _create_companies_condition(exists: bool, old_companies: Optional[list],
+                                request: dict) -> dict:
+    """ユーザ情報の通知対象が読み込んだ時点から変わっていないことを確認する条件式を作成する
+
+    Args:
+        exists: 読み込んだ時点でユーザ情報が登録されていた場合はTrue
+        old_companies: 読み込んだ時点の通知対象の運営会社種類リスト(属性がない場合はNone)
+        request: 条件式を追加する書き込み(既存の属性名／属性値を引き継ぐ)
+
+    Returns:
+        条件式と属性名／属性値
+    """
+    if not exists:
+        return {'ConditionExpression': "attribute_not_exists(user_id)"}
+    names = dict(request.get('ExpressionAttributeNames', {}), **{'#companies': 'companies'})
+    condition = {'ExpressionAttributeNames': names}
+    if old_companies is None:
+        condition['ConditionExpression'] = \
+            "attribute_exists(user_id) AND attribute_not_exists(#companies)"
+    else:
+        condition['ConditionExpression'] = "#companies = :old_companies"
+        condition['ExpressionAttributeValues'] = dict(
+            request.get('ExpressionAttributeValues', {}),
+            **attributes.encode_item({':old_companies': old_companies}))
+    return condition
+
+
+def _transact_write(items: List[dict]) -> None:
+    """書き込みをまとめて行う
+    書き込みが1件の場合は、トランザクションより書き込みキャパシティの消費が少ない単一の書き込みで行う
+
+    Args:
+        items: TransactWriteItemsの要素のリスト
+
+    Raises:
+        e: 書き込みに失敗
+    """
+    client = utils.get_client()
+    try:
+        if len(items) > 1:
+            client.transact_write_items(TransactItems=items)
+            return
+        (operation, kwargs), = items[0].items()
+        if operation == 'Put':
+            client.put_item(**kwargs)
+        elif operation == 'Delete':
+            client.delete_item(**kwargs)
+        else:
+            client.update_item(**kwargs)
+    except ClientError as e:
+        raise e
+
+
+def _is_condition_failure(error: ClientError) -> bool:
+    """条件式を満たさなかったことによる書き込みの失敗かどうか判定する"""
+    code = error.response['Error']['Code']
+    if code == 'ConditionalCheckFailedException':
+        return True
+    return code == 'TransactionCanceledException' and any(
+        reason.get('Code') == 'ConditionalCheckFailed'
+        for reason in error.response.get('CancellationReasons', []))
+
+
+@metrics.timed
+def query_subscriber_id_pages(company_type: int, start_key: Optional[str] = None,
+                              limit: Optional[int] = None) -> Iterator[UserIdPage]:
+    """運営会社を個別に購読しているユーザのユーザIDを、購読者のインデックスからページ単位で逐次取得する
+    ユーザIDの順に取得するため、ページの最後のユーザIDを開始位置に指定すると続きのページから取得できる
+
+    Args:
+        company_type: 運営会社種類
+        start_key: 開始位置(前のページの最後のユーザID)
+        limit: 1ページで取得する最大件数
+
+    Raises:
+        e: 購読者の取得に失敗
+
+    Yields:
+        ユーザIDの取得結果の1ページ
+    """
+    query_kwargs = {
+        'TableName': USERS_TABLE_NAME,
+        'IndexName': SUBSCRIBERS_INDEX_NAME,
+        'KeyConditionExpression': "#company = :company",
+        'ExpressionAttributeNames': {'#company': 'subscribed_company'},
+        'ExpressionAttributeValues': attributes.encode_item({':company': company_type}),
+    }
+    if limit:
+        query_kwargs['Limit'] = limit
+    if start_key:
+        query_kwargs['ExclusiveStartKey'] = attributes.encode_item(
+            create_subscription_item(company_type, start_key))
+    while True:
+        try:
+            response = utils.get_client().query(**query_kwargs)
+        except ClientError as e:
+            raise e
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        yield UserIdPage(
+            [item['subscriber_id']['S'] for item in response['Items']],
+            last_evaluated_key['subscriber_id']['S'] if last_evaluated_key else None
+        )
+        if not last_evaluated_key:
+            return
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
 
 
+@metrics.timed
 def get_user(user_id: str) -> Optional[User]:
     """ユーザ情報を取得する
 
@@ -125,13 +526,20 @@ def get_user(user_id: str) -> Optional[User]:
     """
     key = {'user_id': user_id}
     try:
-        response = users_table.get_item(Key=key)
+        response = utils.get_client().get_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key)
+        )
     except ClientError as e:
         raise e
     item = response.get('Item')
-    return User.from_dict(item) if item else None
+    if not item:
+        return None
+    # 数値はDecimal型で取得されるため、型を検証・変換する
+    return User.from_dict(attributes.decode_item(item), validate=True)
 
 
+@metrics.timed
 def get_delay_info() -> DelayInfo:
     """鉄道遅延情報を取得する
 
@@ -143,30 +551,513 @@ def get_delay_info() -> DelayInfo:
     """
     key = {'user_id': 'railway'}
     try:
-        response = users_table.get_item(Key=key)
+        response = utils.get_client().get_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key)
+        )
     except ClientError as e:
         raise e
     item = response.get('Item')
     if not item:
         raise DynamoDBError("鉄道遅延情報が登録されていません。")
-    return DelayInfo.from_dict(item)
+    return DelayInfo.from_dict(attributes.decode_item(item))
+
 
+@metrics.timed
+def get_area_delay_info(area: str) -> AreaDelayInfo:
+    """エリア毎の鉄道遅延情報を取得する
 
-def scan_exclude_delay_info() -> List[User]:
-    """鉄道遅延情報を除く全ユーザ情報を取得する
+    Args:
+        area: エリア名
 
     Raises:
-        e: ユーザ情報の取得に失敗
+        DynamoDBError: エリア毎の鉄道遅延情報が登録されていない
 
     Returns:
-        鉄道遅延情報を除く全ユーザ情報リスト
+        エリア毎の鉄道遅延情報
     """
-    scan_kwargs = {
-        'FilterExpression': 'user_id  <> :user_id',
-        'ExpressionAttributeValues': {':user_id': 'railway'}
+    try:
+        response = utils.get_client().get_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(create_area_delay_info_key(area))
+        )
+    except ClientError as e:
+        raise e
+    item = response.get('Item')
+    if not item:
+        raise DynamoDBError(f"エリアの鉄道遅延情報が登録されていません。エリア: {area}")
+    return AreaDelayInfo.from_dict(attributes.decode_item(item))
+
+
+def get_cached_delay_info() -> DelayInfo:
+    """鉄道遅延情報をコンテナ内キャッシュを優先して取得する
+    キャッシュが存在しないまたは有効期限切れの場合のみDBから取得する
+
+    Raises:
+        DynamoDBError: 鉄道遅延情報が登録されていない
+
+    Returns:
+        鉄道遅延情報
+    """
+    cached_delay_info = delay_info_cache.get()
+    if cached_delay_info:
+        metrics.add('aws.dynamodb.users_table.delay_info_cache.hits', 1)
+        return cached_delay_info
+    metrics.add('aws.dynamodb.users_table.delay_info_cache.misses', 1)
+    db_delay_info = get_delay_info()
+    delay_info_cache.set(db_delay_info)
+    return db_delay_info
+
+
+@metrics.timed
+def acquire_refresh_lease(owner: str) -> bool:
+    """鉄道遅延情報の再取得リースを取得する
+    リースが存在しないまたは有効期限切れの場合のみ、条件付き更新で取得できる
+
+    Args:
+        owner: リースの所有者ID
+
+    Raises:
+        e: リースの取得処理に失敗
+
+    Returns:
+        リースを取得できた場合はTrue
+    """
+    timestamp_now = Decimal(datetime.utcnow().timestamp())
+    key = {'user_id': 'railway'}
+    expression = "set #lease_owner=:lease_owner, #lease_expires=:lease_expires"
+    condition = "attribute_not_exists(#lease_expires) OR #lease_expires < :now"
+    expression_name = {
+        '#lease_owner': 'lease_owner',
+        '#lease_expires': 'lease_expires'
+    }
+    expression_value = {
+        ':lease_owner': owner,
+        ':lease_expires': timestamp_now + REFRESH_LEASE_SECONDS,
+        ':now': timestamp_now,
+    }
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise e
+    return True
+
+
+@metrics.timed
+def release_refresh_lease(owner: str) -> None:
+    """鉄道遅延情報の再取得リースを解放する
+    他の所有者が取得し直したリースは解放しない
+
+    Args:
+        owner: リースの所有者ID
+
+    Raises:
+        e: リースの解放処理に失敗
+    """
+    key = {'user_id': 'railway'}
+    expression = "remove #lease_owner, #lease_expires"
+    condition = "#lease_owner = :lease_owner"
+    expression_name = {
+        '#lease_owner': 'lease_owner',
+        '#lease_expires': 'lease_expires'
     }
+    expression_value = {':lease_owner': owner}
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return
+        raise e
+
+
+@metrics.timed
+def get_notification_run() -> Optional[NotificationRun]:
+    """通知処理の実行記録を取得する
+
+    Raises:
+        e: 実行記録の取得に失敗
+
+    Returns:
+        通知処理の実行記録(未登録の場合はNone)
+    """
+    key = {'user_id': NOTIFICATION_RUN_ID}
     try:
-        response = users_table.scan(**scan_kwargs)
+        response = utils.get_client().get_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            ConsistentRead=True
+        )
     except ClientError as e:
         raise e
-    return [User.from_dict(item) for item in response["Items"]]
+    item = response.get('Item')
+    if not item:
+        return None
+    return NotificationRun.from_dict(attributes.decode_item(item), validate=True)
+
+
+@metrics.timed
+def start_notification_run(run: NotificationRun,
+                           previous_run_id: Optional[str] = None) -> bool:
+    """通知処理の実行記録を登録する
+    前回の実行記録が完了済みで、他の呼び出しに置き換えられていない場合のみ、条件付き登録で登録できる
+
+    Args:
+        run: 通知処理の実行記録
+        previous_run_id: 前回の実行記録の実行ID(未登録の場合はNone)
+
+    Raises:
+        e: 実行記録の登録に失敗
+
+    Returns:
+        登録できた場合はTrue
+    """
+    kwargs = {
+        'TableName': USERS_TABLE_NAME,
+        'Item': attributes.encode_item(run.to_dict()),
+    }
+    if previous_run_id:
+        kwargs['ConditionExpression'] = \
+            "#run_id = :previous_run_id AND #completed = :true"
+        kwargs['ExpressionAttributeNames'] = {
+            '#run_id': 'run_id',
+            '#completed': 'completed'
+        }
+        kwargs['ExpressionAttributeValues'] = attributes.encode_item({
+            ':previous_run_id': previous_run_id,
+            ':true': True
+        })
+    else:
+        kwargs['ConditionExpression'] = "attribute_not_exists(#run_id)"
+        kwargs['ExpressionAttributeNames'] = {'#run_id': 'run_id'}
+    try:
+        utils.get_client().put_item(**kwargs)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise e
+    return True
+
+
+@metrics.timed
+def acquire_shard_lease(run_id: str, shard_key: str, owner: str) -> bool:
+    """通知処理のシャードのリースを取得する
+    シャードが未完了で、リースが存在しないまたは有効期限切れの場合のみ、条件付き更新で取得できる
+
+    Args:
+        run_id: 実行ID
+        shard_key: シャードのキー
+        owner: リースの所有者ID
+
+    Raises:
+        e: リースの取得処理に失敗
+
+    Returns:
+        リースを取得できた場合はTrue
+    """
+    timestamp_now = Decimal(datetime.utcnow().timestamp())
+    key = {'user_id': NOTIFICATION_RUN_ID}
+    expression = ("set #progress.#shard.#lease_owner=:lease_owner, "
+                  "#progress.#shard.#lease_expires=:lease_expires")
+    condition = ("#run_id = :run_id AND #progress.#shard.#done = :false AND "
+                 "(attribute_not_exists(#progress.#shard.#lease_expires) OR "
+                 "#progress.#shard.#lease_expires < :now)")
+    expression_name = {
+        '#run_id': 'run_id',
+        '#progress': 'progress',
+        '#shard': shard_key,
+        '#done': 'done',
+        '#lease_owner': 'lease_owner',
+        '#lease_expires': 'lease_expires'
+    }
+    expression_value = {
+        ':run_id': run_id,
+        ':false': False,
+        ':lease_owner': owner,
+        ':lease_expires': timestamp_now + NOTIFICATION_RUN_LEASE_SECONDS,
+        ':now': timestamp_now,
+    }
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise e
+    return True
+
+
+@metrics.timed
+def checkpoint_shard(run_id: str, shard_key: str, owner: str,
+                     progress: dict) -> Optional[int]:
+    """通知処理のシャードの進捗を記録し、リースを延長する
+    シャードが完了した場合は未完了のシャード数を減らし、最後のシャードであれば実行記録を完了済みにする
+
+    Args:
+        run_id: 実行ID
+        shard_key: シャードのキー
+        owner: リースの所有者ID
+        progress: シャードの進捗(リースを除く)
+
+    Raises:
+        DynamoDBError: リースを他の呼び出しに取得された
+        e: 進捗の記録に失敗
+
+    Returns:
+        シャードが完了した場合は未完了のシャード数(完了していない場合はNone)
+    """
+    timestamp_now = Decimal(datetime.utcnow().timestamp())
+    key = {'user_id': NOTIFICATION_RUN_ID}
+    expression = "set #progress.#shard=:progress, #updated_time=:updated_time"
+    expression_name = {
+        '#progress': 'progress',
+        '#shard': shard_key,
+        '#updated_time': 'updated_time',
+        '#run_id': 'run_id',
+        '#lease_owner': 'lease_owner',
+    }
+    expression_value = {
+        ':progress': dict(progress, lease_owner=owner,
+                          lease_expires=timestamp_now + NOTIFICATION_RUN_LEASE_SECONDS),
+        ':updated_time': timestamp_now,
+        ':run_id': run_id,
+        ':lease_owner': owner,
+    }
+    if progress['done']:
+        expression += " add #remaining_shards :decrement"
+        expression_name['#remaining_shards'] = 'remaining_shards'
+        expression_value[':decrement'] = -1
+    try:
+        response = utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression="#run_id = :run_id AND #progress.#shard.#lease_owner = :lease_owner",
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value),
+            ReturnValues='UPDATED_NEW'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise DynamoDBError(
+                f"シャードのリースを他の呼び出しに取得されました。実行ID: {run_id}, シャード: {shard_key}") from e
+        raise e
+    if not progress['done']:
+        return None
+    remaining_shards = int(_decode_attributes(response)['remaining_shards'])
+    if remaining_shards <= 0:
+        _complete_notification_run(run_id)
+    return remaining_shards
+
+
+def _complete_notification_run(run_id: str) -> None:
+    """通知処理の実行記録を完了済みにする
+
+    Args:
+        run_id: 実行ID
+
+    Raises:
+        e: 実行記録の更新に失敗
+    """
+    key = {'user_id': NOTIFICATION_RUN_ID}
+    expression = "set #completed=:true, #updated_time=:updated_time"
+    expression_name = {
+        '#completed': 'completed',
+        '#updated_time': 'updated_time',
+        '#run_id': 'run_id',
+    }
+    expression_value = {
+        ':true': True,
+        ':updated_time': Decimal(datetime.utcnow().timestamp()),
+        ':run_id': run_id,
+    }
+    try:
+        utils.get_client().update_item(
+            TableName=USERS_TABLE_NAME,
+            Key=attributes.encode_item(key),
+            UpdateExpression=expression,
+            ConditionExpression="#run_id = :run_id",
+            ExpressionAttributeNames=expression_name,
+            ExpressionAttributeValues=attributes.encode_item(expression_value)
+        )
+    except ClientError as e:
+        raise e
+
+
+def scan_user_ids(total_segments: int = SCAN_SEGMENTS) -> Iterator[str]:
+    """鉄道遅延情報と購読者インデックス、通知処理の実行記録を除く全ユーザのユーザIDを逐次取得する
+    セグメント数が2以上の場合は、テーブルを分割して並列にスキャンする
+
+    Args:
+        total_segments: 並列スキャンのセグメント数
+
+    Raises:
+        e: ユーザ情報の取得に失敗
+
+    Yields:
+        ユーザID
+    """
+    if total_segments <= 1:
+        yield from _scan_segment(0, 1)
+        return
+
+    buffer = queue.Queue(maxsize=SCAN_BUFFER_SIZE)
+    finished = object()
+    stop = threading.Event()
+
+    def _put(obj: object) -> bool:
+        # 呼び出し元が取得を打ち切った場合は待機せずに終了する
+        while not stop.is_set():
+            try:
+                buffer.put(obj, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(segment: int) -> None:
+        try:
+            for user_id in _scan_segment(segment, total_segments):
+                if not _put(user_id):
+                    return
+        except Exception as e:
+            _put(e)
+        _put(finished)
+
+    threads = [
+        threading.Thread(target=_produce, args=(segment,), daemon=True)
+        for segment in range(total_segments)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        remaining = total_segments
+        while remaining:
+            user_id = buffer.get()
+            if user_id is finished:
+                remaining -= 1
+            elif isinstance(user_id, Exception):
+                raise user_id
+            else:
+                yield user_id
+    finally:
+        stop.set()
+
+
+def _scan_segment(segment: int, total_segments: int) -> Iterator[str]:
+    """1セグメント分のユーザIDをページングを辿って逐次取得する
+    低レベルクライアントはスレッド間で共有できる
+
+    Args:
+        segment: セグメント番号
+        total_segments: セグメント数
+
+    Raises:
+        e: ユーザ情報の取得に失敗
+
+    Yields:
+        ユーザID
+    """
+    for page in scan_user_id_pages(segment, total_segments,
+                                   all_companies_only=False):
+        yield from page.user_ids
+
+
+def scan_user_id_pages(segment: int, total_segments: int,
+                       start_key: Optional[str] = None,
+                       all_companies_only: bool = True,
+                       limit: Optional[int] = None
+                       ) -> Iterator[UserIdPage]:
+    """1セグメント分のユーザIDをページ単位で逐次取得する
+    ページの最後に評価したユーザIDを開始位置に指定すると、続きのページから取得できる
+    同じ開始位置と件数上限を指定すれば、テーブルが変化しない限り同じページを取得できる
+
+    Args:
+        segment: セグメント番号
+        total_segments: セグメント数
+        start_key: 開始位置(前のページの最後に評価したユーザID)
+        all_companies_only: 全運営会社を通知対象とするユーザのみに絞り込む場合はTrue
+        limit: 1ページで評価する最大件数(絞り込み前の件数)
+
+    Raises:
+        e: ユーザ情報の取得に失敗
+
+    Yields:
+        ユーザIDのスキャン結果の1ページ
+    """
+    # 鉄道遅延情報用データはエリア毎のもの、通知処理の実行記録は配信記録も含めて除く
+    filter_expression = ('NOT begins_with(user_id, :railway) '
+                         'AND NOT begins_with(user_id, :run_id) '
+                         'AND NOT begins_with(user_id, :prefix)')
+    expression_value = {
+        ':railway': RAILWAY_ID,
+        ':run_id': NOTIFICATION_RUN_ID,
+        ':prefix': SUBSCRIBERS_PREFIX,
+    }
+    if all_companies_only:
+        filter_expression += \
+            ' AND (attribute_not_exists(companies) OR contains(companies, :all))'
+        expression_value[':all'] = ALL
+    scan_kwargs = {
+        'TableName': USERS_TABLE_NAME,
+        'ProjectionExpression': 'user_id',
+        'FilterExpression': filter_expression,
+        'ExpressionAttributeValues': attributes.encode_item(expression_value)
+    }
+    if total_segments > 1:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+    if limit:
+        scan_kwargs['Limit'] = limit
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = attributes.encode_item(
+            {'user_id': start_key})
+    while True:
+        try:
+            with metrics.span('aws.dynamodb.users_table.scan_page'):
+                response = utils.get_client().scan(**scan_kwargs)
+        except ClientError as e:
+            raise e
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        items = response['Items']
+        metrics.add('aws.dynamodb.users_table.scanned_items', response['ScannedCount'])
+        yield UserIdPage(
+            [item['user_id']['S'] for item in items],
+            last_evaluated_key['user_id']['S'] if last_evaluated_key else None
+        )
+        if not last_evaluated_key:
+            return
+        scan_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+
+def _decode_attributes(response: dict) -> dict:
+    """更新／削除結果に含まれる属性値をdict型に変換する
+
+    Args:
+        response: 更新／削除結果
+
+    Returns:
+        dict型の属性(属性が含まれない場合は空のdict)
+    """
+    return attributes.decode_item(response.get('Attributes', {}))
@@ -1,19 +1,31 @@
 """DynamoDB用ユーティリティモジュール"""
 
-import aws.config as aws
+import os
 
-db = aws.session.resource('dynamodb', config=aws.config)
+import aws.config as aws
+from utils import metrics
+from utils.lazy import lazy
 
 
-def replace_data(obj: object) -> object:
-    """登録・更新用データの置換処理
-    空文字はNoneに置換
+@lazy
+def get_client() -> object:
+    """DynamoDBの低レベルクライアントを初回使用時に生成して取得する
+    ローカル検証時はAWS_DYNAMODB_ENDPOINTでDynamoDB Localなどのエンドポイントを指定可能
     """
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            obj[key] = replace_data(value)
-    elif isinstance(obj, list):
-        [replace_data(element) for element in obj]
-    elif obj == '':
-        obj = None
-    return obj
+    client = aws.get_session().client(
+        'dynamodb',
+        config=aws.get_config(),
+        endpoint_url=os.getenv('AWS_DYNAMODB_ENDPOINT')
+    )
+    client.meta.events.register('after-call.dynamodb', _record_call)
+    return client
+
+
+def _record_call(http_response: object, parsed: dict, model: object,
+                 **kwargs) -> None:
+    """DynamoDBのAPI呼び出し回数と再試行回数をメトリクスに記録する"""
+    metrics.add('aws.dynamodb.calls', 1)
+    metrics.add(f"aws.dynamodb.{model.name}.calls", 1)
+    retry_attempts = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retry_attempts:
+        metrics.add('aws.dynamodb.retries', retry_attempts)
@@ -0,0 +1,134 @@
+"""通知処理のシャード振り分け用モジュール
+コーディネータ(通知処理)が作成したシャードを、ワーカ(シャード通知処理)に振り分ける
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from loguru import logger
+
+from aws.config import get_config, get_session
+
+# 定数群
+# 振り分け方式(local: 同じ呼び出し内で並行して実行, lambda: ワーカのLambda関数を非同期に呼び出す)
+DISPATCHER_TYPE = os.getenv('NOTIFICATION_DISPATCHER', 'local')
+# ワーカのLambda関数名
+WORKER_FUNCTION_NAME = os.getenv('NOTIFICATION_WORKER_FUNCTION', '')
+
+Worker = Callable[[dict, object], None]
+
+
+class ShardDispatcher(ABC):
+    """シャード振り分けの基底クラス"""
+
+    @abstractmethod
+    def dispatch(self, run_id: str, shard_keys: List[str]) -> None:
+        """シャード群をワーカに振り分ける
+
+        Args:
+            run_id: 実行ID
+            shard_keys: シャードのキーのリスト
+        """
+
+
+class InProcessDispatcher(ShardDispatcher):
+    """同じ呼び出し内でワーカを並行して実行する振り分けクラス
+    ローカル検証時や、ユーザ数が少なく1回の呼び出しで通知し終える場合に使用する
+    """
+
+    def __init__(self, worker: Worker) -> None:
+        """
+        Args:
+            worker: ワーカの処理
+        """
+        self._worker = worker
+
+    def dispatch(self, run_id: str, shard_keys: List[str]) -> None:
+        """シャード群をワーカで並行して処理し、全シャードの処理を待つ
+
+        Args:
+            run_id: 実行ID
+            shard_keys: シャードのキーのリスト
+        """
+        if not shard_keys:
+            return
+        with ThreadPoolExecutor(max_workers=len(shard_keys)) as executor:
+            futures = [
+                executor.submit(self._worker,
+                                create_worker_event(run_id, shard_key), None)
+                for shard_key in shard_keys
+            ]
+            for future in futures:
+                future.result()
+
+
+class LambdaDispatcher(ShardDispatcher):
+    """ワーカのLambda関数をシャード毎に非同期に呼び出す振り分けクラス
+    ワーカの処理は待たない
+    """
+
+    def __init__(self, function_name: str) -> None:
+        """
+        Args:
+            function_name: ワーカのLambda関数名
+        """
+        self._function_name = function_name
+        self._client = get_session().client('lambda', config=get_config())
+
+    def dispatch(self, run_id: str, shard_keys: List[str]) -> None:
+        """シャード毎にワーカのLambda関数を非同期に呼び出す
+
+        Args:
+            run_id: 実行ID
+            shard_keys: シャードのキーのリスト
+
+        Raises:
+            e: ワーカの呼び出しに失敗
+        """
+        for shard_key in shard_keys:
+            try:
+                self._client.invoke(
+                    FunctionName=self._function_name,
+                    InvocationType='Event',
+                    Payload=json.dumps(create_worker_event(run_id, shard_key))
+                )
+            except Exception as e:
+                logger.error("ワーカの呼び出しに失敗しました。 シャード: {}", shard_key)
+                raise e
+            logger.info("ワーカを呼び出しました。 関数名: {}, シャード: {}",
+                        self._function_name, shard_key)
+
+
+def create_worker_event(run_id: str, shard_key: str) -> dict:
+    """ワーカに渡すイベントを作成する
+
+    Args:
+        run_id: 実行ID
+        shard_key: シャードのキー
+
+    Returns:
+        ワーカのイベント
+    """
+    return {'run_id': run_id, 'shard': shard_key}
+
+
+def create_dispatcher(worker: Worker) -> ShardDispatcher:
+    """環境変数の設定に従って振り分けクラスを生成する
+
+    Args:
+        worker: 同じ呼び出し内で実行する場合のワーカの処理
+
+    Raises:
+        ValueError: 振り分け方式が正しく設定されていない
+
+    Returns:
+        振り分けクラス
+    """
+    if DISPATCHER_TYPE == 'local':
+        return InProcessDispatcher(worker)
+    if DISPATCHER_TYPE == 'lambda':
+        return LambdaDispatcher(WORKER_FUNCTION_NAME)
+    raise ValueError(f"振り分け方式が正しく設定されていません。振り分け方式: {DISPATCHER_TYPE}")
@@ -0,0 +1,132 @@
+"""テキストメッセージの意図判定用モジュール"""
+
+import json
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+from aws.dynamodb import delay_info
+from functions import texts
+
+# 定数群
+RULES_PATH = os.path.join(os.path.dirname(__file__), "intents.json")
+COMPANY_TYPES_BY_NAME = {
+    'ALL': delay_info.ALL,
+    'WEST_JR': delay_info.WEST_JR,
+    'HANKYU': delay_info.HANKYU,
+    'HANSHIN': delay_info.HANSHIN,
+}
+
+
+class Intent(NamedTuple):
+    """テキストメッセージの意図"""
+
+    name: str
+    # 優先度(小さいほど優先)
+    priority: int
+    # 鉄道遅延情報を応答する場合の運営会社種類
+    company_type: Optional[int]
+    # 固定の応答テキスト
+    text: Optional[str]
+
+
+class IntentClassifier:
+    """キーワードによる意図判定クラス
+    全キーワードを1つの正規表現にまとめ、テキストを1回走査するだけで意図を判定する
+    """
+
+    def __init__(self, rules: List[dict]) -> None:
+        """
+        Args:
+            rules: 優先度順の判定ルールリスト
+
+        Raises:
+            KeyError: 運営会社種類または応答テキストが正しく設定されていない
+            ValueError: 判定ルールにキーワードが設定されていない
+        """
+        self._intents = {}
+        for priority, rule in enumerate(rules):
+            company = rule.get('company')
+            text = rule.get('text')
+            intent = Intent(
+                name=rule['name'],
+                priority=priority,
+                company_type=COMPANY_TYPES_BY_NAME[company] if company else None,
+                text=getattr(texts, text) if text else None
+            )
+            for keyword in rule['keywords']:
+                # 複数のルールに同じキーワードがある場合は優先度の高いルールを採用する
+                self._intents.setdefault(keyword, intent)
+        if not self._intents:
+            raise ValueError("判定ルールにキーワードが設定されていません。")
+        # 同じ位置から始まるキーワードは長いものを優先して照合する
+        keywords = sorted(self._intents, key=len, reverse=True)
+        self._pattern = re.compile(
+            "|".join(re.escape(keyword) for keyword in keywords))
+        # 同じ位置から始まる短いキーワードは照合したキーワードの接頭辞となるため、
+        # キーワード毎に接頭辞となるキーワード(長い順)と、その中で最も優先度の高い意図を求めておく
+        self._prefixes = {
+            keyword: [prefix for prefix in keywords if keyword.startswith(prefix)]
+            for keyword in keywords
+        }
+        self._best_intents = {
+            keyword: min((self._intents[prefix] for prefix in prefixes),
+                         key=lambda intent: intent.priority)
+            for keyword, prefixes in self._prefixes.items()
+        }
+
+    def classify(self, text: str) -> Optional[Intent]:
+        """テキストメッセージの意図を判定する
+
+        Args:
+            text: テキスト
+
+        Returns:
+            最も優先度の高い意図(該当しない場合はNone)
+        """
+        best = None
+        match = self._pattern.search(text)
+        while match:
+            intent = self._best_intents[match.group()]
+            if best is None or intent.priority < best.priority:
+                best = intent
+                if best.priority == 0:
+                    break
+            # 重なり合うキーワードも検出できるよう、一致位置の次の文字から再度照合する
+            match = self._pattern.search(text, match.start() + 1)
+        return best
+
+    def extract_keywords(self, text: str) -> List[str]:
+        """テキストメッセージに含まれるキーワードを出現順に抽出する
+        同じ位置から始まるキーワードは長い順に抽出する
+        抽出したキーワードを連結したテキストは、元のテキストと同じ意図に判定される
+
+        Args:
+            text: テキスト
+
+        Returns:
+            キーワードリスト
+        """
+        keywords = []
+        match = self._pattern.search(text)
+        while match:
+            keywords.extend(self._prefixes[match.group()])
+            match = self._pattern.search(text, match.start() + 1)
+        return keywords
+
+
+def load_rules(path: str = RULES_PATH) -> List[dict]:
+    """判定ルールを読み込む
+
+    Args:
+        path: 判定ルールのパス
+
+    Returns:
+        優先度順の判定ルールリスト
+    """
+    with open(path, encoding='utf-8') as rules_file:
+        return json.load(rules_file)
+
+
+# コンテナ毎に一度だけ構築する
+classifier = IntentClassifier(load_rules())
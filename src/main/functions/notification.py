@@ -1,77 +1,358 @@
 """LINE Bot通知用"""
 
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator, List, Optional, Tuple
+
 from loguru import logger
 
 import railway
-from aws.dynamodb import delay_info, users_table
+from aws.dynamodb import delay_info, notification_run, users_table
+from aws.dynamodb.delivery_ledger import DeliveryLedger
+from aws.dynamodb.notification_run import NotificationRun
+from functions import dispatchers
 from line import line_bot_api
+from line.delivery import DeliveryStats
+from utils import logs, metrics
+from utils.lazy import lazy
+
+logs.configure()
 
 
+@metrics.instrument('notification')
 def main(event: dict, context: object) -> None:
-    """LINE通知処理
+    """LINE通知処理(コーディネータ)
+    鉄道遅延情報の変化を検知した場合、通知対象をシャードに分割した実行記録を作成し、シャードをワーカに振り分ける
+    未完了の実行記録がある場合は、未完了のシャードを振り分け直して続きから再開する
 
     Args:
         event: イベント
         context: コンテキスト
     """
     try:
-        db_delay_info = users_table.get_delay_info()
-        db_railway_delay_info_message = db_delay_info.messages.all
+        run = users_table.get_notification_run()
+        if run and not run.completed:
+            shard_keys = [shard_key for shard_key, progress in sorted(run.progress.items())
+                          if not progress['done']]
+            logger.info("未完了の通知を再開します。 実行ID: {}, シャード: {}", run.run_id, shard_keys)
+            get_dispatcher().dispatch(run.run_id, shard_keys)
+            run = users_table.get_notification_run()
+            if not run.completed:
+                logger.info("未完了のシャードがあるため、新たな通知は開始しません。 実行ID: {}", run.run_id)
+                return
 
-        latest_railway_delay_info_message = railway.request_delay_info_message(
-            delay_info.ALL)
-
-        if not validate_railway_delay_info(latest_railway_delay_info_message,
-                                           db_railway_delay_info_message):
+        db_delay_info = users_table.get_delay_info()
+        # 前回の通知処理で通知した鉄道遅延情報と比較する(通知処理の実行記録がない場合はDBの鉄道遅延情報と比較する)
+        notified_messages = run.messages if run else db_delay_info.messages
+        latest_messages = railway.request_delay_info_messages(db_delay_info)
+        if not has_delay_info_changed(latest_messages, notified_messages):
+            logger.info("最新の遅延情報は前回の通知処理から変化がありません。")
             return
 
-        notify_all_users_of_railway_delay_info(
-            latest_railway_delay_info_message)
+        # 新たに遅延した路線と運転を再開した路線のみを通知する
+        # (前回通知した遅延している路線が記録されていない場合は、最新の遅延情報全体を通知する)
+        deltas = railway.diff_messages(latest_messages, notified_messages)
+        # 全運営会社を通知対象とするユーザと、運営会社を個別に購読しているユーザ
+        if deltas is None:
+            notice_messages = latest_messages
+            company_types = [
+                company_type
+                for company_type in (delay_info.ALL, *delay_info.COMPANY_TYPES)
+                if validate_railway_delay_info(latest_messages, notified_messages,
+                                               company_type)
+            ]
+        else:
+            notice_messages = railway.generate_delta_messages(latest_messages, deltas)
+            company_types = [
+                company_type
+                for company_type in (delay_info.ALL, *delay_info.COMPANY_TYPES)
+                if deltas[company_type].changed
+            ]
+        new_run = create_notification_run(notice_messages, company_types)
+        if not users_table.start_notification_run(
+                new_run, run.run_id if run else None):
+            logger.info("他の呼び出しが通知を開始したため、処理を終了します。")
+            return
+        get_dispatcher().dispatch(new_run.run_id, sorted(new_run.progress))
     except Exception:
         logger.exception("通知処理に失敗しました。")
 
 
-def validate_railway_delay_info(latest_railway_delay_info_message: str,
-                                db_railway_delay_info_message: str) -> bool:
+@metrics.instrument('notification_worker')
+def worker(event: dict, context: object) -> None:
+    """LINE通知処理(ワーカ)
+    振り分けられた1シャード分のユーザに通知する
+    シャードのリースを取得できた場合のみ通知するため、同じシャードを重複して振り分けられても重複して通知しない
+
+    Args:
+        event: イベント(run_id: 実行ID, shard: シャードのキー)
+        context: コンテキスト
+    """
+    run_id = event['run_id']
+    shard_key = event['shard']
+    owner = str(uuid.uuid4())
+    try:
+        run = users_table.get_notification_run()
+        if not run or run.run_id != run_id or \
+                run.progress.get(shard_key, {'done': True})['done']:
+            logger.info("通知済みのシャードのため、処理を終了します。 実行ID: {}, シャード: {}",
+                        run_id, shard_key)
+            return
+        if not users_table.acquire_shard_lease(run_id, shard_key, owner):
+            logger.info("他のワーカが通知中のため、処理を終了します。 実行ID: {}, シャード: {}",
+                        run_id, shard_key)
+            return
+        notify_shard(run, shard_key, owner)
+    except Exception:
+        logger.exception("シャードの通知処理に失敗しました。 実行ID: {}, シャード: {}",
+                         run_id, shard_key)
+
+
+@lazy
+def get_dispatcher() -> dispatchers.ShardDispatcher:
+    """シャードの振り分けクラスを初回使用時に生成して取得する"""
+    return dispatchers.create_dispatcher(worker)
+
+
+def create_notification_run(messages: delay_info.Messages,
+                            company_types: List[int]) -> NotificationRun:
+    """通知処理の実行記録を作成する
+    全運営会社を通知対象とするユーザはスキャンのセグメント毎、購読者は運営会社毎にシャードを分ける
+    通知対象がない場合も、通知した鉄道遅延情報の記録として完了済みの実行記録を作成する
+
+    Args:
+        messages: 通知する鉄道遅延情報メッセージ群
+        company_types: 通知対象の運営会社種類リスト
+
+    Returns:
+        通知処理の実行記録
+    """
+    total_segments = users_table.SCAN_SEGMENTS
+    progress = {}
+    for company_type in company_types:
+        segments = total_segments if company_type == delay_info.ALL else 1
+        for segment in range(segments):
+            progress[notification_run.create_shard_key(company_type, segment)] = \
+                notification_run.create_progress()
+    timestamp_now = Decimal(datetime.utcnow().timestamp())
+    return NotificationRun(
+        user_id=users_table.NOTIFICATION_RUN_ID,
+        run_id=str(uuid.uuid4()),
+        messages=messages,
+        progress=progress,
+        total_segments=total_segments,
+        remaining_shards=len(progress),
+        completed=not progress,
+        started_time=timestamp_now,
+        updated_time=timestamp_now
+    )
+
+
+def notify_shard(run: NotificationRun, shard_key: str, owner: str) -> None:
+    """1シャード分のユーザに、記録された位置の続きから鉄道遅延情報を通知する
+    同じメッセージの配信記録がある場合は配信記録の位置の続きから通知し、進捗の記録前に配信記録を更新する
+    配信記録はチャンク毎に更新し、実行記録の進捗は一定間隔毎とシャードの完了時のみ記録する
+    最後のシャードの通知が完了した場合は実行記録を完了済みにする
+
+    Args:
+        run: 通知処理の実行記録
+        shard_key: シャードのキー
+        owner: リースの所有者ID
+
+    Raises:
+        e: ユーザ情報の取得、配信記録または進捗の記録に失敗
+    """
+    company_type, segment = notification_run.parse_shard_key(shard_key)
+    progress = run.progress[shard_key]
+    message = run.messages.extract_message(company_type)
+    ledger = DeliveryLedger(shard_key, run.total_segments, message)
+    delivered = ledger.load(run.run_id)
+    # 通知の中断時も除外したユーザ数を出力できるよう、配信記録の取得時に記録する
+    metrics.add('notification.suppressed_recipients', ledger.skipped)
+    cursor = delivered['cursor'] if delivered else progress['cursor']
+    logger.info("シャードの通知を開始します。 シャード: {}, 開始位置: {}", shard_key, cursor)
+
+    last_checkpoint = time.monotonic()
+
+    def _checkpoint(cursor: object, stats: DeliveryStats) -> None:
+        nonlocal last_checkpoint
+        # 配信記録の更新に失敗した場合は進捗を記録せず、記録済みの位置から再開させる
+        ledger.record(run.run_id, cursor,
+                      stats.recipients - stats.failed_recipients, done=False)
+        # 実行記録は全シャードで共有する1項目のため、チャンク毎ではなく一定間隔毎に進捗を記録してリースを延長する
+        # (チャンク毎の再開位置はシャード毎の配信記録から復元する)
+        if time.monotonic() - last_checkpoint < users_table.NOTIFICATION_RUN_CHECKPOINT_SECONDS:
+            return
+        users_table.checkpoint_shard(
+            run.run_id, shard_key, owner,
+            _merge_progress(progress, cursor, stats, ledger, done=False))
+        last_checkpoint = time.monotonic()
+
+    if delivered and delivered['done']:
+        logger.info("同じメッセージを配信済みのシャードのため、通知を省略します。 シャード: {}", shard_key)
+        chunks = iter(())
+    elif company_type == delay_info.ALL:
+        chunks = _iter_user_chunks(segment, run.total_segments, cursor)
+    else:
+        chunks = _iter_subscriber_chunks(company_type, cursor)
+    stats = line_bot_api.multicast_text_message_in_order(
+        chunks, message, f"{run.run_id}:{shard_key}", _checkpoint)
+
+    ledger.record(run.run_id, None,
+                  stats.recipients - stats.failed_recipients, done=True)
+    remaining_shards = users_table.checkpoint_shard(
+        run.run_id, shard_key, owner,
+        _merge_progress(progress, None, stats, ledger, done=True))
+    _log_stats(shard_key, stats, ledger)
+    if remaining_shards <= 0:
+        logger.success("通知処理が完了しました。 実行ID: {}", run.run_id)
+
+
+def _iter_user_chunks(segment: int, total_segments: int, cursor: Optional[str]
+                      ) -> Iterator[Tuple[List[str], Optional[str]]]:
+    """全運営会社を通知対象とするユーザのチャンクと再開位置をスキャンのページ単位で取得する
+    1ページを1チャンクとし、ページの最後に評価したユーザIDを再開位置とする
+
+    Args:
+        segment: スキャンのセグメント番号
+        total_segments: スキャンのセグメント数
+        cursor: 再開位置(未着手の場合はNone)
+
+    Raises:
+        e: ユーザ情報の取得に失敗
+
+    Yields:
+        ユーザIDのチャンクと再開位置
+    """
+    for page in users_table.scan_user_id_pages(
+            segment, total_segments, start_key=cursor,
+            limit=line_bot_api.MULTICAST_MAX_RECIPIENTS):
+        if page.user_ids:
+            yield page.user_ids, page.last_key
+
+
+def _iter_subscriber_chunks(company_type: int, cursor: Optional[str]
+                            ) -> Iterator[Tuple[List[str], Optional[str]]]:
+    """運営会社を個別に購読しているユーザのチャンクと再開位置を購読者のインデックスのページ単位で取得する
+    1ページを1チャンクとし、ページの最後のユーザIDを再開位置とする
+
+    Args:
+        company_type: 運営会社種類
+        cursor: 再開位置(未着手の場合はNone)
+
+    Raises:
+        e: 購読者の取得に失敗
+
+    Yields:
+        ユーザIDのチャンクと再開位置
+    """
+    for page in users_table.query_subscriber_id_pages(
+            company_type, start_key=cursor,
+            limit=line_bot_api.MULTICAST_MAX_RECIPIENTS):
+        if page.user_ids:
+            yield page.user_ids, page.last_key
+
+
+def _merge_progress(progress: dict, cursor: object, stats: DeliveryStats,
+                    ledger: DeliveryLedger, done: bool) -> dict:
+    """記録済みの進捗にこの呼び出しでの通知件数を加算した進捗を作成する
+    配信済みのため除外したユーザ数は、同じ実行の再開時も配信記録から引き継ぐため加算しない
+
+    Args:
+        progress: 記録済みの進捗
+        cursor: 再開位置
+        stats: この呼び出しでの通知の統計情報
+        ledger: この呼び出しでの配信記録
+        done: シャードの通知が完了した場合はTrue
+
+    Returns:
+        シャードの進捗
+    """
+    return {
+        'cursor': cursor,
+        'done': done,
+        'chunks': progress['chunks'] + stats.chunks,
+        'recipients': progress['recipients'] + stats.recipients,
+        'failed': progress['failed'] + stats.failed_recipients,
+        'suppressed': ledger.suppressed,
+    }
+
+
+def has_delay_info_changed(latest_messages: delay_info.Messages,
+                           notified_messages: delay_info.Messages) -> bool:
+    """前回の通知処理から遅延している路線群が変化したかどうか判定する
+    通知した鉄道遅延情報メッセージは差分のみの場合があるため、全運営会社のダイジェストで判定する
+    (ダイジェストが未登録の場合はメッセージ群で判定する)
+
+    Args:
+        latest_messages: 最新の鉄道遅延情報メッセージ群
+        notified_messages: 前回の通知処理で通知した鉄道遅延情報メッセージ群
+
+    Returns:
+        変化した場合はTrue
+    """
+    latest_digest = latest_messages.extract_digest(delay_info.ALL)
+    notified_digest = notified_messages.extract_digest(delay_info.ALL)
+    if latest_digest and notified_digest:
+        return latest_digest != notified_digest
+    return latest_messages != notified_messages
+
+
+def validate_railway_delay_info(latest_messages: delay_info.Messages,
+                                db_messages: delay_info.Messages,
+                                company_type: int) -> bool:
     """通知対象の鉄道遅延情報かどうか検証する
+    遅延している路線群のダイジェストで変化を判定し、ダイジェストが未登録の場合はメッセージで判定する
 
     Args:
-        latest_railway_delay_info_message: 最新の鉄道遅延情報
-        db_railway_delay_info_message: DBに登録されている鉄道遅延情報
+        latest_messages: 最新の鉄道遅延情報メッセージ群
+        db_messages: DBに登録されている鉄道遅延情報メッセージ群
+        company_type: 運営会社種類
 
     Returns:
         通知対象の鉄道遅延情報の場合はTrue
     """
-    if "遅延情報はありません。" in latest_railway_delay_info_message:
-        logger.info("通知対象の遅延情報はありません。")
+    latest_message = latest_messages.extract_message(company_type)
+    latest_digest = latest_messages.extract_digest(company_type)
+    db_digest = db_messages.extract_digest(company_type)
+    if "遅延情報はありません。" in latest_message:
+        logger.info("通知対象の遅延情報はありません。 運営会社種類: {}", company_type)
         return False
-    elif latest_railway_delay_info_message == db_railway_delay_info_message:
-        logger.info("最新の遅延情報は前回配信した遅延情報から変化がありません。")
+    elif latest_digest and db_digest:
+        if latest_digest == db_digest:
+            logger.info("最新の遅延情報は前回配信した遅延情報から変化がありません。 運営会社種類: {}",
+                        company_type)
+            return False
+    elif latest_message == db_messages.extract_message(company_type):
+        logger.info("最新の遅延情報は前回配信した遅延情報から変化がありません。 運営会社種類: {}",
+                    company_type)
         return False
     return True
 
 
-def notify_all_users_of_railway_delay_info(
-        railway_delay_info_message: str) -> None:
-    """全ユーザに鉄道遅延情報を通知する
+def _log_stats(shard_key: str, stats: DeliveryStats,
+               ledger: DeliveryLedger) -> None:
+    """シャードの通知の統計情報をログに出力する
 
     Args:
-        railway_delay_info_message: 鉄道遅延情報
-
-    Raises:
-        e: ユーザ情報の取得に失敗
+        shard_key: シャードのキー
+        stats: 通知の統計情報
+        ledger: 配信記録
     """
-    try:
-        users = users_table.scan_exclude_delay_info()
-    except Exception as e:
-        logger.error("ユーザ情報の取得に失敗しました。")
-        raise e
-
-    for user in users:
-        user_id = user.user_id
-        # 途中で例外が発生しても最後まで処理を続ける
-        try:
-            line_bot_api.push_text_message(user_id, railway_delay_info_message)
-        except Exception:
-            logger.opt(exception=True).warning(
-                "鉄道遅延情報の通知に失敗しましたが処理を続行します。 ユーザID: {}", user_id)
+    for failed_chunk in stats.failed_chunks:
+        logger.warning(
+            "鉄道遅延情報の通知に失敗したユーザが存在します。 ユーザID: {}", failed_chunk)
+    metrics.add('notification.chunks', stats.chunks)
+    metrics.add('notification.recipients', stats.recipients)
+    metrics.add('notification.failed_recipients', stats.failed_recipients)
+    metrics.add('notification.throttled_seconds', stats.throttled_seconds,
+                metrics.UNIT_SECONDS)
+    logger.info(
+        "鉄道遅延情報の通知が完了しました。 シャード: {}, チャンク数: {}, ユーザ数: {}, 失敗ユーザ数: {}, "
+        "配信済みのため除外したユーザ数: {}, 配信記録の更新ユーザ数: {}, "
+        "レート制限待機秒数: {:.3f}, 処理秒数: {:.3f}, スループット: {:.1f}ユーザ/秒",
+        shard_key, stats.chunks, stats.recipients, stats.failed_recipients,
+        ledger.skipped, ledger.recorded,
+        stats.throttled_seconds, stats.elapsed_seconds, stats.throughput)
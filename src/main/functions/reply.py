@@ -1,32 +1,71 @@
 """LINE Bot応答用"""
 
-import json
 import os
 import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
 from datetime import datetime
 from decimal import Decimal
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional
 
-from linebot import WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import (AudioMessage, FollowEvent, ImageMessage,
-                            LocationMessage, MessageEvent, StickerMessage,
-                            TextMessage, UnfollowEvent, VideoMessage)
 from loguru import logger
 
-import railway
 from aws.dynamodb import delay_info, users_table
-from functions import texts
-from line import line_bot_api
+from functions import intents, texts
+from line import line_bot_api, webhook
+from line.webhook import BatchWebhookHandler
+from utils import logs, metrics, trace
+from utils.lazy import lazy
+
+if TYPE_CHECKING:
+    from linebot.models import FollowEvent, MessageEvent, UnfollowEvent
 
 # 定数群
-TEN_MINUTES = 10 * 60
 FOLLOW_STAMP_PACKAGE_ID = 11537
 FOLLOW_STAMP_STICKER_ID = 52002734
+# 他の呼び出しが鉄道遅延情報を再取得している間の最大待機秒数と、最初の確認間隔(確認毎に倍にする)
+REFRESH_WAIT_SECONDS = 2
+REFRESH_POLL_INTERVAL = 0.25
+# 鮮度の有効秒数を過ぎても、応答を待たせずにDBの鉄道遅延情報を使用する最大経過秒数
+# (この範囲内では応答後に再取得し、超えた場合は応答前に再取得する)
+MAX_STALENESS_SECONDS = int(os.getenv('DELAY_INFO_MAX_STALENESS', '3600'))
+# 応答後の再取得の完了を待機する間、Lambdaのタイムアウトまでに残す秒数
+BACKGROUND_REFRESH_MARGIN_SECONDS = 0.5
+# コンテキストから残り時間を取得できない場合(ローカルでの実行時)に、応答後の再取得の完了を待機する最大秒数
+BACKGROUND_REFRESH_TIMEOUT = 10
+SUBSCRIBE_COMMAND = "通知設定"
+UNSUBSCRIBE_COMMAND = "通知解除"
+# Webhookのイベント群を並行して処理する最大スレッド数
+WEBHOOK_WORKERS = int(os.getenv('LINE_WEBHOOK_WORKERS', '4'))
+# 再送されたイベントの判定用に保持する処理済みのWebhookイベントIDの最大件数
+MAX_PROCESSED_EVENT_IDS = 10000
+
+logs.configure()
 
 # LINE Bot設定
-handler = WebhookHandler(os.environ['LINE_CHANNEL_SECRET'])
+handler = BatchWebhookHandler(
+    os.environ['LINE_CHANNEL_SECRET'], WEBHOOK_WORKERS, MAX_PROCESSED_EVENT_IDS)
+
+
+class ResolvedMessages(NamedTuple):
+    """応答に使用する鉄道遅延情報メッセージ群"""
+
+    messages: delay_info.Messages
+    # 鉄道遅延情報を取得または最新であることを確認した日時
+    updated_time: Decimal
+
+
+# 1回の呼び出し内で鉄道遅延情報メッセージ群の取得を共有するための取得処理
+_invocation_messages: ContextVar[Optional[Callable[[], ResolvedMessages]]] = \
+    ContextVar('invocation_messages', default=None)
+# 応答後に実行する鉄道遅延情報の再取得処理
+_background_refresh: Optional[threading.Thread] = None
+_background_refresh_lock = threading.Lock()
 
 
+@metrics.instrument('reply')
 def main(event: dict, context: object):
     """LINEイベントに対する応答処理
 
@@ -34,23 +73,38 @@ def main(event: dict, context: object):
         event: リクエストイベント
         context: コンテキスト
     """
-    logger.info("リクエストデータ: {}", json.dumps(event, ensure_ascii=False))
+    # リクエストボディは別に出力するため、リクエストデータからは除く
+    logs.payload("リクエストデータ: {}",
+                 {key: value for key, value in event.items() if key != 'body'})
 
     signature = event['headers']['x-line-signature']
     webhook_event = event['body']
-    logger.info("リクエストボディ: {}", webhook_event)
+    logs.payload("リクエストボディ: {}", webhook_event)
+    if trace.ENABLED:
+        trace.record(trace.KIND_WEBHOOK,
+                     body=webhook.sanitize_body(webhook_event, sanitize_text))
+
+    # Webhookの処理時にSDKを読み込むため、例外クラスもここでインポートする(コールドスタートを軽くする)
+    from linebot.exceptions import InvalidSignatureError
 
     # 各関数にて処理を実施
+    # 鉄道遅延情報の取得(DBへの問い合わせと取得先への再取得)は、1回の呼び出しにつき最大1回とする
+    token = _invocation_messages.set(lazy(resolve_railway_delay_info_messages))
     try:
         handler.handle(webhook_event, signature)
     except InvalidSignatureError:
         logger.exception("署名の検証に失敗しました。")
     except Exception:
         logger.exception("応答処理に失敗しました。")
+    finally:
+        _invocation_messages.reset(token)
+        # 呼び出しの終了後はコンテナが停止するため、タイムアウトしない範囲で応答後の再取得の完了を待つ
+        wait_background_refresh(get_background_refresh_timeout(context))
+    logger.info("再送により破棄したイベント数(累計): {}", handler.duplicates)
 
 
-@handler.add(FollowEvent)
-def handle_follow(line_event: FollowEvent) -> None:
+@handler.add('FollowEvent')
+def handle_follow(line_event: 'FollowEvent') -> None:
     """フォロー時に対する処理を実施
 
     Args:
@@ -77,8 +131,8 @@ def handle_follow(line_event: FollowEvent) -> None:
     logger.success("LINEイベント(フォロー)の処理に成功しました。 ユーザID: {}", user_id)
 
 
-@handler.add(UnfollowEvent)
-def handle_unfollow(line_event: UnfollowEvent) -> None:
+@handler.add('UnfollowEvent')
+def handle_unfollow(line_event: 'UnfollowEvent') -> None:
     """フォロー解除時に対する処理を実施
 
     Args:
@@ -98,8 +152,8 @@ def handle_unfollow(line_event: UnfollowEvent) -> None:
     logger.success("LINEイベント(フォロー解除)の処理に成功しました。 ユーザID: {}", user_id)
 
 
-@handler.add(MessageEvent, message=TextMessage)
-def handle_text_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='TextMessage')
+def handle_text_message(line_event: 'MessageEvent') -> None:
     """テキストメッセージに対する処理を実施
 
     Args:
@@ -108,12 +162,16 @@ def handle_text_message(line_event: MessageEvent) -> None:
     logger.info("LINEイベント(テキストメッセージ): {}", line_event)
     user_id = line_event.source.user_id
 
-    text = create_reply_text(line_event.message.text)
+    message_text = line_event.message.text
+    if message_text.startswith((SUBSCRIBE_COMMAND, UNSUBSCRIBE_COMMAND)):
+        text = create_subscription_reply_text(user_id, message_text)
+    else:
+        text = create_reply_text(message_text)
     line_bot_api.reply_text_message(line_event.reply_token, user_id, text)
 
 
-@handler.add(MessageEvent, message=StickerMessage)
-def handle_stamp_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='StickerMessage')
+def handle_stamp_message(line_event: 'MessageEvent') -> None:
     """スタンプメッセージに対する処理を実施
 
     Args:
@@ -127,8 +185,8 @@ def handle_stamp_message(line_event: MessageEvent) -> None:
         line_event.reply_token, user_id, package_id, sticker_id)
 
 
-@handler.add(MessageEvent, message=AudioMessage)
-def handle_audio_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='AudioMessage')
+def handle_audio_message(line_event: 'MessageEvent') -> None:
     """音声メッセージに対する処理を実施
 
     Args:
@@ -141,8 +199,8 @@ def handle_audio_message(line_event: MessageEvent) -> None:
         line_event.reply_token, user_id, texts.AUDIO)
 
 
-@handler.add(MessageEvent, message=ImageMessage)
-def handle_image_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='ImageMessage')
+def handle_image_message(line_event: 'MessageEvent') -> None:
     """画像メッセージに対する処理を実施
 
     Args:
@@ -155,8 +213,8 @@ def handle_image_message(line_event: MessageEvent) -> None:
         line_event.reply_token, user_id, texts.IMAGE)
 
 
-@handler.add(MessageEvent, message=LocationMessage)
-def handle_location_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='LocationMessage')
+def handle_location_message(line_event: 'MessageEvent') -> None:
     """位置情報メッセージに対する処理を実施
 
     Args:
@@ -169,8 +227,8 @@ def handle_location_message(line_event: MessageEvent) -> None:
         line_event.reply_token, user_id, texts.LOCATION)
 
 
-@handler.add(MessageEvent, message=VideoMessage)
-def handle_video_message(line_event: MessageEvent) -> None:
+@handler.add('MessageEvent', message='VideoMessage')
+def handle_video_message(line_event: 'MessageEvent') -> None:
     """動画メッセージに対する処理を実施
 
     Args:
@@ -192,34 +250,116 @@ def create_reply_text(text: str) -> str:
     Returns:
         応答テキスト
     """
-    if ("jr" in text) or ("Jr" in text) or ("JR" in text) or ("西" in text):
-        reply_text = get_railway_delay_info(delay_info.WEST_JR)
-    elif ("阪急" in text) or ("はんきゅう" in text):
-        reply_text = get_railway_delay_info(delay_info.HANKYU)
-    elif ("阪神" in text) or ("はんしん" in text):
-        reply_text = get_railway_delay_info(delay_info.HANSHIN)
-    elif ("全" in text) or ("教" in text) or ("確認" in text) or (
-            "遅延" in text) or ("現状" in text):
-        reply_text = get_railway_delay_info(delay_info.ALL)
-    elif ("使い方" in text):
-        reply_text = texts.HOW_TO_USE
-    elif ("せん" in text) or ("ばか" in text) or ("あほ" in text) or (
-            "さよなら" in text) or ("それだと" in text) or ("違う" in text):
-        reply_text = texts.COMPLAINT
-    elif ("ありがと" in text) or ("どうも" in text):
-        reply_text = texts.APPRECIATION
-    elif ("おはよ" in text):
-        reply_text = texts.GREETING_MORNING
-    elif ("こんばん" in text):
-        reply_text = texts.GREETING_EVENING
-    else:
+    intent = intents.classifier.classify(text)
+    if intent is None:
         reply_text = texts.UNSUPPORTED
+    elif intent.company_type is not None:
+        reply_text = get_railway_delay_info(intent.company_type)
+    else:
+        reply_text = intent.text
 
     return reply_text
 
 
+def sanitize_text(text: str) -> str:
+    """トレース記録用に、テキストメッセージから応答内容の判定に使用する部分のみを残す
+
+    Args:
+        text: テキスト
+
+    Returns:
+        通知設定のコマンドとキーワードのみからなるテキスト
+    """
+    for command in (SUBSCRIBE_COMMAND, UNSUBSCRIBE_COMMAND):
+        if text.startswith(command):
+            return command + " ".join(
+                intents.classifier.extract_keywords(text[len(command):]))
+    return " ".join(intents.classifier.extract_keywords(text))
+
+
+def detect_company_type(text: str) -> Optional[int]:
+    """テキストメッセージから運営会社種類を判定する
+
+    Args:
+        text: テキスト
+
+    Returns:
+        運営会社種類(該当しない場合はNone)
+    """
+    intent = intents.classifier.classify(text)
+    return intent.company_type if intent else None
+
+
+def create_subscription_reply_text(user_id: str, text: str) -> str:
+    """通知設定のテキストメッセージに対する応答テキストを作成
+    運営会社が指定されていない場合は現在の通知設定を応答する
+
+    Args:
+        user_id: ユーザID
+        text: テキスト
+
+    Returns:
+        応答テキスト
+    """
+    subscribe = text.startswith(SUBSCRIBE_COMMAND)
+    company_type = detect_company_type(
+        text[len(SUBSCRIBE_COMMAND if subscribe else UNSUBSCRIBE_COMMAND):])
+    try:
+        user = users_table.get_user(user_id)
+        if not user:
+            logger.error("ユーザ情報が登録されていません。 ユーザID: {}", user_id)
+            return texts.FAIL_UPDATE_SUBSCRIPTION
+        if company_type is None:
+            return _create_subscription_status_text(user.companies)
+
+        if delay_info.ALL in user.companies:
+            companies = set(delay_info.COMPANY_TYPES)
+        else:
+            companies = set(user.companies)
+        if company_type == delay_info.ALL:
+            companies = set(delay_info.COMPANY_TYPES) if subscribe else set()
+        elif subscribe:
+            companies.add(company_type)
+        else:
+            companies.discard(company_type)
+        # 全運営会社を購読する場合は、全運営会社分をまとめたメッセージを通知する
+        if companies == set(delay_info.COMPANY_TYPES):
+            new_companies = [delay_info.ALL]
+        else:
+            new_companies = sorted(companies)
+
+        users_table.update_subscription(user_id, new_companies)
+    except Exception:
+        logger.exception("通知設定の変更に失敗しました。 ユーザID: {}", user_id)
+        return texts.FAIL_UPDATE_SUBSCRIPTION
+    logger.success("通知設定の変更に成功しました。 ユーザID: {}, 通知対象: {}",
+                   user_id, new_companies)
+
+    company_name = delay_info.COMPANY_NAMES[company_type]
+    return (texts.SUBSCRIBE if subscribe else texts.UNSUBSCRIBE).format(
+        company_name)
+
+
+def _create_subscription_status_text(companies: List[int]) -> str:
+    """現在の通知設定を表すテキストを作成
+
+    Args:
+        companies: 通知対象の運営会社種類リスト
+
+    Returns:
+        通知設定のテキスト
+    """
+    if not companies:
+        return texts.NO_SUBSCRIPTION
+    company_names = "、".join(
+        delay_info.COMPANY_NAMES[company] for company in companies)
+    return texts.SUBSCRIPTION_STATUS.format(company_names)
+
+
 def get_railway_delay_info(company_type: int) -> str:
     """鉄道遅延情報を取得する
+    Webhookの処理中は、同じ呼び出し内の他のイベントと取得結果を共有する
+    鉄道遅延情報には、取得してからの経過時間を付記する
 
     Args:
         company_type: 運営会社種類
@@ -227,16 +367,155 @@ def get_railway_delay_info(company_type: int) -> str:
     Returns:
         鉄道遅延情報
     """
-    db_delay_info = users_table.get_delay_info()
-    timestamp_now = Decimal(datetime.utcnow().timestamp())
+    get_messages = _invocation_messages.get() or \
+        resolve_railway_delay_info_messages
+    resolved = get_messages()
+    return resolved.messages.extract_message(company_type) + \
+        _create_data_age_text(resolved.updated_time)
+
+
+def _create_data_age_text(updated_time: Decimal) -> str:
+    """鉄道遅延情報の取得からの経過時間を表すテキストを作成
+
+    Args:
+        updated_time: 鉄道遅延情報を取得または最新であることを確認した日時
+
+    Returns:
+        経過時間のテキスト
+    """
+    elapsed_minutes = int(
+        (Decimal(datetime.utcnow().timestamp()) - updated_time) // 60)
+    if elapsed_minutes < 1:
+        return texts.DATA_AGE_LATEST
+    return texts.DATA_AGE.format(elapsed_minutes)
+
+
+def resolve_railway_delay_info_messages() -> ResolvedMessages:
+    """応答に使用する鉄道遅延情報メッセージ群を取得する
+    鮮度の有効秒数を過ぎていても最大経過秒数以内であれば、DBの鉄道遅延情報で応答し、応答後に再取得する
+    最大経過秒数を超えている場合は応答前に再取得し、再取得に失敗した場合はDBの鉄道遅延情報で応答する
+
+    Returns:
+        鉄道遅延情報メッセージ群
+    """
+    db_delay_info = users_table.get_cached_delay_info()
+    db_resolved = ResolvedMessages(db_delay_info.messages, db_delay_info.updated_time)
+    elapsed = Decimal(datetime.utcnow().timestamp()) - db_delay_info.updated_time
     # 過度なリクエストを避けるため、一定時間内であればDBに登録されている鉄道遅延情報を代用する
-    if (db_delay_info.updated_time + TEN_MINUTES) > timestamp_now:
-        delay_info_message = db_delay_info.messages.extract_message(
-            company_type)
-        logger.info("DBに登録されている鉄道遅延情報を使用: {}", delay_info_message)
-    else:
-        delay_info_message = railway.request_delay_info_message(company_type)
-    return delay_info_message
+    if elapsed < delay_info.TEN_MINUTES:
+        logger.info("DBに登録されている鉄道遅延情報を使用: {}", db_delay_info.messages)
+        return db_resolved
+    if elapsed < MAX_STALENESS_SECONDS:
+        logger.info("DBに登録されている鉄道遅延情報を使用し、応答後に再取得します。 経過秒数: {}", elapsed)
+        metrics.add('functions.reply.stale_served', 1)
+        start_background_refresh(db_delay_info)
+        return db_resolved
+    try:
+        return refresh_railway_delay_info(db_delay_info)
+    except Exception:
+        logger.opt(exception=True).warning(
+            "鉄道遅延情報の再取得に失敗したため、DBに登録されている鉄道遅延情報を使用: {}",
+            db_delay_info.messages)
+        metrics.add('functions.reply.stale_served', 1)
+        return db_resolved
+
+
+def refresh_railway_delay_info(
+        db_delay_info: delay_info.DelayInfo) -> ResolvedMessages:
+    """鉄道遅延情報を再取得する
+    取得先に同時にリクエストが集中しないよう、リースを取得できた呼び出しのみが再取得する
+    リースを取得できなかった場合は確認間隔を延ばしながら再取得結果を一定時間待ち、
+    それでも更新されなければDBの鉄道遅延情報を代用する
+
+    Args:
+        db_delay_info: DBに登録されている鉄道遅延情報
+
+    Raises:
+        e: 鉄道遅延情報の再取得に失敗
+
+    Returns:
+        鉄道遅延情報メッセージ群
+    """
+    # 取得先への接続が必要になるまでrailway(requests)の読み込みを遅らせ、コールドスタートを軽くする
+    import railway
+
+    owner = str(uuid.uuid4())
+    if users_table.acquire_refresh_lease(owner):
+        try:
+            messages = railway.request_delay_info_messages(db_delay_info)
+            return ResolvedMessages(messages, Decimal(datetime.utcnow().timestamp()))
+        finally:
+            users_table.release_refresh_lease(owner)
+
+    logger.info("他の呼び出しが鉄道遅延情報を再取得中のため、更新を待機します。")
+    deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+    interval = REFRESH_POLL_INTERVAL
+    while time.monotonic() < deadline:
+        time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+        interval *= 2
+        latest_delay_info = users_table.get_delay_info()
+        if latest_delay_info.updated_time > db_delay_info.updated_time:
+            users_table.delay_info_cache.set(latest_delay_info)
+            return ResolvedMessages(latest_delay_info.messages, latest_delay_info.updated_time)
+
+    logger.warning("鉄道遅延情報の再取得を待機しましたが更新されないため、DBに登録されている鉄道遅延情報を使用: {}",
+                   db_delay_info.messages)
+    return ResolvedMessages(db_delay_info.messages, db_delay_info.updated_time)
+
+
+def start_background_refresh(db_delay_info: delay_info.DelayInfo) -> None:
+    """応答を待たせないよう、鉄道遅延情報を別スレッドで再取得する
+    再取得中の場合は新たに開始しない
+
+    Args:
+        db_delay_info: DBに登録されている鉄道遅延情報
+    """
+    global _background_refresh
+    with _background_refresh_lock:
+        if _background_refresh and _background_refresh.is_alive():
+            return
+        _background_refresh = threading.Thread(
+            target=_refresh_in_background, args=(db_delay_info,), daemon=True)
+        _background_refresh.start()
+
+
+def get_background_refresh_timeout(context: object) -> float:
+    """応答後の再取得の完了を待機できる秒数を、Lambdaの残り時間から算出する
+
+    Args:
+        context: コンテキスト
+
+    Returns:
+        待機できる秒数(残り時間を取得できない場合はBACKGROUND_REFRESH_TIMEOUT)
+    """
+    get_remaining_time = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining_time is None:
+        return BACKGROUND_REFRESH_TIMEOUT
+    return max(0.0, get_remaining_time() / 1000 - BACKGROUND_REFRESH_MARGIN_SECONDS)
+
+
+def wait_background_refresh(timeout: float = BACKGROUND_REFRESH_TIMEOUT) -> None:
+    """応答後の再取得の完了を待機する
+
+    Args:
+        timeout: 最大待機秒数
+    """
+    with _background_refresh_lock:
+        refresh = _background_refresh
+    if refresh is None:
+        return
+    refresh.join(timeout)
+    if refresh.is_alive():
+        logger.warning("応答後の鉄道遅延情報の再取得が完了しませんでした。")
+
+
+def _refresh_in_background(db_delay_info: delay_info.DelayInfo) -> None:
+    """鉄道遅延情報を再取得し、失敗した場合はログに出力する"""
+    try:
+        with metrics.span('functions.reply.background_refresh'):
+            refresh_railway_delay_info(db_delay_info)
+    except Exception:
+        logger.exception("応答後の鉄道遅延情報の再取得に失敗しました。")
 
 
 def create_random_stamp_ids(rnd: int) -> tuple:
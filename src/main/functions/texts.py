@@ -8,7 +8,12 @@ HOW_TO_USE = """兵庫～大阪間の鉄道の運行状況をお知らせしま
 ・JR
 ・阪急
 ・阪神
-・全部"""
+・全部
+通知する鉄道会社は以下のようなメッセージで設定できます。
+・通知設定 阪神
+・通知解除 JR
+・通知設定 全部
+・通知設定"""
 COMPLAINT = "メッセージありがとうございます。改善に努めてまいります。"
 APPRECIATION = "ありがとうございます。お役に立てて嬉しいです。\nまたいつでも話しかけてください。"
 GREETING_MORNING = "おはようございます！\n今日も一日頑張ってください。"
@@ -19,3 +24,11 @@ AUDIO = "申し訳ございません。\n音声には対応しておりません
 IMAGE = "申し訳ございません。\n画像には対応しておりません。"
 LOCATION = "申し訳ございません。\n位置情報には対応しておりません。"
 VIDEO = "申し訳ございません。\n動画には対応しておりません。"
+SUBSCRIBE = "{}の遅延情報をお知らせするように設定しました。"
+UNSUBSCRIBE = "{}の遅延情報をお知らせしないように設定しました。"
+SUBSCRIPTION_STATUS = "現在、{}の遅延情報をお知らせしています。"
+NO_SUBSCRIPTION = "現在、遅延情報のお知らせを停止しています。"
+DATA_AGE = "\n（{}分前に取得した情報です）"
+DATA_AGE_LATEST = "\n（最新の情報です）"
+FAIL_UPDATE_SUBSCRIPTION = """すみません、通知設定の変更に失敗しました。
+お手数ですが、時間をおいて再度お試しください。"""
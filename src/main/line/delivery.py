@@ -0,0 +1,151 @@
+"""LINE Bot API並行送信用モジュール"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Iterable, List, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+T = TypeVar('T')
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限クラス
+    スレッド間で共有し、1秒あたりのリクエスト数を上限以下に抑える
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        """
+        Args:
+            rate: 1秒あたりに補充するトークン数
+            capacity: バケットに貯められる最大トークン数
+
+        Raises:
+            ValueError: 補充レートまたは最大トークン数が正しく設定されていない
+        """
+        if rate <= 0 or capacity < 1:
+            raise ValueError(
+                f"レート制限が正しく設定されていません。補充レート: {rate}, 最大トークン数: {capacity}")
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """トークンを1つ取得する
+        トークンが不足している場合は補充されるまで待機する
+
+        Returns:
+            トークン取得までの待機秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+            waited += wait
+
+
+@dataclass
+class DeliveryStats:
+    """並行送信の統計情報クラス"""
+
+    chunks: int = 0
+    recipients: int = 0
+    failed_chunks: List[List[str]] = field(default_factory=list)
+    throttled_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def failed_recipients(self) -> int:
+        """送信に失敗したユーザ数"""
+        return sum(len(chunk) for chunk in self.failed_chunks)
+
+    @property
+    def throughput(self) -> float:
+        """1秒あたりの送信ユーザ数"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return (self.recipients - self.failed_recipients) / self.elapsed_seconds
+
+
+def deliver_in_order(chunks: Iterable[Tuple[List[str], T]],
+                     send: Callable[[List[str], T], None],
+                     workers: int,
+                     bucket: TokenBucket,
+                     checkpoint: Callable[[T, DeliveryStats], None]) -> DeliveryStats:
+    """ユーザIDのチャンク群を並行して送信し、送信を終えた位置を記録する
+    先頭から連続して送信を終えたチャンクまでを記録するため、記録した位置から再開すれば未送信のチャンクを漏らさない
+    途中のチャンクで送信に失敗しても最後まで処理を続ける(失敗したチャンクも送信済みとして扱う)
+    統計情報は送信を終えたチャンクのみを集計する
+
+    Args:
+        chunks: ユーザIDのチャンクと、そのチャンクを送信し終えた後の再開位置の組の群
+        send: 1チャンク分の送信処理(チャンクと再開位置を受け取る)
+        workers: ワーカ数
+        bucket: 共有するレート制限
+        checkpoint: 再開位置と統計情報の記録処理(呼び出し元のスレッドで実行する)
+
+    Raises:
+        ValueError: ワーカ数が1未満
+
+    Returns:
+        送信の統計情報
+    """
+    if workers < 1:
+        raise ValueError(f"ワーカ数は1以上を指定してください。ワーカ数: {workers}")
+    stats = DeliveryStats()
+    pending: Deque[Tuple[Future, List[str], T]] = deque()
+
+    def _send(chunk: List[str], position: T) -> Optional[float]:
+        try:
+            waited = bucket.acquire()
+            send(chunk, position)
+        except Exception:
+            logger.opt(exception=True).warning(
+                "チャンクの送信に失敗しましたが処理を続行します。 ユーザ数: {}", len(chunk))
+            return None
+        return waited
+
+    def _commit(wait_count: int) -> None:
+        # 先頭から連続して送信を終えたチャンクを集計し、最後の再開位置を記録する
+        committed = False
+        position = None
+        while pending and (wait_count > 0 or pending[0][0].done()):
+            future, chunk, position = pending.popleft()
+            waited = future.result()
+            wait_count -= 1
+            stats.chunks += 1
+            stats.recipients += len(chunk)
+            if waited is None:
+                stats.failed_chunks.append(chunk)
+            else:
+                stats.throttled_seconds += waited
+            committed = True
+        if committed:
+            checkpoint(position, stats)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk, position in chunks:
+            # 未送信のチャンクを溜め込まないよう、処理中のチャンク数はワーカ数の2倍までに制限する
+            if len(pending) >= workers * 2:
+                _commit(1)
+            pending.append(
+                (executor.submit(_send, chunk, position), chunk, position))
+            _commit(0)
+        _commit(len(pending))
+    stats.elapsed_seconds = time.monotonic() - started
+    return stats
@@ -1,16 +1,79 @@
-"""LINE Bot API用モジュール"""
+"""LINE Bot API用モジュール
+コールドスタートを軽くするため、LINE Bot SDKは初回使用時にインポートする
+"""
 
 import os
+import threading
+import uuid
+from typing import (TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional,
+                    Tuple, TypeVar)
 
-from linebot import LineBotApi
-from linebot.exceptions import LineBotApiError
-from linebot.models import StickerSendMessage, TextSendMessage
 from loguru import logger
 
-# LINE Bot設定
-line_bot_api = LineBotApi(os.environ['LINE_CHANNEL_ACCESS_TOKEN'])
+from line.delivery import DeliveryStats, TokenBucket, deliver_in_order
+from utils import metrics
+from utils.lazy import lazy
 
+if TYPE_CHECKING:
+    from linebot import LineBotApi
 
+T = TypeVar('T')
+
+# 定数群
+# マルチキャストで一度に送信可能な最大ユーザ数
+MULTICAST_MAX_RECIPIENTS = 500
+# 並行送信のワーカ数
+DELIVERY_WORKERS = int(os.getenv('LINE_DELIVERY_WORKERS', '4'))
+# LINE Messaging APIへの1秒あたりの最大リクエスト数
+API_RATE_LIMIT = float(os.getenv('LINE_API_RATE_LIMIT', '200'))
+
+# 再試行キーを指定したリクエストが受理済みの場合のステータスコード
+STATUS_CONFLICT = 409
+
+# 全送信処理で共有するレート制限
+rate_limiter = TokenBucket(API_RATE_LIMIT)
+# 再試行キーを指定して送信する場合のスレッド毎のクライアント
+_thread_local = threading.local()
+
+
+@lazy
+def get_line_bot_api() -> 'LineBotApi':
+    """LINE Bot APIクライアントを初回使用時に生成して取得する
+    ローカル検証時はLINE_API_ENDPOINTでスタブのエンドポイントを指定可能
+    """
+    return _create_line_bot_api()
+
+
+def _get_thread_line_bot_api() -> 'LineBotApi':
+    """スレッド毎のLINE Bot APIクライアントを取得する
+    SDKは再試行キーをクライアント共通のヘッダに設定するため、並行して送信する場合はスレッド毎に使い分ける
+    """
+    line_bot_api = getattr(_thread_local, 'line_bot_api', None)
+    if line_bot_api is None:
+        line_bot_api = _thread_local.line_bot_api = _create_line_bot_api()
+    return line_bot_api
+
+
+@lazy
+def _import_sdk() -> None:
+    """LINE Bot SDKを一度だけインポートする
+    SDKは複数スレッドから同時に初回インポートすると循環インポートで失敗するため、並行送信の前に呼び出す
+    """
+    import linebot.exceptions  # noqa: F401
+    import linebot.models  # noqa: F401
+
+
+def _create_line_bot_api() -> 'LineBotApi':
+    """LINE Bot APIクライアントを生成する"""
+    from linebot import LineBotApi
+
+    return LineBotApi(
+        os.environ['LINE_CHANNEL_ACCESS_TOKEN'],
+        endpoint=os.getenv('LINE_API_ENDPOINT', LineBotApi.DEFAULT_API_ENDPOINT)
+    )
+
+
+@metrics.timed
 def reply_text_message(reply_token: str, user_id: str, text: str) -> None:
     """テキストメッセージを応答する
 
@@ -22,14 +85,18 @@ def reply_text_message(reply_token: str, user_id: str, text: str) -> None:
     Raises:
         error: テキストメッセージの応答に失敗
     """
+    from linebot.exceptions import LineBotApiError
+    from linebot.models import TextSendMessage
+
     logger.info("ユーザID: {}, 応答テキストメッセージ: {}", user_id, text)
     try:
-        line_bot_api.reply_message(reply_token, TextSendMessage(text=text))
+        get_line_bot_api().reply_message(reply_token, TextSendMessage(text=text))
     except LineBotApiError as error:
         logger.error("テキストメッセージの応答に失敗しました。 ユーザID: {}", user_id)
         raise error
 
 
+@metrics.timed
 def reply_stamp_message(reply_token: str, user_id: str,
                         package_id: int, sticker_id: int) -> None:
     """スタンプメッセージを応答する
@@ -43,12 +110,15 @@ def reply_stamp_message(reply_token: str, user_id: str,
     Raises:
         error: スタンプメッセージの応答に失敗
     """
+    from linebot.exceptions import LineBotApiError
+    from linebot.models import StickerSendMessage
+
     logger.info(
         "ユーザID: {}, 応答スタンプメッセージ: [パッケージID: {}, スタンプID: {}]",
         user_id, package_id, sticker_id
     )
     try:
-        line_bot_api.reply_message(
+        get_line_bot_api().reply_message(
             reply_token,
             StickerSendMessage(
                 package_id=package_id,
@@ -60,6 +130,7 @@ def reply_stamp_message(reply_token: str, user_id: str,
         raise error
 
 
+@metrics.timed
 def push_text_message(user_id: str, text: str) -> None:
     """テキストメッセージを通知する
 
@@ -70,9 +141,103 @@ def push_text_message(user_id: str, text: str) -> None:
     Raises:
         error: テキストメッセージの通知に失敗
     """
+    from linebot.exceptions import LineBotApiError
+    from linebot.models import TextSendMessage
+
     logger.info("ユーザID: {}, 通知テキストメッセージ: {}", user_id, text)
     try:
-        line_bot_api.push_message(user_id, TextSendMessage(text=text))
+        get_line_bot_api().push_message(user_id, TextSendMessage(text=text))
     except LineBotApiError as error:
         logger.error("テキストメッセージの通知に失敗しました。 ユーザID: {}", user_id)
         raise error
+
+
+@metrics.timed
+def multicast_text_message(user_ids: List[str], text: str,
+                           retry_key: Optional[str] = None) -> None:
+    """テキストメッセージを複数ユーザに一斉通知する
+    再試行キーを指定した場合、同じキーで受理済みのリクエストは再送しない
+
+    Args:
+        user_ids: ユーザIDリスト(最大500件)
+        text: メッセージのテキスト
+        retry_key: 再試行キー(UUID)
+
+    Raises:
+        error: テキストメッセージの一斉通知に失敗
+    """
+    from linebot.exceptions import LineBotApiError
+    from linebot.models import TextSendMessage
+
+    logger.info("ユーザ数: {}, 一斉通知テキストメッセージ: {}", len(user_ids), text)
+    metrics.add('line.line_bot_api.multicast.recipients', len(user_ids))
+    line_bot_api = _get_thread_line_bot_api() if retry_key else get_line_bot_api()
+    try:
+        line_bot_api.multicast(
+            user_ids, TextSendMessage(text=text), retry_key=retry_key)
+    except LineBotApiError as error:
+        if retry_key and error.status_code == STATUS_CONFLICT:
+            metrics.add('line.line_bot_api.multicast.already_accepted', 1)
+            logger.info("再試行キーのリクエストは受理済みのため、一斉通知を省略しました。 再試行キー: {}",
+                        retry_key)
+            return
+        logger.error("テキストメッセージの一斉通知に失敗しました。 ユーザ数: {}", len(user_ids))
+        raise error
+    finally:
+        if retry_key:
+            line_bot_api.headers.pop('X-Line-Retry-Key', None)
+
+
+def multicast_text_message_in_order(
+        chunks: Iterable[Tuple[List[str], T]], text: str,
+        retry_key_prefix: str,
+        checkpoint: Callable[[T, DeliveryStats], None],
+        on_sent: Optional[Callable[[List[str]], None]] = None) -> DeliveryStats:
+    """テキストメッセージをチャンク毎に一斉通知し、通知を終えた位置を記録する
+    チャンク毎の再試行キーは接頭辞とチャンクの再開位置から生成するため、
+    同じ接頭辞で再開した場合に受理済みのチャンクを重複して通知しない
+
+    Args:
+        chunks: ユーザIDのチャンク(最大500件)と、そのチャンクを通知し終えた後の再開位置の組の群
+        text: メッセージのテキスト
+        retry_key_prefix: 再試行キーの接頭辞
+        checkpoint: 再開位置と統計情報の記録処理
+        on_sent: チャンクの通知に成功した後の処理(送信したスレッドで実行する)
+
+    Returns:
+        通知の統計情報
+    """
+    def _send(chunk: List[str], position: T) -> None:
+        retry_key = str(uuid.uuid5(uuid.NAMESPACE_OID, f"{retry_key_prefix}:{position}"))
+        multicast_text_message(chunk, text, retry_key=retry_key)
+        if on_sent:
+            on_sent(chunk)
+
+    _import_sdk()
+    return deliver_in_order(
+        chunks, _send, DELIVERY_WORKERS, rate_limiter, checkpoint)
+
+
+def iter_follower_ids() -> Iterator[str]:
+    """友だち追加しているユーザのユーザIDを逐次取得する
+    ページングを辿って全件を取得する
+
+    Raises:
+        error: ユーザIDの取得に失敗
+
+    Yields:
+        ユーザID
+    """
+    from linebot.exceptions import LineBotApiError
+
+    start = None
+    while True:
+        try:
+            response = get_line_bot_api().get_followers_ids(start=start)
+        except LineBotApiError as error:
+            logger.error("友だちのユーザIDの取得に失敗しました。")
+            raise error
+        yield from response.user_ids
+        start = response.next
+        if not start:
+            return
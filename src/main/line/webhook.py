@@ -0,0 +1,244 @@
+"""LINE Webhook一括処理用モジュール
+コールドスタートを軽くするため、LINE Bot SDKは初回のWebhookの処理時にインポートする
+"""
+
+import contextvars
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import (TYPE_CHECKING, Callable, Dict, Iterator, List, Optional,
+                    Tuple)
+
+from loguru import logger
+
+from utils import metrics
+from utils.bounded_set import BoundedSet
+from utils.lazy import lazy
+
+if TYPE_CHECKING:
+    from linebot import WebhookParser
+    from linebot.models.events import Event
+
+# 定数群
+# トレース記録時に残すメッセージの項目(テキストは別途加工する)
+TRACE_MESSAGE_FIELDS = ('type', 'id', 'packageId', 'stickerId', 'duration',
+                        'contentProvider', 'fileName', 'fileSize')
+# トレース記録時に破棄した値の代わりに設定する値
+REDACTED = "redacted"
+
+
+class BatchWebhookHandler:
+    """Webhookのイベント群を一括で処理するハンドラクラス
+    リクエストボディの解析と署名の検証は一度だけ行い、イベント毎の処理を並行して実施する
+    LINEプラットフォームから再送されたイベントは、処理済みのWebhookイベントIDと照合して破棄する
+    (処理済みのIDはコンテナ内でのみ保持するため、別のコンテナに再送された場合は破棄できない)
+    処理関数はSDKのWebhookHandlerと同じく、イベントとメッセージのクラス名をキーとして登録する
+    """
+
+    def __init__(self, channel_secret: str, workers: int,
+                 max_event_ids: int) -> None:
+        """
+        Args:
+            channel_secret: チャネルシークレット
+            workers: イベントを並行して処理する最大スレッド数
+            max_event_ids: 保持する処理済みのWebhookイベントIDの最大件数
+        """
+        self._workers = workers
+        self._handlers: Dict[str, Callable] = {}
+        self.processed_event_ids = BoundedSet(max_event_ids)
+        self.duplicates = 0
+        self._get_parser = lazy(lambda: _create_parser(channel_secret))
+
+    @property
+    def parser(self) -> 'WebhookParser':
+        """Webhookのリクエストボディの解析クラス(初回使用時に生成する)"""
+        return self._get_parser()
+
+    def add(self, event: str, message: Optional[str] = None) -> Callable[[Callable], Callable]:
+        """イベントの処理関数を登録するデコレータ
+
+        Args:
+            event: イベントのクラス名
+            message: メッセージイベントの場合は、メッセージのクラス名
+
+        Returns:
+            デコレータ
+        """
+        def _decorator(func: Callable) -> Callable:
+            self._handlers[f"{event}_{message}" if message else event] = func
+            return func
+
+        return _decorator
+
+    def handle(self, body: str, signature: str) -> None:
+        """Webhookのイベント群を処理する
+
+        Args:
+            body: リクエストボディ
+            signature: 署名(X-Line-Signature)
+
+        Raises:
+            InvalidSignatureError: 署名の検証に失敗
+        """
+        payload = self.parser.parse(body, signature, as_payload=True)
+        # SDKのイベントモデルはWebhookイベントIDを保持しないため、リクエストボディから取得する
+        raw_events = json.loads(body).get('events', [])
+        tasks = self._create_tasks(payload.events, raw_events)
+        metrics.add('line.webhook.events', len(raw_events))
+        if not tasks:
+            return
+        if len(tasks) == 1 or self._workers <= 1:
+            for func, event in tasks:
+                _invoke(func, event)
+            return
+
+        with ThreadPoolExecutor(
+                max_workers=min(self._workers, len(tasks))) as executor:
+            # 呼び出し元のコンテキスト変数を各スレッドに引き継ぐ
+            futures = [
+                executor.submit(contextvars.copy_context().run,
+                                _invoke, func, event)
+                for func, event in tasks
+            ]
+            for future in futures:
+                future.result()
+
+    def _create_tasks(self, events: List['Event'],
+                      raw_events: List[dict]) -> List[Tuple[Callable, 'Event']]:
+        """処理対象のイベントと処理関数の組を作成する
+        再送されたイベントと処理関数が登録されていないイベントは除外する
+
+        Args:
+            events: イベント群
+            raw_events: リクエストボディのイベント群
+
+        Returns:
+            処理関数とイベントの組のリスト
+        """
+        tasks = []
+        for event, raw_event in _pair_events(events, raw_events):
+            event_id = raw_event.get('webhookEventId')
+            if event_id and not self.processed_event_ids.add(event_id):
+                self.duplicates += 1
+                metrics.add('line.webhook.duplicate_events', 1)
+                logger.info("処理済みのイベントのため破棄します。 WebhookイベントID: {}, 再送: {}",
+                            event_id,
+                            raw_event.get('deliveryContext', {}).get('isRedelivery'))
+                continue
+            func = self._find_handler(event)
+            if func is None:
+                logger.info("処理対象外のイベントです。 イベント種類: {}", type(event).__name__)
+                continue
+            tasks.append((func, event))
+        return tasks
+
+    def _find_handler(self, event: 'Event') -> Optional[Callable]:
+        """イベントに対応する処理関数を取得する
+
+        Args:
+            event: イベント
+
+        Returns:
+            処理関数(登録されていない場合はNone)
+        """
+        from linebot.models import MessageEvent
+
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get(
+                f"{type(event).__name__}_{type(event.message).__name__}")
+        if func is None:
+            func = self._handlers.get(type(event).__name__)
+        return func
+
+
+def _create_parser(channel_secret: str) -> 'WebhookParser':
+    """Webhookのリクエストボディの解析クラスを生成する"""
+    from linebot import WebhookParser
+
+    return WebhookParser(channel_secret)
+
+
+def _pair_events(events: List['Event'],
+                 raw_events: List[dict]) -> Iterator[Tuple['Event', dict]]:
+    """イベントとリクエストボディのイベントを対応付ける
+    SDKは未対応の種類のイベントを破棄するため、順序を保ったまま種類が一致するものを対応付け、
+    SDKが破棄したリクエストボディのイベントは読み飛ばす
+
+    Args:
+        events: イベント群
+        raw_events: リクエストボディのイベント群
+
+    Yields:
+        イベントとリクエストボディのイベントの組
+    """
+    remaining = iter(events)
+    event = next(remaining, None)
+    for raw_event in raw_events:
+        if event is None:
+            return
+        if raw_event.get('type') != event.type:
+            logger.info("未対応の種類のイベントのため破棄します。 イベント種類: {}",
+                        raw_event.get('type'))
+            continue
+        yield event, raw_event
+        event = next(remaining, None)
+
+
+def _invoke(func: Callable, event: 'Event') -> None:
+    """イベントの処理関数を実行する
+    1件のイベントの処理に失敗しても、他のイベントの処理は継続する
+
+    Args:
+        func: 処理関数
+        event: イベント
+    """
+    try:
+        func(event)
+    except Exception:
+        logger.exception("イベントの処理に失敗しました。 イベント種類: {}", type(event).__name__)
+
+
+def sanitize_body(body: str, sanitize_text: Callable[[str], str]) -> Optional[dict]:
+    """トレース記録用に、リクエストボディから個人を特定できる情報を除く
+    ユーザID等は同じ値が同じ値になるようハッシュ化し、応答トークンは破棄する
+    メッセージは処理の分岐に必要な項目のみを残し、テキストはsanitize_textで加工する
+
+    Args:
+        body: リクエストボディ
+        sanitize_text: テキストメッセージの加工処理
+
+    Returns:
+        加工したリクエストボディ(JSONとして解析できない場合はNone)
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    events = []
+    for event in payload.get('events', []):
+        event = dict(event)
+        if 'source' in event:
+            event['source'] = {
+                key: _pseudonymize(value) if key.endswith('Id') else value
+                for key, value in event['source'].items()
+            }
+        if 'replyToken' in event:
+            event['replyToken'] = REDACTED
+        message = event.get('message')
+        if message:
+            sanitized = {key: message[key] for key in TRACE_MESSAGE_FIELDS
+                         if key in message}
+            if 'text' in message:
+                sanitized['text'] = sanitize_text(message['text'])
+            if message.get('type') == 'location':
+                sanitized.update(title=REDACTED, address=REDACTED,
+                                 latitude=0, longitude=0)
+            event['message'] = sanitized
+        events.append(event)
+    return {'events': events}
+
+
+def _pseudonymize(value: str) -> str:
+    """IDを先頭の種類を表す文字とハッシュ値に置き換える"""
+    return value[:1] + hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
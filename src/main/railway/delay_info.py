@@ -1,153 +1,440 @@
 """鉄道用モジュール"""
 
-import json
+import hashlib
+import os
+from datetime import datetime
+from decimal import Decimal
+from http import HTTPStatus
+from typing import (TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional,
+                    Tuple)
 
-import requests
 from loguru import logger
 
 from aws.dynamodb import users_table
-from aws.dynamodb.delay_info import Messages
+from aws.dynamodb.delay_info import (ALL, ALL_KEY, COMPANY_TYPES, HANKYU,
+                                     HANSHIN, WEST_JR, AreaMessages,
+                                     DelayInfo, Messages)
+from railway import line_catalog
+from utils import logs, metrics, trace
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.lazy import lazy
+
+if TYPE_CHECKING:
+    import requests
 
 # 定数群
 DELAY_URL = "https://tetsudo.rti-giken.jp/free/delay.json"
-WEST_JR_URL = "https://trafficinfo.westjr.co.jp/kinki.html"
-HANKYU_URL = "https://www.hankyu.co.jp/railinfo/"
-HANSHIN_URL = "https://rail.hanshin.co.jp/railinfo/"
+# 利用者に応答・通知するエリアの運営会社種類毎のURL
+COMPANY_URLS = {
+    line_catalog.COMPANY_TYPES_BY_NAME[company.key]: company.url
+    for company in line_catalog.get_area(line_catalog.DEFAULT_AREA).companies
+}
+# 鉄道遅延情報リスト取得時の接続／読み込みタイムアウト秒数
+REQUEST_TIMEOUT = (3, 3)
+# 取得先への接続を遮断するまでの連続失敗回数と、遮断してから再度試行するまでの秒数
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('DELAY_INFO_CIRCUIT_FAILURES', '3'))
+CIRCUIT_RESET_SECONDS = int(os.getenv('DELAY_INFO_CIRCUIT_RESET_SECONDS', '60'))
+
+# 取得先が応答しない間、取得のたびにタイムアウトまで待たないようにする
+circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+
+
+@lazy
+def get_session() -> 'requests.Session':
+    """コンテナが再利用される間、接続を使い回すセッションを初回使用時に生成して取得する
+    コールドスタートを軽くするため、requestsは初回使用時にインポートする
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return session
+
+
+class DelayDelta(NamedTuple):
+    """前回から遅延している路線の差分"""
+
+    # 新たに遅延した路線名リスト
+    added: List[str]
+    # 運転を再開した路線名リスト
+    resolved: List[str]
+
+    @property
+    def changed(self) -> bool:
+        """差分があるかどうか"""
+        return bool(self.added or self.resolved)
+
+
+class DelayInfoListResponse(NamedTuple):
+    """鉄道遅延情報リストの取得結果"""
+
+    # 前回から変更がない場合はNone
+    delay_info_list: Optional[list]
+    etag: Optional[str]
+    last_modified: Optional[str]
 
 
-def request_delay_info_message(company_type: int) -> str:
-    """鉄道遅延情報メッセージを取得する
+@metrics.timed
+def request_delay_info_messages(
+        db_delay_info: Optional[DelayInfo] = None) -> Messages:
+    """全運営会社の鉄道遅延情報メッセージ群を取得する
+    DBに登録されている鉄道遅延情報の検証用ヘッダを使用して条件付きで取得し、
+    前回から変更がない場合はメッセージの作成とDBへの登録を行わず、更新日時のみ更新する
+    利用者に応答・通知するエリア以外の鉄道遅延情報も、同じ鉄道遅延情報リストからエリア毎に登録する
 
     Args:
-        company_type: 運営会社種類
+        db_delay_info: DBに登録されている鉄道遅延情報
 
     Raises:
         e: 鉄道遅延情報メッセージの取得／登録に失敗
 
     Returns:
-        鉄道遅延情報メッセージ
+        鉄道遅延情報メッセージ群
     """
-    logger.info("鉄道遅延情報メッセージを取得します。 運営会社種類: {}", company_type)
     try:
-        delay_info_list = _request_delay_info_list()
-        messages = _generate_delay_info_messages(delay_info_list)
+        if db_delay_info:
+            response = _request_delay_info_list(
+                db_delay_info.etag, db_delay_info.last_modified)
+        else:
+            response = _request_delay_info_list()
+        if response.delay_info_list is None:
+            logger.info("鉄道遅延情報リストは前回から変更がないため、DBに登録されている鉄道遅延情報を使用します。")
+            _mark_validated(db_delay_info, users_table.touch_delay_info(
+                db_delay_info.etag, db_delay_info.last_modified))
+            return db_delay_info.messages
+        # 全エリアの鉄道遅延情報メッセージ群を1回の走査で作成する
+        area_messages = generate_area_messages(response.delay_info_list)
+        messages = _to_messages(area_messages[line_catalog.DEFAULT_AREA])
     except Exception as e:
         logger.error("鉄道遅延情報メッセージの取得に失敗しました。")
         raise e
-    logger.info("鉄道遅延情報メッセージの取得に成功しました。 鉄道遅延情報メッセージ: {}", messages)
+    logger.info("鉄道遅延情報メッセージの取得に成功しました。")
 
     try:
-        users_table.update_delay_info(messages)
+        updated = users_table.update_delay_info(
+            messages, response.etag, response.last_modified)
     except Exception as e:
         logger.error("鉄道遅延情報メッセージの登録に失敗しました。")
         raise e
-    delay_info_message = messages.extract_message(company_type)
-    return delay_info_message
+    if not updated:
+        logger.info("遅延している路線に変化がないため、鉄道遅延情報メッセージの登録を省略しました。")
+        if db_delay_info:
+            _mark_validated(db_delay_info.copy(update={
+                'etag': response.etag,
+                'last_modified': response.last_modified
+            }))
+    _update_area_delay_info(area_messages)
+    return messages
+
+
+def _mark_validated(db_delay_info: DelayInfo,
+                    updated_time: Optional[Decimal] = None) -> None:
+    """DBに登録されている鉄道遅延情報が最新であることを確認済みとして扱う
+    DBの更新日時と検証用ヘッダは更新済みのため、このコンテナ内ではDBを再度読み込まない
+
+    Args:
+        db_delay_info: DBに登録されている鉄道遅延情報
+        updated_time: DBに登録した更新日時(省略時は現在日時)
+    """
+    users_table.delay_info_cache.set(db_delay_info.copy(update={
+        'updated_time': updated_time or Decimal(datetime.utcnow().timestamp())
+    }))
+
 
+def create_digest(delay_lines: Iterable[str]) -> str:
+    """遅延している路線群のダイジェストを作成する
+    路線の順序や重複に依存しないよう正規化してからハッシュ化する
 
-def _request_delay_info_list() -> list:
+    Args:
+        delay_lines: 遅延している路線名群
+
+    Returns:
+        ダイジェスト
+    """
+    normalized = "\n".join(sorted(set(delay_lines)))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+@metrics.timed
+def _request_delay_info_list(
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None) -> DelayInfoListResponse:
     """鉄道遅延情報リストを要求する
+    検証用ヘッダを指定した場合は条件付きで要求する
+    取得に連続して失敗している間は、取得先に接続せずに失敗とする
+
+    Args:
+        etag: 前回取得時のETag
+        last_modified: 前回取得時のLast-Modified
 
     Raises:
+        CircuitOpenError: 取得先への接続を遮断中
         e: 鉄道遅延情報リストの取得に失敗
 
     Returns:
-        鉄道遅延情報リスト
+        鉄道遅延情報リストの取得結果
     """
+    if not circuit_breaker.allow():
+        metrics.add('railway.delay_info.circuit_open', 1)
+        raise CircuitOpenError("鉄道遅延情報リストの取得先への接続を遮断しています。")
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
     try:
-        delay_info_list = requests.get(DELAY_URL).json()
+        response = get_session().get(
+            DELAY_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            metrics.add('railway.delay_info.not_modified', 1)
+            trace.record(trace.KIND_DELAY_INFO, status=response.status_code)
+            circuit_breaker.record_success()
+            return DelayInfoListResponse(None, etag, last_modified)
+        response.raise_for_status()
+        delay_info_list = response.json()
+        metrics.add('railway.delay_info.list_bytes',
+                    len(response.content), metrics.UNIT_BYTES)
+        metrics.add('railway.delay_info.list_entries', len(delay_info_list))
+        trace.record(trace.KIND_DELAY_INFO, status=response.status_code,
+                     etag=response.headers.get('ETag'),
+                     last_modified=response.headers.get('Last-Modified'),
+                     delay_info_list=delay_info_list)
     except Exception as e:
+        circuit_breaker.record_failure()
         logger.error("鉄道遅延情報リストの取得に失敗しました。")
         raise e
-    logger.info(
-        "鉄道遅延情報リスト: {}",
-        json.dumps(delay_info_list, ensure_ascii=False)
+    circuit_breaker.record_success()
+    logs.payload("鉄道遅延情報リスト: {}", delay_info_list)
+    return DelayInfoListResponse(
+        delay_info_list,
+        response.headers.get('ETag'),
+        response.headers.get('Last-Modified')
     )
-    return delay_info_list
 
 
-def _generate_delay_info_messages(delay_info_list: list) -> Messages:
-    """鉄道遅延情報リストから運営会社毎の鉄道遅延情報メッセージを作成する
+@metrics.timed
+def generate_area_messages(delay_info_list: list) -> Dict[str, AreaMessages]:
+    """鉄道遅延情報リストを1回走査し、全エリアの鉄道遅延情報メッセージ群を作成する
 
     Args:
         delay_info_list: 鉄道遅延情報リスト
 
     Returns:
-        鉄道遅延情報メッセージ群
+        エリア名毎の鉄道遅延情報メッセージ群
     """
-    west_jr_delay_lines = []
-    hankyu_delay_lines = []
-    hanshin_delay_lines = []
+    delay_lines = {
+        area.name: {company.key: [] for company in area.companies}
+        for area in line_catalog.catalog.areas
+    }
     for delay_info in delay_info_list:
-        # JR西日本
-        if _is_match(delay_info, "JR西日本", "学研都市線"):
-            west_jr_delay_lines.append("JR学研都市線")
-        elif _is_match(delay_info, "JR西日本", "ＪＲ東西線") or _is_match(
-                delay_info, "JR西日本", "JR東西線"):
-            west_jr_delay_lines.append("JR東西線")
-        elif _is_match(delay_info, "JR西日本", "ＪＲ神戸線") or _is_match(
-                delay_info, "JR西日本", "JR神戸線"):
-            west_jr_delay_lines.append("JR神戸線")
-
-        # 阪急電鉄
-        if _is_match(delay_info, "阪急電鉄", "阪急線"):
-            hankyu_delay_lines.append("阪急線")
-        elif _is_match(delay_info, "阪急電鉄", "神戸線"):
-            hankyu_delay_lines.append("阪急神戸線")
-        elif _is_match(delay_info, "阪急電鉄", "神戸本線"):
-            hankyu_delay_lines.append("阪急神戸本線")
-
-        # 阪神電気鉄道
-        elif _is_match(delay_info, "阪神電気鉄道", "阪神線"):
-            hanshin_delay_lines.append("阪神線")
-        elif _is_match(delay_info, "阪神電気鉄道", "阪神本線"):
-            hanshin_delay_lines.append("阪神本線")
-        elif _is_match(delay_info, "阪神電気鉄道", "神戸高速線"):
-            hanshin_delay_lines.append("阪神神戸高速線")
-
-    west_jr_delay_info_message = f"{', '.join(west_jr_delay_lines)}が遅延しています。\n{WEST_JR_URL}" if west_jr_delay_lines else "JR西日本の遅延情報はありません。"
-    hankyu_delay_info_message = f"{', '.join(hankyu_delay_lines)}が遅延しています。\n{HANKYU_URL}" if hankyu_delay_lines else "阪急電鉄の遅延情報はありません。"
-    hanshin_delay_info_message = f"{', '.join(hanshin_delay_lines)}が遅延しています。\n{HANSHIN_URL}" if hanshin_delay_lines else "阪神電鉄の遅延情報はありません。"
-
-    if not (west_jr_delay_lines or hankyu_delay_lines or hanshin_delay_lines):
-        all_companies_delay_info_message = "兵庫～大阪間の鉄道の遅延情報はありません。"
+        for line in _find_lines(delay_info):
+            delay_lines[line.area][line.company].append(line.display_name)
+    return {
+        area.name: _generate_area_messages(area, delay_lines[area.name])
+        for area in line_catalog.catalog.areas
+    }
+
+
+def _generate_area_messages(area: line_catalog.Area,
+                            delay_lines: Dict[str, List[str]]) -> AreaMessages:
+    """エリアの運営会社毎の遅延している路線名リストから鉄道遅延情報メッセージ群を作成する
+
+    Args:
+        area: エリア定義
+        delay_lines: 運営会社キー毎の遅延している路線名リスト
+
+    Returns:
+        エリアの鉄道遅延情報メッセージ群
+    """
+    messages = {}
+    digests = {}
+    all_delay_lines = []
+    all_urls = []
+    for company in area.companies:
+        company_lines = delay_lines[company.key]
+        if company_lines:
+            messages[company.key] = f"{', '.join(company_lines)}が遅延しています。\n{company.url}"
+            all_delay_lines.extend(company_lines)
+            all_urls.append(company.url)
+        else:
+            messages[company.key] = f"{company.name}の遅延情報はありません。"
+        digests[company.key] = create_digest(company_lines)
+
+    if all_delay_lines:
+        messages[ALL_KEY] = "\n".join(
+            [f"{', '.join(all_delay_lines)}が遅延しています。", *all_urls])
     else:
-        all_companies_delay_lines = west_jr_delay_lines + \
-            hankyu_delay_lines + hanshin_delay_lines
-        all_companies_delay_info_message = f"{', '.join(all_companies_delay_lines)}が遅延しています。"
-        if west_jr_delay_lines:
-            all_companies_delay_info_message += f"\n{WEST_JR_URL}"
-        if hankyu_delay_lines:
-            all_companies_delay_info_message += f"\n{HANKYU_URL}"
-        if hanshin_delay_lines:
-            all_companies_delay_info_message += f"\n{HANSHIN_URL}"
+        messages[ALL_KEY] = f"{area.display_name}の鉄道の遅延情報はありません。"
+    digests[ALL_KEY] = create_digest(all_delay_lines)
+    return AreaMessages(area=area.name, messages=messages, digests=digests,
+                        delay_lines=delay_lines)
+
+
+def _to_messages(area_messages: AreaMessages) -> Messages:
+    """利用者に応答・通知するエリアの鉄道遅延情報メッセージ群を、運営会社種類毎の鉄道遅延情報メッセージ群に変換する
+
+    Args:
+        area_messages: 利用者に応答・通知するエリアの鉄道遅延情報メッセージ群
+
+    Returns:
+        鉄道遅延情報メッセージ群
+    """
+    company_types = {ALL_KEY: ALL, **line_catalog.COMPANY_TYPES_BY_NAME}
+    messages = Messages(
+        west_jr=area_messages.messages['WEST_JR'],
+        hankyu=area_messages.messages['HANKYU'],
+        hanshin=area_messages.messages['HANSHIN'],
+        all=area_messages.messages[ALL_KEY],
+        digests={str(company_types[key]): digest
+                 for key, digest in area_messages.digests.items()},
+        delay_lines={str(company_types[key]): lines
+                     for key, lines in area_messages.delay_lines.items()}
+    )
+    logs.payload("鉄道遅延情報メッセージ群: {}", messages)
+    return messages
+
+
+def _generate_delay_info_messages(delay_info_list: list) -> Messages:
+    """鉄道遅延情報リストから利用者に応答・通知するエリアの鉄道遅延情報メッセージ群を作成する
+
+    Args:
+        delay_info_list: 鉄道遅延情報リスト
+
+    Returns:
+        鉄道遅延情報メッセージ群
+    """
+    return _to_messages(
+        generate_area_messages(delay_info_list)[line_catalog.DEFAULT_AREA])
+
+
+def _update_area_delay_info(area_messages: Dict[str, AreaMessages]) -> None:
+    """利用者に応答・通知するエリア以外の鉄道遅延情報を登録する
+    登録に失敗しても、利用者に応答・通知するエリアの処理は継続する
+
+    Args:
+        area_messages: エリア名毎の鉄道遅延情報メッセージ群
+    """
+    for area, messages in area_messages.items():
+        if area == line_catalog.DEFAULT_AREA:
+            continue
+        try:
+            if users_table.update_area_delay_info(messages):
+                metrics.add('railway.delay_info.area_updates', 1)
+        except Exception:
+            logger.opt(exception=True).warning(
+                "エリアの鉄道遅延情報の登録に失敗しました。 エリア: {}", area)
+
+
+def diff_delay_lines(latest_lines: List[str], previous_lines: List[str]) -> DelayDelta:
+    """遅延している路線名リストの差分を求める
+
+    Args:
+        latest_lines: 最新の遅延している路線名リスト
+        previous_lines: 前回の遅延している路線名リスト
+
+    Returns:
+        新たに遅延した路線と運転を再開した路線(いずれも元のリストの順)
+    """
+    latest_set = set(latest_lines)
+    previous_set = set(previous_lines)
+    return DelayDelta(
+        added=[line for line in dict.fromkeys(latest_lines) if line not in previous_set],
+        resolved=[line for line in dict.fromkeys(previous_lines) if line not in latest_set]
+    )
+
+
+def diff_messages(latest_messages: Messages,
+                  previous_messages: Messages) -> Optional[Dict[int, DelayDelta]]:
+    """運営会社毎に、前回から新たに遅延した路線と運転を再開した路線を求める
+
+    Args:
+        latest_messages: 最新の鉄道遅延情報メッセージ群
+        previous_messages: 前回の鉄道遅延情報メッセージ群
+
+    Returns:
+        運営会社種類(全運営会社を含む)毎の差分(どちらかに遅延している路線名リストが未登録の場合はNone)
+    """
+    deltas = {}
+    for company_type in COMPANY_TYPES:
+        latest_lines = latest_messages.extract_delay_lines(company_type)
+        previous_lines = previous_messages.extract_delay_lines(company_type)
+        if latest_lines is None or previous_lines is None:
+            return None
+        deltas[company_type] = diff_delay_lines(latest_lines, previous_lines)
+    deltas[ALL] = DelayDelta(
+        added=[line for delta in deltas.values() for line in delta.added],
+        resolved=[line for delta in deltas.values() for line in delta.resolved]
+    )
+    return deltas
+
+
+def generate_delta_messages(latest_messages: Messages,
+                            deltas: Dict[int, DelayDelta]) -> Messages:
+    """新たに遅延した路線と運転を再開した路線のみを知らせる鉄道遅延情報メッセージ群を作成する
+    差分がない運営会社のメッセージと、遅延している路線名リストおよびダイジェストは、
+    次回の差分の基準とするため最新の鉄道遅延情報から引き継ぐ
+
+    Args:
+        latest_messages: 最新の鉄道遅延情報メッセージ群
+        deltas: 運営会社種類毎の差分
+
+    Returns:
+        差分の鉄道遅延情報メッセージ群
+    """
+    changed_companies = [company_type for company_type in COMPANY_TYPES
+                         if deltas[company_type].changed]
+
+    def _message(company_type: int, url_companies: List[int]) -> str:
+        if not deltas[company_type].changed:
+            return latest_messages.extract_message(company_type)
+        return _generate_delta_message(deltas[company_type], url_companies)
 
     messages = Messages(
-        west_jr=west_jr_delay_info_message,
-        hankyu=hankyu_delay_info_message,
-        hanshin=hanshin_delay_info_message,
-        all=all_companies_delay_info_message,
+        west_jr=_message(WEST_JR, [WEST_JR]),
+        hankyu=_message(HANKYU, [HANKYU]),
+        hanshin=_message(HANSHIN, [HANSHIN]),
+        all=_message(ALL, changed_companies),
+        digests=latest_messages.digests,
+        delay_lines=latest_messages.delay_lines
     )
-    logger.info("鉄道遅延情報メッセージ群: {}", messages)
+    logs.payload("鉄道遅延情報の差分メッセージ群: {}", messages)
     return messages
 
 
-def _is_match(delay_info: dict, company: str, line: str) -> bool:
-    """対象の鉄道かどうか判定する
+def _generate_delta_message(delta: DelayDelta, company_types: List[int]) -> str:
+    """遅延している路線の差分から鉄道遅延情報メッセージを作成する
+
+    Args:
+        delta: 遅延している路線の差分
+        company_types: URLを付ける運営会社種類リスト
+
+    Returns:
+        鉄道遅延情報メッセージ
+    """
+    lines = []
+    if delta.added:
+        lines.append(f"{', '.join(delta.added)}が遅延しています。")
+    if delta.resolved:
+        lines.append(f"【運転再開】{', '.join(delta.resolved)}")
+    lines.extend(COMPANY_URLS[company_type] for company_type in company_types)
+    return "\n".join(lines)
+
+
+def _find_lines(delay_info: dict) -> Tuple[line_catalog.Line, ...]:
+    """路線カタログから対象の鉄道を検索する
 
     Args:
         delay_info: 鉄道遅延情報
-        company: 運営会社名
-        line: 路線名
 
     Raises:
         e: JSON内に処理対象のキーが存在しない
 
     Returns:
-        対象の鉄道の場合はTrue
+        対象の鉄道の場合はエリア毎の路線カタログの路線、それ以外は空
     """
     try:
-        return delay_info['company'] == company and delay_info['name'] == line
+        return line_catalog.find_lines(delay_info['company'], delay_info['name'])
     except KeyError as e:
         logger.error("JSON内に処理対象のキーが存在しません。")
         raise e
@@ -0,0 +1,145 @@
+"""路線カタログ用モジュール
+エリア毎に運営会社と通知対象の路線を定義したエリア定義を読み込む
+"""
+
+import json
+import os
+import unicodedata
+from typing import Dict, List, NamedTuple, Tuple
+
+from aws.dynamodb.delay_info import HANKYU, HANSHIN, WEST_JR
+
+# 定数群
+AREAS_PATH = os.path.join(os.path.dirname(__file__), "areas.json")
+# 利用者に応答・通知するエリア(鉄道遅延情報用データ"railway"に保持する)
+DEFAULT_AREA = 'kansai'
+# 利用者に応答・通知するエリアの運営会社キー毎の運営会社種類
+COMPANY_TYPES_BY_NAME = {
+    'WEST_JR': WEST_JR,
+    'HANKYU': HANKYU,
+    'HANSHIN': HANSHIN,
+}
+
+
+class Company(NamedTuple):
+    """エリア定義の運営会社"""
+
+    key: str
+    name: str
+    url: str
+
+
+class Area(NamedTuple):
+    """エリア定義"""
+
+    name: str
+    display_name: str
+    # 定義順の運営会社(メッセージに路線とURLを並べる順)
+    companies: Tuple[Company, ...]
+
+
+class Line(NamedTuple):
+    """路線カタログの路線"""
+
+    area: str
+    # 運営会社キー
+    company: str
+    display_name: str
+
+
+class Catalog(NamedTuple):
+    """路線カタログ"""
+
+    # 定義順のエリア定義
+    areas: Tuple[Area, ...]
+    # 正規化した(運営会社名, 路線名)をキーとする路線(複数のエリアに属する路線は複数件)
+    lines: Dict[Tuple[str, str], Tuple[Line, ...]]
+
+
+def normalize(text: str) -> str:
+    """全角／半角などの表記揺れを吸収するため文字列を正規化する
+
+    Args:
+        text: 文字列
+
+    Returns:
+        正規化した文字列
+    """
+    return unicodedata.normalize('NFKC', text).strip()
+
+
+def load_catalog(path: str = AREAS_PATH) -> Catalog:
+    """エリア定義から路線カタログを読み込む
+
+    Args:
+        path: エリア定義のパス
+
+    Raises:
+        KeyError: 利用者に応答・通知するエリアが定義されていない、またはその運営会社キーが正しく設定されていない
+
+    Returns:
+        路線カタログ
+    """
+    with open(path, encoding='utf-8') as areas_file:
+        definitions = json.load(areas_file)
+    areas = []
+    lines: Dict[Tuple[str, str], List[Line]] = {}
+    for definition in definitions:
+        companies = []
+        for company in definition['companies']:
+            companies.append(Company(company['key'], company['name'], company['url']))
+            for entry in company['lines']:
+                key = (normalize(entry['company']), normalize(entry['name']))
+                lines.setdefault(key, []).append(
+                    Line(definition['name'], company['key'], entry['display_name']))
+        areas.append(Area(definition['name'], definition['display_name'], tuple(companies)))
+
+    default_area = next((area for area in areas if area.name == DEFAULT_AREA), None)
+    if default_area is None:
+        raise KeyError(f"エリアが定義されていません。エリア: {DEFAULT_AREA}")
+    unknown_keys = [company.key for company in default_area.companies
+                    if company.key not in COMPANY_TYPES_BY_NAME]
+    if unknown_keys:
+        raise KeyError(f"運営会社キーが正しく設定されていません。運営会社キー: {unknown_keys}")
+    return Catalog(tuple(areas), {key: tuple(entries) for key, entries in lines.items()})
+
+
+# インポート時に一度だけ読み込む
+catalog = load_catalog()
+# 検索時に属性を参照しないよう、路線の辞書を別に保持する
+_lines = catalog.lines
+
+
+def get_area(name: str) -> Area:
+    """エリア定義を取得する
+
+    Args:
+        name: エリア名
+
+    Raises:
+        KeyError: エリアが定義されていない
+
+    Returns:
+        エリア定義
+    """
+    for area in catalog.areas:
+        if area.name == name:
+            return area
+    raise KeyError(f"エリアが定義されていません。エリア: {name}")
+
+
+def find_lines(company: str, name: str) -> Tuple[Line, ...]:
+    """路線カタログから路線を検索する
+
+    Args:
+        company: 運営会社名
+        name: 路線名
+
+    Returns:
+        路線(カタログに存在しない場合は空)
+    """
+    # 正規化済みの表記であれば正規化処理を省略する
+    lines = _lines.get((company, name))
+    if lines is None:
+        lines = _lines.get((normalize(company), normalize(name)), ())
+    return lines
@@ -1,25 +1,189 @@
 """クラス用ユーティリティモジュール"""
 
-from pydantic import BaseModel
+import copy
+import json
+import typing
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional, Tuple
 
+_MISSING = object()
 
-class Json(BaseModel):
-    """JSON形式に変換可能な基底クラス"""
+
+class _JsonMeta(type):
+    """型注釈からフィールドと__slots__を生成するメタクラス"""
+
+    def __new__(mcs, name: str, bases: tuple, namespace: dict):
+        annotations = namespace.get('__annotations__', {})
+        defaults = {}
+        for field_name in annotations:
+            # __slots__と同名のクラス変数は定義できないため、デフォルト値は別に保持する
+            if field_name in namespace:
+                defaults[field_name] = namespace.pop(field_name)
+        namespace['__slots__'] = tuple(annotations)
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        fields: Dict[str, Tuple[Any, Any]] = {}
+        for base in reversed(cls.__mro__[1:]):
+            fields.update(getattr(base, '_fields', {}))
+        for field_name, annotation in annotations.items():
+            fields[field_name] = (annotation, defaults.get(field_name, _MISSING))
+        cls._fields = fields
+        # 入れ子のモデルを持つフィールドと可変長のフィールドのみ、dict型との変換時に個別に処理する
+        cls._nested_fields = {
+            field_name: annotation
+            for field_name, (annotation, _) in fields.items()
+            if isinstance(annotation, type) and issubclass(annotation, Json)
+        }
+        cls._container_fields = tuple(
+            field_name
+            for field_name, (annotation, _) in fields.items()
+            if typing.get_origin(annotation) in (list, dict)
+        )
+        cls._plain_fields = tuple(
+            field_name for field_name in fields
+            if field_name not in cls._nested_fields
+            and field_name not in cls._container_fields
+        )
+        return cls
+
+
+class Json(metaclass=_JsonMeta):
+    """JSON形式に変換可能な基底クラス
+    __slots__を使用した軽量なモデルで、検証は信頼できないデータを取り込む場合のみ行う
+    """
+
+    def __init__(self, **kwargs) -> None:
+        for field_name, (_, default) in self._fields.items():
+            if field_name in kwargs:
+                value = kwargs[field_name]
+            elif default is _MISSING:
+                raise ValueError(
+                    f"必須項目が設定されていません。クラス: {type(self).__name__}, 項目: {field_name}")
+            elif isinstance(default, (list, dict)):
+                value = copy.copy(default)
+            else:
+                value = default
+            setattr(self, field_name, value)
 
     def __str__(self):
         return self.to_json_string()
 
+    def __repr__(self):
+        values = ", ".join(
+            f"{field_name}={getattr(self, field_name)!r}"
+            for field_name in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, field_name) == getattr(other, field_name)
+            for field_name in self._fields)
+
     def to_json_string(self) -> str:
         """JSON文字列に変換"""
-        return self.json(
-            ensure_ascii=False
+        return json.dumps(
+            self.to_dict(),
+            ensure_ascii=False,
+            default=_json_default
         )
 
     def to_dict(self) -> dict:
         """dict型に変換"""
-        return self.dict()
+        obj = {field_name: getattr(self, field_name)
+               for field_name in self._plain_fields}
+        for field_name in self._container_fields:
+            obj[field_name] = getattr(self, field_name).copy()
+        for field_name in self._nested_fields:
+            value = getattr(self, field_name)
+            obj[field_name] = value.to_dict() if isinstance(value, Json) else value
+        return obj
+
+    def copy(self, update: Optional[dict] = None):
+        """一部の項目を置き換えたインスタンスを生成"""
+        values = {
+            field_name: getattr(self, field_name) for field_name in self._fields
+        }
+        if update:
+            values.update(update)
+        return type(self)(**values)
 
     @classmethod
-    def from_dict(cls, obj: dict):
-        """dict型のデータからインスタンスを生成"""
-        return cls.parse_obj(obj)
+    def from_dict(cls, obj: dict, validate: bool = False):
+        """dict型のデータからインスタンスを生成
+
+        Args:
+            obj: dict型のデータ
+            validate: 型の検証と変換を行う場合はTrue(信頼できないデータを取り込む場合のみ指定する)
+
+        Raises:
+            ValueError: 必須項目が設定されていない、または型が正しくない
+        """
+        if validate:
+            return cls(**{
+                field_name: _coerce(obj[field_name], annotation, field_name)
+                for field_name, (annotation, _) in cls._fields.items()
+                if field_name in obj
+            })
+        if cls._nested_fields:
+            obj = dict(obj)
+            for field_name, nested_class in cls._nested_fields.items():
+                value = obj.get(field_name)
+                if isinstance(value, dict):
+                    obj[field_name] = nested_class.from_dict(value)
+        return cls(**obj)
+
+
+def _json_default(obj: object) -> object:
+    """JSON文字列に変換できない値の変換処理"""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"JSON文字列に変換できません。型: {type(obj).__name__}")
+
+
+def _coerce(value: object, annotation: Any, field_name: str) -> object:
+    """型注釈に従って値を検証・変換する
+
+    Raises:
+        ValueError: 型が正しくない
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        if value is None and type(None) in args:
+            return None
+        for arg in args:
+            if arg is type(None):
+                continue
+            try:
+                return _coerce(value, arg, field_name)
+            except ValueError:
+                continue
+    elif origin is list and isinstance(value, (list, tuple, set)):
+        return [_coerce(element, args[0], field_name) for element in value]
+    elif origin is dict and isinstance(value, dict):
+        return {
+            _coerce(key, args[0], field_name): _coerce(element, args[1], field_name)
+            for key, element in value.items()
+        }
+    elif isinstance(annotation, type) and issubclass(annotation, Json):
+        if isinstance(value, annotation):
+            return value
+        if isinstance(value, dict):
+            return annotation.from_dict(value, validate=True)
+    elif annotation is Decimal:
+        if isinstance(value, (int, float, str, Decimal)) and not isinstance(value, bool):
+            try:
+                return Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+            except InvalidOperation:
+                pass
+    elif annotation is int:
+        if isinstance(value, (int, Decimal)) and not isinstance(value, bool) \
+                and value == int(value):
+            return int(value)
+    elif isinstance(annotation, type) and isinstance(value, annotation):
+        return value
+    raise ValueError(f"項目の型が正しくありません。項目: {field_name}, 値: {value!r}")
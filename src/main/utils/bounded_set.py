@@ -0,0 +1,51 @@
+"""件数上限付き集合用ユーティリティモジュール"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+
+class BoundedSet:
+    """件数上限付きの集合クラス
+    上限を超えた場合は最も古く追加された要素から破棄する
+    複数スレッドから同時に使用できる
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """
+        Args:
+            maxsize: 保持する最大件数
+
+        Raises:
+            ValueError: 最大件数が正しく設定されていない
+        """
+        if maxsize < 1:
+            raise ValueError(f"最大件数が正しく設定されていません。最大件数: {maxsize}")
+        self._maxsize = maxsize
+        self._keys: 'OrderedDict[Hashable, None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._keys
+
+    def add(self, key: Hashable) -> bool:
+        """要素を追加する
+
+        Args:
+            key: 要素
+
+        Returns:
+            新たに追加した場合はTrue(既に保持している場合はFalse)
+        """
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = None
+            if len(self._keys) > self._maxsize:
+                self._keys.popitem(last=False)
+            return True
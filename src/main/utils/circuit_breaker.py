@@ -0,0 +1,60 @@
+"""サーキットブレーカ用ユーティリティモジュール"""
+
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカが呼び出しを遮断している場合のエラークラス"""
+    pass
+
+
+class CircuitBreaker:
+    """連続して失敗する処理の呼び出しを一定時間遮断するクラス
+    Lambdaのコンテナが再利用される間、モジュール変数として保持する
+    連続失敗回数が閾値に達すると遮断し、遮断秒数の経過後は1回だけ試行を許可する
+    試行に成功すると遮断を解除し、失敗すると再び遮断する
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        """
+        Args:
+            failure_threshold: 遮断するまでの連続失敗回数
+            reset_seconds: 遮断してから試行を許可するまでの秒数
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """呼び出しを許可するかどうか判定する
+        遮断秒数の経過後は、結果を記録するまで1つの呼び出しのみ許可する
+
+        Returns:
+            許可する場合はTrue
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self._reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        """呼び出しの成功を記録し、遮断を解除する"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """呼び出しの失敗を記録し、連続失敗回数が閾値に達した場合または試行に失敗した場合は遮断する"""
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self._failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
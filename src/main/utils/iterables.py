@@ -0,0 +1,30 @@
+"""イテラブル用ユーティリティモジュール"""
+
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """イテラブルを指定件数ずつのチャンクに分割する
+    全要素をメモリ上に展開せず、チャンク単位で逐次生成する
+
+    Args:
+        iterable: 分割対象のイテラブル
+        size: チャンクの最大件数
+
+    Raises:
+        ValueError: チャンクの最大件数が1未満
+
+    Yields:
+        最大件数分の要素を格納したリスト
+    """
+    if size < 1:
+        raise ValueError(f"チャンクの最大件数は1以上を指定してください。最大件数: {size}")
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
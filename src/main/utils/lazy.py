@@ -0,0 +1,32 @@
+"""遅延初期化用ユーティリティモジュール"""
+
+import threading
+from functools import wraps
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+
+def lazy(factory: Callable[[], T]) -> Callable[[], T]:
+    """引数なしの生成処理を初回呼び出し時に一度だけ実行するようにする
+    コールドスタート時に不要なクライアントの生成を避けるために使用する
+    複数スレッドから同時に呼び出されても生成処理は一度しか実行しない
+
+    Args:
+        factory: 生成処理
+
+    Returns:
+        生成結果を保持して返す関数
+    """
+    lock = threading.Lock()
+    instances = []
+
+    @wraps(factory)
+    def _get() -> T:
+        if not instances:
+            with lock:
+                if not instances:
+                    instances.append(factory())
+        return instances[0]
+
+    return _get
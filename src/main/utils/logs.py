@@ -0,0 +1,104 @@
+"""ログ出力用ユーティリティモジュール
+リクエストデータや鉄道遅延情報リストなどの大きなペイロードは、出力先が実際に出力する場合にのみJSONに変換し、
+抽出と最大バイト数による切り詰めでログの量を抑える
+呼び出し毎のログの出力件数とバイト数はメトリクスとして記録する
+"""
+
+import json
+import os
+import random
+import sys
+from typing import Any
+
+from loguru import logger
+
+from utils import metrics
+from utils.base_class import Json
+
+# 定数群
+# 出力するログの最低レベル(ペイロードはDEBUGレベルで出力する)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+# ペイロードを出力する割合(0〜1)
+PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '1'))
+# ペイロード1件あたりの最大バイト数(超過分は切り詰める)
+PAYLOAD_MAX_BYTES = int(os.getenv('LOG_PAYLOAD_MAX_BYTES', '8192'))
+# UTF-8で1文字あたりの最大バイト数
+MAX_BYTES_PER_CHAR = 4
+
+_configured = False
+
+
+class Payload:
+    """ログ出力時に初めてJSONに変換するペイロード
+    loguruは出力先がない場合にメッセージを組み立てないため、変換処理も実行されない
+    """
+
+    __slots__ = ('value', 'max_bytes')
+
+    def __init__(self, value: Any, max_bytes: int = PAYLOAD_MAX_BYTES) -> None:
+        """
+        Args:
+            value: ペイロード(文字列とJSON形式に変換可能なクラスの場合はそのまま文字列に変換する)
+            max_bytes: 最大バイト数
+        """
+        self.value = value
+        self.max_bytes = max_bytes
+
+    def __str__(self) -> str:
+        text = str(self.value) if isinstance(self.value, (str, Json)) else json.dumps(
+            self.value, ensure_ascii=False, default=str)
+        return truncate(text, self.max_bytes)
+
+
+def truncate(text: str, max_bytes: int) -> str:
+    """テキストをUTF-8で最大バイト数までに切り詰める
+
+    Args:
+        text: テキスト
+        max_bytes: 最大バイト数
+
+    Returns:
+        切り詰めたテキスト(切り詰めた場合は省略したバイト数を末尾に付ける)
+    """
+    if len(text) * MAX_BYTES_PER_CHAR <= max_bytes:
+        return text
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    metrics.add('log.truncated_bytes', len(encoded) - max_bytes, metrics.UNIT_BYTES)
+    # 文字の途中で切れた場合は、その文字を除く
+    return (encoded[:max_bytes].decode('utf-8', 'ignore')
+            + f"...({len(encoded) - max_bytes}バイト省略)")
+
+
+def payload(message: str, value: Any) -> None:
+    """ペイロードをDEBUGレベルで出力する
+    PAYLOAD_SAMPLE_RATEの割合で抽出した場合のみ出力する
+
+    Args:
+        message: ペイロードの埋め込み先を{}としたメッセージ
+        value: ペイロード
+    """
+    if PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        metrics.add('log.sampled_out', 1)
+        return
+    logger.opt(depth=1).debug(message, Payload(value))
+
+
+def configure() -> None:
+    """ログの出力先を、LOG_LEVEL以上のログを標準エラー出力に出力し、出力量を集計する出力先に置き換える
+    複数回呼び出した場合は最初の1回のみ置き換える
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    logger.remove()
+    logger.add(_write, level=LOG_LEVEL)
+
+
+def _write(message: str) -> None:
+    """ログを標準エラー出力に出力し、出力件数とバイト数を集計する"""
+    sys.stderr.write(message)
+    metrics.add('log.records', 1)
+    metrics.add('log.bytes', len(message.encode('utf-8')), metrics.UNIT_BYTES)
@@ -0,0 +1,239 @@
+"""処理時間計測とメトリクス出力用ユーティリティモジュール
+呼び出し毎に処理段階毎の処理時間と件数を集計し、CloudWatch Embedded Metric Format(EMF)の
+JSONレコードとして標準出力に出力する
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+T = TypeVar('T')
+
+# 定数群
+NAMESPACE = os.getenv('METRICS_NAMESPACE', 'LineBot')
+# 1を指定すると、コンテナ毎に最初の1回の呼び出しのみcProfileでプロファイルを取得する
+PROFILE_ENABLED = os.getenv('PROFILE_INVOCATION') == '1'
+# プロファイル結果としてログに出力する関数の件数
+PROFILE_TOP_N = 30
+# EMFで1レコードに含められる最大メトリクス数
+MAX_METRICS_PER_RECORD = 100
+
+UNIT_MILLISECONDS = 'Milliseconds'
+UNIT_COUNT = 'Count'
+UNIT_BYTES = 'Bytes'
+UNIT_SECONDS = 'Seconds'
+
+
+class Recorder:
+    """1回の呼び出し分のメトリクスの集計クラス
+    複数スレッドから同時に記録できる
+    """
+
+    def __init__(self, function_name: str) -> None:
+        """
+        Args:
+            function_name: Lambda関数名(メトリクスのディメンション)
+        """
+        self.function_name = function_name
+        self._values: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float, unit: str = UNIT_COUNT) -> None:
+        """メトリクスの値を加算する
+
+        Args:
+            name: メトリクス名
+            value: 加算する値
+            unit: 単位
+        """
+        with self._lock:
+            current, _ = self._values.get(name, (0, unit))
+            self._values[name] = (current + value, unit)
+
+    def add_duration(self, name: str, seconds: float) -> None:
+        """処理段階の処理時間と実行回数を加算する
+
+        Args:
+            name: 処理段階名
+            seconds: 処理秒数
+        """
+        with self._lock:
+            current, _ = self._values.get(name, (0, UNIT_MILLISECONDS))
+            self._values[name] = (current + seconds * 1000, UNIT_MILLISECONDS)
+            count, _ = self._values.get(f"{name}.count", (0, UNIT_COUNT))
+            self._values[f"{name}.count"] = (count + 1, UNIT_COUNT)
+
+    def snapshot(self) -> Dict[str, Tuple[float, str]]:
+        """集計したメトリクスの複製を取得する"""
+        with self._lock:
+            return dict(self._values)
+
+    def to_emf(self) -> List[dict]:
+        """CloudWatch Embedded Metric Format形式のレコード群に変換する
+        1レコードに含められる最大メトリクス数を超える場合は、複数のレコードに分割する
+
+        Returns:
+            EMF形式のレコード群
+        """
+        values = self.snapshot()
+        names = sorted(values)
+        timestamp = int(time.time() * 1000)
+        records = []
+        for start in range(0, len(names), MAX_METRICS_PER_RECORD):
+            record_names = names[start:start + MAX_METRICS_PER_RECORD]
+            record = {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': NAMESPACE,
+                        'Dimensions': [['Function']],
+                        'Metrics': [{'Name': name, 'Unit': values[name][1]}
+                                    for name in record_names],
+                    }],
+                },
+                'Function': self.function_name,
+            }
+            for name in record_names:
+                record[name] = round(values[name][0], 3)
+            records.append(record)
+        return records
+
+
+# 実行中の呼び出しのメトリクス(Lambdaのコンテナは同時に1回の呼び出ししか処理しない)
+_recorder: Optional[Recorder] = None
+_recorder_lock = threading.Lock()
+_profiled = False
+
+
+def get_recorder() -> Optional[Recorder]:
+    """実行中の呼び出しのメトリクスの集計クラスを取得する
+
+    Returns:
+        集計クラス(呼び出しの外ではNone)
+    """
+    return _recorder
+
+
+def add(name: str, value: float, unit: str = UNIT_COUNT) -> None:
+    """実行中の呼び出しのメトリクスの値を加算する
+    呼び出しの外では何もしない
+
+    Args:
+        name: メトリクス名
+        value: 加算する値
+        unit: 単位
+    """
+    recorder = _recorder
+    if recorder:
+        recorder.add(name, value, unit)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """処理段階の処理時間を計測する
+
+    Args:
+        name: 処理段階名
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder = _recorder
+        if recorder:
+            recorder.add_duration(name, time.perf_counter() - started)
+
+
+def timed(func: Callable[..., T]) -> Callable[..., T]:
+    """関数の処理時間を計測するデコレータ
+    処理段階名は「モジュールのパス.関数名」とする
+    """
+    name = f"{func.__module__}.{func.__name__.lstrip('_')}"
+
+    @wraps(func)
+    def _wrapper(*args, **kwargs) -> T:
+        with span(name):
+            return func(*args, **kwargs)
+
+    return _wrapper
+
+
+def instrument(function_name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Lambdaのハンドラの呼び出し毎にメトリクスを集計し、終了時にEMF形式で出力するデコレータ
+    呼び出し中に別のハンドラを呼び出した場合は、呼び出し元の集計に含める
+    環境変数PROFILE_INVOCATIONが1の場合は、コンテナ毎に最初の1回の呼び出しのプロファイルを取得する
+    (プロファイルはハンドラを実行したスレッドのみが対象)
+
+    Args:
+        function_name: Lambda関数名(メトリクスのディメンション)
+    """
+    def _decorator(handler: Callable[..., T]) -> Callable[..., T]:
+        @wraps(handler)
+        def _wrapper(*args, **kwargs) -> T:
+            global _recorder
+            with _recorder_lock:
+                nested = _recorder is not None
+                if not nested:
+                    _recorder = Recorder(function_name)
+            if nested:
+                with span(f"{function_name}.handler"):
+                    return handler(*args, **kwargs)
+
+            profiler = _start_profile()
+            try:
+                with span(f"{function_name}.handler"):
+                    return handler(*args, **kwargs)
+            finally:
+                _stop_profile(profiler)
+                recorder = _recorder
+                with _recorder_lock:
+                    _recorder = None
+                emit(recorder)
+
+        return _wrapper
+
+    return _decorator
+
+
+def emit(recorder: Recorder) -> None:
+    """メトリクスをEMF形式のJSONレコードとして1行ずつ標準出力に出力する
+    CloudWatch LogsがEMF形式と認識できるよう、ログの書式を付けずに出力する
+
+    Args:
+        recorder: 集計クラス
+    """
+    sys.stdout.write("".join(
+        json.dumps(record, ensure_ascii=False) + "\n" for record in recorder.to_emf()))
+    sys.stdout.flush()
+
+
+def _start_profile() -> Optional[cProfile.Profile]:
+    """プロファイルが有効かつ未取得の場合のみプロファイルを開始する"""
+    global _profiled
+    if not PROFILE_ENABLED or _profiled:
+        return None
+    _profiled = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profile(profiler: Optional[cProfile.Profile]) -> None:
+    """プロファイルを終了し、累積時間の上位の関数をログに出力する"""
+    if profiler is None:
+        return
+    profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(
+        'cumulative').print_stats(PROFILE_TOP_N)
+    logger.info("プロファイル結果:\n{}", stream.getvalue())
@@ -0,0 +1,34 @@
+"""トレース記録用ユーティリティモジュール
+環境変数TRACE_RECORDINGが1の場合のみ、受信したWebhookイベントや取得した鉄道遅延情報リストを
+時刻付きのJSONレコード1件として標準出力に出力する
+CloudWatch Logsから"_trace"を含む行を抽出すると、benchmark.replayで再生できる
+"""
+
+import json
+import os
+import sys
+import time
+
+# 定数群
+ENABLED = os.getenv('TRACE_RECORDING') == '1'
+# トレースレコードの種類を保持するキー
+TRACE_KEY = '_trace'
+KIND_WEBHOOK = 'webhook'
+KIND_DELAY_INFO = 'delay_info'
+
+
+def record(kind: str, **fields) -> None:
+    """トレースレコードを出力する
+    記録が無効の場合は何もしない
+
+    Args:
+        kind: トレースレコードの種類
+        fields: 記録する項目
+    """
+    if not ENABLED:
+        return
+    entry = {TRACE_KEY: kind, 'time': round(time.time(), 3)}
+    entry.update(fields)
+    # ログの書式を付けずに1行で出力し、ログから抽出しやすくする
+    sys.stdout.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
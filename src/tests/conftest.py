@@ -0,0 +1,37 @@
+"""テスト共通のフィクスチャ
+インメモリDynamoDBとスタブサーバを使用し、AWSやLINEに接続せずにsrc/main配下のモジュールを実行する
+
+実行方法:
+    cd src/
+    python -m pytest tests
+"""
+
+from typing import Iterator
+
+import pytest
+
+from benchmark import offline
+from utils import metrics
+
+
+@pytest.fixture(scope='session')
+def offline_environment() -> Iterator[offline.OfflineEnvironment]:
+    """テスト全体で共有する計測環境(スタブサーバの起動は1回のみ)"""
+    environment = offline.OfflineEnvironment()
+    yield environment
+    environment.close()
+
+
+@pytest.fixture
+def environment(offline_environment: offline.OfflineEnvironment) -> offline.OfflineEnvironment:
+    """DynamoDBの内容とスタブの集計を初期化した計測環境"""
+    offline_environment.reset()
+    return offline_environment
+
+
+@pytest.fixture
+def recorder(monkeypatch: pytest.MonkeyPatch) -> metrics.Recorder:
+    """ハンドラの外で記録したメトリクスを集計する集計クラス"""
+    recorder = metrics.Recorder('tests')
+    monkeypatch.setattr(metrics, '_recorder', recorder)
+    return recorder
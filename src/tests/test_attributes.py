@@ -0,0 +1,64 @@
+"""DynamoDBの属性値形式への変換のテスト"""
+
+import copy
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer
+
+from aws.dynamodb import attributes
+
+# 定数群
+ITEM = {
+    'user_id': "U0123",
+    'active': True,
+    'count': 3,
+    'updated_time': Decimal('1760000000.123456'),
+    'company_types': {"HANKYU", "JR_WEST"},
+    'digests': {1, Decimal('2')},
+    'payload': b"\x00\x01",
+    'messages': [{'text': "遅延しています。", 'line': None}],
+}
+
+
+def test_item_round_trips() -> None:
+    """変換した属性値形式のデータは、元のデータに戻せる(数値はDecimal型になる)"""
+    item = copy.deepcopy(ITEM)
+
+    encoded = attributes.encode_item(item)
+
+    assert item == ITEM
+    assert attributes.decode_item(encoded) == ITEM
+    deserializer = TypeDeserializer()
+    assert {key: deserializer.deserialize(value) for key, value in encoded.items()} == ITEM
+
+
+@pytest.mark.parametrize('value', ['', set(), frozenset(), None])
+def test_empty_values_are_encoded_as_null(value: object) -> None:
+    """空文字列と空のセットはDynamoDBに登録できないため、NULLに変換する"""
+    assert attributes.encode_item({'nested': {'value': value}, 'value': value}) == {
+        'nested': {'M': {'value': {'NULL': True}}},
+        'value': {'NULL': True},
+    }
+
+
+@pytest.mark.parametrize('value, expected', [
+    (Decimal('1760000000.123456789012345678901234567890123'),
+     '1760000000.1234567890123456789012345679'),
+    (0.1, '0.1'),
+    (10 ** 40, str(10 ** 40)),
+    (Decimal('1E+3'), '1E+3'),
+])
+def test_numbers_are_rounded_to_dynamodb_precision(value: object, expected: str) -> None:
+    """小数はDynamoDBの最大精度(38桁)に丸め、浮動小数点数は表記どおりの値に変換する"""
+    assert attributes.encode_value(value) == {'N': expected}
+
+
+def test_unsupported_values_raise_type_error() -> None:
+    """変換できない型の値と属性値はTypeErrorとする"""
+    with pytest.raises(TypeError):
+        attributes.encode_value({1, "HANKYU"})
+    with pytest.raises(TypeError):
+        attributes.encode_value(object())
+    with pytest.raises(TypeError):
+        attributes.decode_value({'X': "?"})
@@ -0,0 +1,76 @@
+"""JSON形式に変換可能な基底クラスのテスト"""
+
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import pytest
+
+from utils.base_class import Json
+
+
+class Station(Json):
+    name: str
+    lines: List[str] = []
+
+
+class Route(Json):
+    route_id: int
+    fare: Decimal
+    origin: Station
+    stops: Dict[str, int] = {}
+    note: Optional[str] = None
+
+
+# 定数群
+# 信頼できない取り込み元から受け取る想定の経路データ
+ROUTE = {
+    'route_id': Decimal('1'),
+    'fare': 1.1,
+    'origin': {'name': "梅田", 'lines': ("阪急神戸本線",)},
+    'stops': {'十三': Decimal('2')},
+}
+
+
+def test_from_dict_validates_and_coerces_values() -> None:
+    """検証する場合、型注釈に従って入れ子のモデルまで変換する"""
+    route = Route.from_dict(ROUTE, validate=True)
+
+    assert route == Route(
+        route_id=1, fare=Decimal('1.1'),
+        origin=Station(name="梅田", lines=["阪急神戸本線"]),
+        stops={'十三': 2})
+    assert type(route.route_id) is int
+    assert type(route.stops['十三']) is int
+
+
+def test_from_dict_without_validation_keeps_values() -> None:
+    """検証しない場合、入れ子のモデルのみ変換し、値はそのまま設定する"""
+    route = Route.from_dict(ROUTE)
+
+    assert route.route_id is ROUTE['route_id']
+    assert route.fare == 1.1
+    assert route.origin == Station(name="梅田", lines=("阪急神戸本線",))
+
+
+@pytest.mark.parametrize('field_name, value', [
+    ('route_id', True),
+    ('route_id', Decimal('1.5')),
+    ('fare', "無料"),
+    ('origin', "梅田"),
+    ('stops', {'十三': "二"}),
+    ('note', 1),
+])
+def test_from_dict_rejects_values_of_wrong_type(field_name: str, value: object) -> None:
+    """検証する場合、型が正しくない値はValueErrorとする"""
+    with pytest.raises(ValueError, match=field_name):
+        Route.from_dict(dict(ROUTE, **{field_name: value}), validate=True)
+
+
+def test_from_dict_requires_fields_without_default() -> None:
+    """デフォルト値のない項目が設定されていない場合はValueErrorとし、ある項目は省略できる"""
+    with pytest.raises(ValueError, match='fare'):
+        Route.from_dict({'route_id': 1, 'origin': {'name': "梅田"}}, validate=True)
+
+    station = Station.from_dict({'name': "梅田"}, validate=True)
+    assert station.lines == []
+    assert station.lines is not Station(name="十三").lines
@@ -0,0 +1,63 @@
+"""鉄道遅延情報のコンテナ内キャッシュのテスト"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from aws.dynamodb import users_table
+from aws.dynamodb.cache import DelayInfoCache
+from benchmark import offline
+from utils import metrics
+
+# 定数群
+TTL = 60
+HITS_METRIC = 'aws.dynamodb.users_table.delay_info_cache.hits'
+MISSES_METRIC = 'aws.dynamodb.users_table.delay_info_cache.misses'
+
+
+def now() -> Decimal:
+    return Decimal(datetime.utcnow().timestamp())
+
+
+def test_delay_info_expires_after_ttl_from_updated_time(
+        environment: offline.OfflineEnvironment) -> None:
+    """鉄道遅延情報の更新日時から有効秒数を経過したキャッシュは破棄する"""
+    environment.seed_delay_info('delay_quiet', now())
+    delay_info = users_table.get_delay_info()
+    cache = DelayInfoCache(TTL)
+
+    cache.set(delay_info)
+    assert cache.get() is delay_info
+
+    cache.set(delay_info.copy({'updated_time': now() - TTL}))
+    assert cache.get() is None
+
+
+def test_cached_delay_info_is_read_once_until_invalidated(
+        environment: offline.OfflineEnvironment, recorder: metrics.Recorder) -> None:
+    """有効期限内はDBから取得せず、DBの鉄道遅延情報を更新するとキャッシュを破棄する"""
+    environment.seed_delay_info('delay_quiet', now())
+    get_items = environment.dynamodb.calls['GetItem']
+
+    first = users_table.get_cached_delay_info()
+    second = users_table.get_cached_delay_info()
+
+    assert second is first
+    assert environment.dynamodb.calls['GetItem'] - get_items == 1
+    assert recorder.snapshot()[HITS_METRIC] == (1, metrics.UNIT_COUNT)
+    assert recorder.snapshot()[MISSES_METRIC] == (1, metrics.UNIT_COUNT)
+
+    users_table.touch_delay_info()
+
+    assert users_table.get_cached_delay_info().updated_time > first.updated_time
+    assert environment.dynamodb.calls['GetItem'] - get_items == 2
+
+
+def test_stale_delay_info_is_not_cached(environment: offline.OfflineEnvironment) -> None:
+    """更新日時が有効秒数より古い鉄道遅延情報は、毎回DBから取得する"""
+    environment.seed_delay_info('delay_quiet')
+    get_items = environment.dynamodb.calls['GetItem']
+
+    users_table.get_cached_delay_info()
+    users_table.get_cached_delay_info()
+
+    assert environment.dynamodb.calls['GetItem'] - get_items == 2
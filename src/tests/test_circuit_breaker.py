@@ -0,0 +1,60 @@
+"""サーキットブレーカのテスト"""
+
+import time
+
+from utils.circuit_breaker import CircuitBreaker
+
+# 定数群
+FAILURE_THRESHOLD = 2
+RESET_SECONDS = 0.05
+
+
+def open_circuit_breaker() -> CircuitBreaker:
+    circuit_breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_SECONDS)
+    for _ in range(FAILURE_THRESHOLD):
+        assert circuit_breaker.allow()
+        circuit_breaker.record_failure()
+    return circuit_breaker
+
+
+def test_consecutive_failures_open_the_circuit() -> None:
+    """連続失敗回数が閾値に達するまでは許可し、達すると遮断する"""
+    circuit_breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_SECONDS)
+    circuit_breaker.record_failure()
+    assert circuit_breaker.allow()
+    circuit_breaker.record_failure()
+
+    assert not circuit_breaker.allow()
+
+
+def test_success_resets_consecutive_failures() -> None:
+    """成功すると連続失敗回数を数え直す"""
+    circuit_breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_SECONDS)
+    circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.allow()
+
+
+def test_only_one_trial_is_allowed_after_reset_seconds() -> None:
+    """遮断秒数の経過後は1つの呼び出しのみ試行を許可し、成功すると遮断を解除する"""
+    circuit_breaker = open_circuit_breaker()
+    time.sleep(RESET_SECONDS)
+
+    assert circuit_breaker.allow()
+    assert not circuit_breaker.allow()
+    circuit_breaker.record_success()
+    assert circuit_breaker.allow()
+    assert circuit_breaker.allow()
+
+
+def test_failed_trial_opens_the_circuit_again() -> None:
+    """試行に失敗すると再び遮断する"""
+    circuit_breaker = open_circuit_breaker()
+    time.sleep(RESET_SECONDS)
+    assert circuit_breaker.allow()
+
+    circuit_breaker.record_failure()
+
+    assert not circuit_breaker.allow()
@@ -0,0 +1,62 @@
+"""遅延している路線の差分通知のテスト"""
+
+from typing import List
+
+import railway
+from aws.dynamodb.delay_info import ALL, HANKYU, HANSHIN, WEST_JR, Messages
+
+
+def create_messages(west_jr: List[str], hankyu: List[str], hanshin: List[str],
+                    digest: str = "digest") -> Messages:
+    """運営会社毎の遅延している路線名リストを持つ鉄道遅延情報メッセージ群を作成する"""
+    return Messages(
+        west_jr="JR西日本のメッセージ",
+        hankyu="阪急のメッセージ",
+        hanshin="阪神のメッセージ",
+        all="全運営会社のメッセージ",
+        digests={'ALL': digest},
+        delay_lines={str(WEST_JR): west_jr, str(HANKYU): hankyu, str(HANSHIN): hanshin}
+    )
+
+
+def test_diff_messages_finds_added_and_recovered_lines() -> None:
+    """運営会社毎に新たに遅延した路線と運転を再開した路線を元の順で求め、全運営会社分は連結する"""
+    previous = create_messages(["JR神戸線", "JR京都線"], ["阪急神戸本線"], [])
+    latest = create_messages(["JR京都線", "JR宝塚線", "JR宝塚線"], ["阪急神戸本線"], ["阪神本線"])
+
+    deltas = railway.diff_messages(latest, previous)
+
+    assert deltas[WEST_JR] == railway.DelayDelta(added=["JR宝塚線"], resolved=["JR神戸線"])
+    assert not deltas[HANKYU].changed
+    assert deltas[HANSHIN] == railway.DelayDelta(added=["阪神本線"], resolved=[])
+    assert deltas[ALL] == railway.DelayDelta(added=["JR宝塚線", "阪神本線"], resolved=["JR神戸線"])
+
+
+def test_diff_messages_requires_recorded_lines() -> None:
+    """どちらかに遅延している路線名リストが未登録の場合は差分を求めない"""
+    latest = create_messages(["JR神戸線"], [], [])
+    previous = latest.copy({'delay_lines': {str(WEST_JR): [], str(HANKYU): []}})
+
+    assert railway.diff_messages(latest, previous) is None
+    assert railway.diff_messages(previous, latest) is None
+
+
+def test_delta_messages_report_changes_and_keep_latest_state() -> None:
+    """差分のある運営会社は新たな遅延と運転再開のみを知らせ、それ以外と差分の基準は最新から引き継ぐ"""
+    previous = create_messages(["JR神戸線"], [], ["阪神本線"], digest="previous")
+    latest = create_messages(["JR神戸線"], ["阪急京都本線"], [], digest="latest")
+
+    messages = railway.generate_delta_messages(
+        latest, railway.diff_messages(latest, previous))
+
+    assert messages.west_jr == latest.west_jr
+    assert messages.hankyu == "\n".join([
+        "阪急京都本線が遅延しています。", railway.COMPANY_URLS[HANKYU]])
+    assert messages.hanshin == "\n".join([
+        "【運転再開】阪神本線", railway.COMPANY_URLS[HANSHIN]])
+    assert messages.all == "\n".join([
+        "阪急京都本線が遅延しています。", "【運転再開】阪神本線",
+        railway.COMPANY_URLS[HANKYU], railway.COMPANY_URLS[HANSHIN]])
+    assert messages.digests == latest.digests
+    assert messages.delay_lines == latest.delay_lines
+    assert railway.diff_messages(latest, messages)[ALL] == railway.DelayDelta([], [])
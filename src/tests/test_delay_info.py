@@ -0,0 +1,106 @@
+"""鉄道遅延情報の取得と登録のテスト"""
+
+import json
+
+import railway
+from aws.dynamodb import users_table
+from aws.dynamodb.delay_info import ALL_KEY
+from benchmark import offline
+from benchmark.stub_server import DELAY_PATH, load_fixture
+from utils import metrics
+
+# 定数群
+WRITE_SKIPPED_METRIC = 'aws.dynamodb.users_table.delay_info.write_skipped'
+WRITE_PERFORMED_METRIC = 'aws.dynamodb.users_table.delay_info.write_performed'
+AREA_UPDATES_METRIC = 'railway.delay_info.area_updates'
+
+
+def test_unchanged_delay_info_is_validated_without_registering_messages(
+        environment: offline.OfflineEnvironment, recorder: metrics.Recorder) -> None:
+    """遅延している路線に変化がない場合、メッセージは登録せず更新日時と検証用ヘッダのみ更新する"""
+    environment.seed_delay_info('delay_quiet')
+    environment.serve_delay_info('delay_kansai')
+    railway.request_delay_info_messages(users_table.get_delay_info())
+    # 内容は同じで検証用ヘッダのみ異なる鉄道遅延情報リストを返す
+    environment.stub.set_delay_info(json.dumps(
+        json.loads(load_fixture('delay_kansai')), indent=1).encode('utf-8'))
+    db_delay_info = users_table.get_delay_info()
+    performed = recorder.snapshot()[WRITE_PERFORMED_METRIC]
+
+    messages = railway.request_delay_info_messages(db_delay_info)
+
+    assert messages == db_delay_info.messages
+    assert recorder.snapshot()[WRITE_SKIPPED_METRIC] == (1, metrics.UNIT_COUNT)
+    assert recorder.snapshot()[WRITE_PERFORMED_METRIC] == performed
+    validated = users_table.get_delay_info()
+    assert validated.messages == db_delay_info.messages
+    assert validated.updated_time > db_delay_info.updated_time
+    assert validated.etag != db_delay_info.etag
+    assert users_table.delay_info_cache.get() is not None
+
+
+def test_not_modified_delay_info_uses_registered_messages(
+        environment: offline.OfflineEnvironment) -> None:
+    """取得先が変更なしと応答した場合、登録済みのメッセージを使用して更新日時のみ更新する"""
+    environment.seed_delay_info('delay_kansai')
+    environment.serve_delay_info('delay_kansai')
+    railway.request_delay_info_messages(users_table.get_delay_info())
+    db_delay_info = users_table.get_delay_info()
+
+    messages = railway.request_delay_info_messages(db_delay_info)
+
+    assert environment.stub.not_modified == 1
+    assert messages == db_delay_info.messages
+    assert users_table.get_delay_info().updated_time >= db_delay_info.updated_time
+
+
+def test_changed_delay_info_is_registered(
+        environment: offline.OfflineEnvironment, recorder: metrics.Recorder) -> None:
+    """遅延している路線に変化がある場合、最新のメッセージを登録する"""
+    environment.seed_delay_info('delay_quiet')
+    environment.serve_delay_info('delay_kansai')
+    db_delay_info = users_table.get_delay_info()
+
+    messages = railway.request_delay_info_messages(db_delay_info)
+
+    assert messages != db_delay_info.messages
+    assert messages == railway.delay_info._generate_delay_info_messages(
+        json.loads(load_fixture('delay_kansai')))
+    assert users_table.get_delay_info().messages == messages
+    assert recorder.snapshot()[WRITE_PERFORMED_METRIC] == (1, metrics.UNIT_COUNT)
+    assert WRITE_SKIPPED_METRIC not in recorder.snapshot()
+
+
+def test_every_area_is_registered_from_one_fetch(
+        environment: offline.OfflineEnvironment, recorder: metrics.Recorder) -> None:
+    """1回の取得で全エリアの鉄道遅延情報を作成し、利用者に応答・通知するエリア以外はエリア毎に登録する"""
+    environment.seed_delay_info('delay_quiet')
+    environment.serve_delay_info('delay_kansai')
+
+    railway.request_delay_info_messages(users_table.get_delay_info())
+
+    assert environment.stub.requests[DELAY_PATH] == 1
+    kanto = users_table.get_area_delay_info('kanto')
+    assert kanto.messages.delay_lines['EAST_JR'] == [
+        "JR中央線快速", "JR埼京線", "JR常磐線各駅停車", "JR宇都宮線", "JR高崎線", "JR武蔵野線"]
+    assert kanto.messages.delay_lines['TOKYO_METRO'] == ["東京メトロ東西線", "東京メトロ半蔵門線"]
+    assert kanto.digest == kanto.messages.digests[ALL_KEY]
+    tokai = users_table.get_area_delay_info('tokai')
+    assert tokai.messages.delay_lines == {'CENTRAL_JR': ["JR東海道本線"], 'MEITETSU': ["名鉄名古屋本線"]}
+    assert recorder.snapshot()[AREA_UPDATES_METRIC] == (2, metrics.UNIT_COUNT)
+
+
+def test_unchanged_area_is_not_registered_again(
+        environment: offline.OfflineEnvironment, recorder: metrics.Recorder) -> None:
+    """エリアの遅延している路線に変化がない場合、エリアの鉄道遅延情報を登録し直さない"""
+    environment.seed_delay_info('delay_quiet')
+    environment.serve_delay_info('delay_kansai')
+    railway.request_delay_info_messages(users_table.get_delay_info())
+    kanto = users_table.get_area_delay_info('kanto')
+    environment.stub.set_delay_info(json.dumps(
+        json.loads(load_fixture('delay_kansai')), indent=1).encode('utf-8'))
+
+    railway.request_delay_info_messages(users_table.get_delay_info())
+
+    assert users_table.get_area_delay_info('kanto') == kanto
+    assert recorder.snapshot()[AREA_UPDATES_METRIC] == (2, metrics.UNIT_COUNT)
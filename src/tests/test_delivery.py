@@ -0,0 +1,73 @@
+"""LINE Bot API並行送信のテスト"""
+
+import threading
+import time
+from typing import List, Set
+
+import pytest
+
+from line.delivery import DeliveryStats, TokenBucket, deliver_in_order
+
+# 定数群
+RATE = 100
+ACQUIRES = 11
+WORKERS = 4
+CHUNKS = 12
+FAILING_POSITION = 5
+
+
+def test_token_bucket_limits_request_rate() -> None:
+    """最大トークン数を使い切った後は、補充レートを超えないよう待機する"""
+    bucket = TokenBucket(RATE)
+
+    started = time.monotonic()
+    waited = [bucket.acquire() for _ in range(ACQUIRES)]
+    elapsed = time.monotonic() - started
+
+    assert waited[0] == 0
+    assert elapsed >= (ACQUIRES - 1) / RATE * 0.9
+    assert sum(waited) >= (ACQUIRES - 1) / RATE * 0.9
+
+
+@pytest.mark.parametrize('rate, capacity', [(0, 1), (RATE, 0)])
+def test_token_bucket_rejects_invalid_settings(rate: float, capacity: int) -> None:
+    """補充レートまたは最大トークン数が正しくない場合はValueErrorとする"""
+    with pytest.raises(ValueError):
+        TokenBucket(rate, capacity)
+
+
+def test_positions_are_committed_in_order() -> None:
+    """先に送信を終えた後続のチャンクがあっても、先頭から連続して送信を終えた位置までのみ記録する"""
+    sent: Set[int] = set()
+    committed: List[int] = []
+    caller = threading.current_thread()
+
+    def _send(chunk: List[str], position: int) -> None:
+        # 先頭に近いチャンクほど送信に時間がかかるようにする
+        time.sleep((CHUNKS - position) * 0.002)
+        if position == FAILING_POSITION:
+            raise RuntimeError("送信に失敗しました。")
+        sent.add(position)
+
+    def _checkpoint(position: int, stats: DeliveryStats) -> None:
+        assert threading.current_thread() is caller
+        assert all(index in sent or index == FAILING_POSITION for index in range(position + 1))
+        assert stats.chunks == position + 1
+        committed.append(position)
+
+    stats = deliver_in_order(
+        ((["U" + str(position)], position) for position in range(CHUNKS)),
+        _send, WORKERS, TokenBucket(10000, CHUNKS), _checkpoint)
+
+    assert committed == sorted(committed)
+    assert committed[-1] == CHUNKS - 1
+    assert sent == set(range(CHUNKS)) - {FAILING_POSITION}
+    assert stats.chunks == stats.recipients == CHUNKS
+    assert stats.failed_chunks == [["U" + str(FAILING_POSITION)]]
+
+
+def test_workers_must_be_positive() -> None:
+    """ワーカ数が1未満の場合はValueErrorとする"""
+    with pytest.raises(ValueError):
+        deliver_in_order([], lambda chunk, position: None, 0, TokenBucket(RATE),
+                         lambda position, stats: None)
@@ -0,0 +1,82 @@
+"""テキストメッセージの意図判定のテスト"""
+
+import itertools
+from typing import Optional
+
+import pytest
+
+from aws.dynamodb import delay_info
+from functions import intents, texts
+from functions.intents import IntentClassifier
+
+# 定数群
+# 同じ位置から始まるキーワードの優先度が、長さの順と一致しない判定ルール
+RULES = [
+    {'name': 'hankyu', 'company': 'HANKYU', 'keywords': ["阪急"]},
+    {'name': 'all', 'company': 'ALL', 'keywords': ["阪急神戸", "遅延", "阪急"]},
+    {'name': 'hanshin', 'company': 'HANSHIN', 'keywords': ["阪神", "急神"]},
+    {'name': 'how_to_use', 'text': 'HOW_TO_USE', 'keywords': ["使い方"]},
+]
+
+
+def naive_classify(rules: list, text: str) -> Optional[str]:
+    """テキストに含まれる全キーワードから最も優先度の高い判定ルール名を求める(比較用)"""
+    for rule in rules:
+        if any(keyword in text for keyword in rule['keywords']):
+            return rule['name']
+    return None
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 長いキーワードに一致しても、同じ位置から始まる優先度の高い短いキーワードを採用する
+    ("阪急神戸線は?", 'hankyu'),
+    # 重なり合うキーワードも判定対象とする
+    ("遅延の急神", 'all'),
+    ("神戸の急神", 'hanshin'),
+    ("使い方", 'how_to_use'),
+    ("こんにちは", None),
+])
+def test_highest_priority_keyword_wins(text: str, expected: Optional[str]) -> None:
+    """テキストに含まれるキーワードのうち、最も優先度の高い意図に判定する"""
+    intent = IntentClassifier(RULES).classify(text)
+
+    assert (intent.name if intent else None) == expected
+
+
+def test_classify_matches_naive_search() -> None:
+    """キーワードの組み合わせによらず、全キーワードを個別に探した場合と同じ意図に判定する"""
+    classifier = IntentClassifier(RULES)
+    fragments = ["阪", "急", "神", "戸", "遅延", "使い方", "は"]
+
+    for length in range(1, 5):
+        for parts in itertools.product(fragments, repeat=length):
+            text = "".join(parts)
+            intent = classifier.classify(text)
+            assert (intent.name if intent else None) == naive_classify(RULES, text), text
+
+
+def test_extracted_keywords_keep_the_intent() -> None:
+    """抽出したキーワードを連結したテキストは、元のテキストと同じ意図に判定する"""
+    classifier = IntentClassifier(RULES)
+    text = "今日の阪急神戸線の遅延は?"
+
+    keywords = classifier.extract_keywords(text)
+
+    assert keywords == ["阪急神戸", "阪急", "急神", "遅延"]
+    assert classifier.classify("".join(keywords)) == classifier.classify(text)
+
+
+def test_rules_are_resolved() -> None:
+    """運営会社種類と応答テキストを判定ルールの名前から解決し、キーワードのない判定ルールは受け付けない"""
+    classifier = IntentClassifier(RULES)
+
+    assert classifier.classify("阪神").company_type == delay_info.HANSHIN
+    assert classifier.classify("使い方").text == texts.HOW_TO_USE
+    with pytest.raises(ValueError):
+        IntentClassifier([{'name': 'empty', 'keywords': []}])
+
+
+def test_bundled_rules_prefer_company_over_status() -> None:
+    """同梱の判定ルールでは、運営会社の指定を遅延状況の確認より優先する"""
+    assert intents.classifier.classify("阪急の遅延を確認").company_type == delay_info.HANKYU
+    assert intents.classifier.classify("遅延を確認").company_type == delay_info.ALL
@@ -0,0 +1,19 @@
+"""LINE Bot APIの送信処理のテスト"""
+
+import uuid
+
+from benchmark import offline
+from line import line_bot_api
+
+
+def test_accepted_retry_key_is_not_delivered_twice(
+        environment: offline.OfflineEnvironment) -> None:
+    """受理済みの再試行キーで再送した場合、409を受け取っても例外にせず重複して通知しない"""
+    user_ids = [offline.create_user_id(index) for index in range(3)]
+    retry_key = str(uuid.uuid4())
+
+    line_bot_api.multicast_text_message(user_ids, "テスト", retry_key=retry_key)
+    line_bot_api.multicast_text_message(user_ids, "テスト", retry_key=retry_key)
+
+    assert environment.stub.recipients == len(user_ids)
+    assert environment.stub.conflicts == 1
@@ -0,0 +1,23 @@
+"""メトリクス出力のテスト"""
+
+from utils import metrics
+
+# 定数群
+METRICS = metrics.MAX_METRICS_PER_RECORD * 2 + 1
+
+
+def test_metrics_are_split_into_records() -> None:
+    """1レコードに含められる最大メトリクス数を超える場合、全メトリクスを複数のレコードに分割する"""
+    recorder = metrics.Recorder('tests')
+    for index in range(METRICS):
+        recorder.add(f"metric_{index:03d}", index)
+
+    records = recorder.to_emf()
+
+    assert [len(record['_aws']['CloudWatchMetrics'][0]['Metrics']) for record in records] == \
+        [metrics.MAX_METRICS_PER_RECORD, metrics.MAX_METRICS_PER_RECORD, 1]
+    values = {}
+    for record in records:
+        for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            values[metric['Name']] = record[metric['Name']]
+    assert values == {f"metric_{index:03d}": index for index in range(METRICS)}
@@ -0,0 +1,176 @@
+"""通知処理のテスト"""
+
+import json
+from typing import Iterator, List, Optional, Tuple
+
+import pytest
+
+import railway
+from aws.dynamodb import attributes, delay_info, notification_run, users_table
+from aws.dynamodb.delivery_ledger import DeliveryLedger, create_ledger_id
+from aws.dynamodb.notification_run import NotificationRun
+from benchmark import offline
+from benchmark.stub_server import load_fixture
+from functions import notification
+from utils import metrics
+
+# 定数群
+# 全運営会社を通知対象とするユーザのシャードが複数のチャンクに分かれるユーザ数
+USERS = 3000
+# 通知を中断させる配信記録の更新回数
+FAILING_RECORD = 3
+# 全運営会社を通知対象とするユーザの1つ目のシャードの配信記録のID
+INTERRUPTED_LEDGER_ID = create_ledger_id(notification_run.create_shard_key(delay_info.ALL, 0))
+SUPPRESSED_METRIC = 'notification.suppressed_recipients'
+
+
+def prepare(environment: offline.OfflineEnvironment) -> None:
+    """通知対象のユーザと、通知が必要な鉄道遅延情報を用意する"""
+    environment.seed_delay_info('delay_quiet')
+    environment.seed_users(USERS)
+    environment.serve_delay_info('delay_kansai')
+
+
+def fail_record(monkeypatch: pytest.MonkeyPatch, failing: int = FAILING_RECORD) -> List[tuple]:
+    """1つ目のシャードの配信記録の更新をfailing回目に失敗させる
+
+    Returns:
+        配信記録の更新時の引数のリスト
+    """
+    record = DeliveryLedger.record
+    records = []
+
+    def _record(ledger: DeliveryLedger, *args, **kwargs) -> None:
+        if ledger.ledger_id == INTERRUPTED_LEDGER_ID:
+            records.append(args)
+            if len(records) == failing:
+                raise RuntimeError("配信記録の更新に失敗しました。")
+        record(ledger, *args, **kwargs)
+
+    monkeypatch.setattr(DeliveryLedger, 'record', _record)
+    return records
+
+
+def restart_run(environment: offline.OfflineEnvironment) -> NotificationRun:
+    """未完了の実行記録を削除し、同じメッセージを全運営会社を通知対象とするユーザに通知する実行記録を作成し直す"""
+    environment.dynamodb.delete_item(
+        TableName=users_table.USERS_TABLE_NAME,
+        Key=attributes.encode_item({'user_id': users_table.NOTIFICATION_RUN_ID}))
+    messages = railway.delay_info._generate_delay_info_messages(
+        json.loads(load_fixture('delay_kansai')))
+    run = notification.create_notification_run(messages, [delay_info.ALL])
+    assert users_table.start_notification_run(run)
+    return run
+
+
+def suppressed_recipients(environment: offline.OfflineEnvironment) -> int:
+    """直近の呼び出しで配信済みのため除外したユーザ数"""
+    return environment.last_metrics.get(SUPPRESSED_METRIC, (0, metrics.UNIT_COUNT))[0]
+
+
+def test_all_users_are_notified(environment: offline.OfflineEnvironment) -> None:
+    """通知対象の全ユーザに1回ずつ通知する"""
+    prepare(environment)
+
+    notification.main({}, None)
+
+    assert users_table.get_notification_run().completed
+    assert environment.stub.recipients == USERS
+
+
+def test_interrupted_shard_resumes_from_checkpoint(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """中断したシャードは記録した位置の続きから通知し、同じユーザに重複して通知しない"""
+    prepare(environment)
+    # 中断したワーカのリースの期限切れを待たずに振り分け直せるようにする
+    monkeypatch.setattr(users_table, 'NOTIFICATION_RUN_LEASE_SECONDS', -1)
+    record = DeliveryLedger.record
+    records = fail_record(monkeypatch)
+    notification.main({}, None)
+    assert not users_table.get_notification_run().completed
+    # 失敗する直前に記録した再開位置
+    recorded_cursor = records[FAILING_RECORD - 2][1]
+
+    iter_user_chunks = notification._iter_user_chunks
+    cursors = []
+
+    def _iter_user_chunks(segment: int, total_segments: int,
+                          cursor: Optional[str]) -> Iterator[Tuple[List[str], Optional[str]]]:
+        cursors.append(cursor)
+        return iter_user_chunks(segment, total_segments, cursor)
+
+    monkeypatch.setattr(DeliveryLedger, 'record', record)
+    monkeypatch.setattr(notification, '_iter_user_chunks', _iter_user_chunks)
+    notification.main({}, None)
+
+    assert users_table.get_notification_run().completed
+    assert cursors == [recorded_cursor]
+    assert recorded_cursor is not None
+    assert environment.stub.recipients == USERS
+
+
+def test_rerun_skips_users_delivered_by_another_run(
+        environment: offline.OfflineEnvironment) -> None:
+    """同じメッセージを再実行した場合、別の実行で配信済みのユーザには通知せず、除外したユーザ数を記録する"""
+    environment.seed_users(USERS, subscriber_ratio=0)
+    restart_run(environment)
+    notification.main({}, None)
+    assert environment.stub.recipients == USERS
+
+    run = restart_run(environment)
+    notification.main({}, None)
+
+    assert environment.stub.recipients == USERS
+    progress = users_table.get_notification_run().progress
+    assert [shard['suppressed'] for shard in progress.values()] == [USERS]
+    assert suppressed_recipients(environment) == USERS
+    assert run.run_id == users_table.get_notification_run().run_id
+
+
+def test_resumed_rerun_does_not_count_suppressed_users_twice(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """別の実行の配信記録から再開した実行がさらに中断した場合も、除外したユーザ数を1回のみ数える"""
+    monkeypatch.setattr(users_table, 'NOTIFICATION_RUN_LEASE_SECONDS', -1)
+    environment.seed_users(USERS, subscriber_ratio=0)
+    record = DeliveryLedger.record
+    # 通知を終えたチャンクの記録後、シャードの完了の記録までに中断させる
+    records = fail_record(monkeypatch, failing=2)
+    restart_run(environment)
+    notification.main({}, None)
+    # 中断した実行が配信を記録したユーザ数
+    delivered = records[0][2]
+
+    # 別の実行の配信記録から再開した実行を、配信記録を更新する前に中断させる
+    records = fail_record(monkeypatch, failing=1)
+    restart_run(environment)
+    notification.main({}, None)
+    assert not users_table.get_notification_run().completed
+    assert suppressed_recipients(environment) == delivered
+
+    monkeypatch.setattr(DeliveryLedger, 'record', record)
+    notification.main({}, None)
+
+    run = users_table.get_notification_run()
+    assert run.completed
+    assert [shard['suppressed'] for shard in run.progress.values()] == [delivered]
+    assert suppressed_recipients(environment) == 0
+
+
+def test_ledger_is_not_reused_when_segments_change(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """シャードの分割数が変わった場合、シャードに属するユーザが変わるため配信記録を再利用しない"""
+    environment.seed_users(USERS, subscriber_ratio=0)
+    restart_run(environment)
+    notification.main({}, None)
+
+    monkeypatch.setattr(users_table, 'SCAN_SEGMENTS', 2)
+    restart_run(environment)
+    notification.main({}, None)
+
+    assert environment.stub.recipients == USERS * 2
+    progress = users_table.get_notification_run().progress
+    assert [shard['suppressed'] for shard in progress.values()] == [0, 0]
+    assert suppressed_recipients(environment) == 0
@@ -0,0 +1,45 @@
+"""鉄道遅延情報の再取得リースのテスト"""
+
+import pytest
+
+from aws.dynamodb import users_table
+from benchmark import offline
+
+
+def test_lease_is_held_by_one_owner_until_released(
+        environment: offline.OfflineEnvironment) -> None:
+    """リースは1つの所有者のみ取得でき、解放後は他の所有者が取得できる"""
+    environment.seed_delay_info('delay_quiet')
+
+    assert users_table.acquire_refresh_lease('first')
+    assert not users_table.acquire_refresh_lease('second')
+
+    users_table.release_refresh_lease('first')
+
+    assert users_table.acquire_refresh_lease('second')
+
+
+def test_lease_does_not_overwrite_delay_info(environment: offline.OfflineEnvironment) -> None:
+    """リースの取得と解放は鉄道遅延情報の内容を変更しない"""
+    environment.seed_delay_info('delay_kansai')
+    db_delay_info = users_table.get_delay_info()
+
+    assert users_table.acquire_refresh_lease('first')
+    users_table.release_refresh_lease('first')
+
+    assert users_table.get_delay_info() == db_delay_info
+
+
+def test_expired_lease_can_be_taken_over(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """有効期限切れのリースは他の所有者が取得でき、元の所有者は取得し直されたリースを解放しない"""
+    environment.seed_delay_info('delay_quiet')
+    monkeypatch.setattr(users_table, 'REFRESH_LEASE_SECONDS', -1)
+    assert users_table.acquire_refresh_lease('first')
+    monkeypatch.setattr(users_table, 'REFRESH_LEASE_SECONDS', 10)
+
+    assert users_table.acquire_refresh_lease('second')
+    users_table.release_refresh_lease('first')
+
+    assert not users_table.acquire_refresh_lease('first')
@@ -0,0 +1,118 @@
+"""応答処理の鉄道遅延情報の取得のテスト"""
+
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import railway
+from aws.dynamodb import users_table
+from benchmark import offline
+from benchmark.stub_server import DELAY_PATH
+from functions import reply
+from utils.circuit_breaker import CircuitOpenError
+
+# 定数群
+# 他の呼び出しが鉄道遅延情報を再取得している間の最大待機秒数(テスト用に短くする)
+REFRESH_WAIT_SECONDS = 0.5
+
+
+def now() -> Decimal:
+    return Decimal(datetime.utcnow().timestamp())
+
+
+def test_fresh_delay_info_is_served_without_refreshing(
+        environment: offline.OfflineEnvironment) -> None:
+    """鮮度の有効秒数内の場合、取得先にリクエストせずにDBの鉄道遅延情報で応答する"""
+    environment.seed_delay_info('delay_kansai', now())
+    db_delay_info = users_table.get_delay_info()
+
+    resolved = reply.resolve_railway_delay_info_messages()
+    reply.wait_background_refresh()
+
+    assert resolved.messages == db_delay_info.messages
+    assert environment.stub.requests[DELAY_PATH] == 0
+
+
+def test_stale_delay_info_is_served_and_refreshed_after_reply(
+        environment: offline.OfflineEnvironment) -> None:
+    """最大経過秒数内の場合、DBの鉄道遅延情報で応答し、応答後に再取得する"""
+    environment.seed_delay_info('delay_quiet', now() - reply.MAX_STALENESS_SECONDS // 2)
+    environment.serve_delay_info('delay_kansai')
+    db_delay_info = users_table.get_delay_info()
+
+    resolved = reply.resolve_railway_delay_info_messages()
+    reply.wait_background_refresh()
+
+    assert resolved.messages == db_delay_info.messages
+    assert environment.stub.requests[DELAY_PATH] == 1
+    assert users_table.get_delay_info().messages != db_delay_info.messages
+
+
+def test_expired_delay_info_is_refreshed_before_reply(
+        environment: offline.OfflineEnvironment) -> None:
+    """最大経過秒数を超えている場合、応答前に再取得する"""
+    environment.seed_delay_info('delay_quiet')
+    environment.serve_delay_info('delay_kansai')
+    db_delay_info = users_table.get_delay_info()
+
+    resolved = reply.resolve_railway_delay_info_messages()
+
+    assert resolved.messages != db_delay_info.messages
+    assert resolved.messages == users_table.get_delay_info().messages
+    assert resolved.updated_time > db_delay_info.updated_time
+
+
+def test_expired_delay_info_is_served_when_refresh_fails(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """応答前の再取得に失敗した場合、DBの鉄道遅延情報で応答する"""
+    environment.seed_delay_info('delay_quiet')
+    db_delay_info = users_table.get_delay_info()
+
+    def _request_delay_info_messages(*args, **kwargs) -> None:
+        raise CircuitOpenError("遮断中です。")
+
+    monkeypatch.setattr(railway, 'request_delay_info_messages', _request_delay_info_messages)
+    resolved = reply.resolve_railway_delay_info_messages()
+
+    assert resolved == reply.ResolvedMessages(db_delay_info.messages, db_delay_info.updated_time)
+
+
+def test_refresh_waits_for_lease_owner(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """他の呼び出しがリースを保持している場合、取得先にリクエストせずにその再取得結果を使用する"""
+    monkeypatch.setattr(reply, 'REFRESH_WAIT_SECONDS', REFRESH_WAIT_SECONDS)
+    environment.seed_delay_info('delay_quiet')
+    db_delay_info = users_table.get_delay_info()
+    assert users_table.acquire_refresh_lease('other')
+    refreshed = threading.Timer(
+        REFRESH_WAIT_SECONDS / 4, environment.seed_delay_info, ('delay_kansai', now()))
+    refreshed.start()
+
+    resolved = reply.refresh_railway_delay_info(db_delay_info)
+    refreshed.join()
+
+    assert environment.stub.requests[DELAY_PATH] == 0
+    assert resolved.messages == users_table.get_delay_info().messages
+    assert resolved.messages != db_delay_info.messages
+
+
+def test_refresh_gives_up_waiting_with_backoff(
+        environment: offline.OfflineEnvironment,
+        monkeypatch: pytest.MonkeyPatch) -> None:
+    """リースの保持者の再取得結果を待機しきれない場合、確認間隔を延ばしながら確認し、DBの鉄道遅延情報を使用する"""
+    monkeypatch.setattr(reply, 'REFRESH_WAIT_SECONDS', REFRESH_WAIT_SECONDS)
+    environment.seed_delay_info('delay_quiet')
+    db_delay_info = users_table.get_delay_info()
+    assert users_table.acquire_refresh_lease('other')
+    get_items = environment.dynamodb.calls['GetItem']
+
+    resolved = reply.refresh_railway_delay_info(db_delay_info)
+
+    assert resolved == reply.ResolvedMessages(db_delay_info.messages, db_delay_info.updated_time)
+    assert environment.stub.requests[DELAY_PATH] == 0
+    # 0.25秒後と、最大待機秒数に達した時点の2回のみ確認する
+    assert environment.dynamodb.calls['GetItem'] - get_items == 2
@@ -0,0 +1,68 @@
+"""ユーザ情報の一括登録・削除のテスト"""
+
+from aws.dynamodb import users_bulk, users_table
+from aws.dynamodb.delay_info import ALL, COMPANY_TYPES, HANKYU
+from benchmark import offline
+
+
+def query_subscriber_ids() -> list:
+    """全運営会社の購読者のユーザIDを取得する"""
+    return sorted(
+        user_id
+        for company_type in COMPANY_TYPES
+        for page in users_table.query_subscriber_id_pages(company_type)
+        for user_id in page.user_ids
+    )
+
+
+def test_reconcile_registers_followers_and_deletes_others_with_subscriptions(
+        environment: offline.OfflineEnvironment) -> None:
+    """友だち一覧にないユーザは購読情報と合わせて削除し、未登録の友だちは登録する"""
+    # 偶数番目のユーザが運営会社を個別に購読する
+    environment.seed_users(10, subscriber_ratio=0.5)
+    follower_ids = [offline.create_user_id(index) for index in range(5, 15)]
+
+    result = users_bulk.reconcile(follower_ids)
+
+    assert result.added == follower_ids[5:]
+    assert result.removed == [offline.create_user_id(index) for index in range(5)]
+    assert sorted(users_table.scan_user_ids()) == follower_ids
+    assert query_subscriber_ids() == [offline.create_user_id(index) for index in (6, 8)]
+
+
+def test_dry_run_does_not_write(environment: offline.OfflineEnvironment) -> None:
+    """差分の算出のみの場合は登録・削除しない"""
+    environment.seed_users(3, subscriber_ratio=0)
+
+    result = users_bulk.reconcile([offline.create_user_id(index) for index in range(1, 4)],
+                                  dry_run=True)
+
+    assert result.added == [offline.create_user_id(3)]
+    assert result.removed == [offline.create_user_id(0)]
+    assert environment.dynamodb.calls['BatchWriteItem'] == 0
+    assert len(list(users_table.scan_user_ids())) == 3
+
+
+def test_put_users_resets_registered_users_and_deletes_subscriptions(
+        environment: offline.OfflineEnvironment) -> None:
+    """登録済みのユーザを登録し直した場合、通知対象を全運営会社に戻し、購読情報も削除する"""
+    user_id = offline.create_user_id(0)
+    users_table.put_user(user_id)
+    users_table.update_subscription(user_id, [HANKYU])
+
+    users_bulk.put_users([user_id])
+
+    assert users_table.get_user(user_id).companies == [ALL]
+    assert query_subscriber_ids() == []
+
+
+def test_put_users_writes_repeated_user_ids_once(
+        environment: offline.OfflineEnvironment) -> None:
+    """同じユーザIDが同じチャンクに含まれる場合も、1件として登録する"""
+    user_ids = [offline.create_user_id(index) for index in (0, 1, 0)]
+
+    stats = users_bulk.put_users(user_ids)
+
+    assert stats.chunks == 1
+    assert stats.written == stats.requested == 2 * (1 + len(COMPANY_TYPES))
+    assert sorted(users_table.scan_user_ids()) == sorted(set(user_ids))
@@ -0,0 +1,53 @@
+"""ユーザ情報と購読情報の操作のテスト"""
+
+from aws.dynamodb import users_table
+from aws.dynamodb.delay_info import ALL, HANKYU, HANSHIN, WEST_JR
+from benchmark import offline
+
+# 定数群
+# 購読者の取得で1ページに含める件数
+PAGE_SIZE = 2
+
+
+def query_subscriber_ids(company_type: int) -> list:
+    """運営会社の購読者のユーザIDを取得する"""
+    return [user_id
+            for page in users_table.query_subscriber_id_pages(company_type)
+            for user_id in page.user_ids]
+
+
+def test_update_subscription_adds_and_removes_subscriptions(
+        environment: offline.OfflineEnvironment) -> None:
+    """通知対象の運営会社の変更に合わせて購読情報を追加／削除し、変更前の通知対象を返す"""
+    user_id = offline.create_user_id(0)
+    users_table.put_user(user_id)
+
+    assert users_table.update_subscription(user_id, [WEST_JR, HANKYU]) == [ALL]
+    assert query_subscriber_ids(WEST_JR) == [user_id]
+    assert query_subscriber_ids(HANKYU) == [user_id]
+
+    assert users_table.update_subscription(user_id, [HANSHIN]) == [WEST_JR, HANKYU]
+    assert users_table.get_user(user_id).companies == [HANSHIN]
+    assert query_subscriber_ids(WEST_JR) == []
+    assert query_subscriber_ids(HANKYU) == []
+    assert query_subscriber_ids(HANSHIN) == [user_id]
+
+    users_table.update_subscription(user_id, [ALL])
+    assert query_subscriber_ids(HANSHIN) == []
+
+
+def test_subscriber_pages_resume_from_last_key(
+        environment: offline.OfflineEnvironment) -> None:
+    """購読者はユーザIDの順にページ単位で取得でき、ページの最後のユーザIDから続きを取得できる"""
+    user_ids = [offline.create_user_id(index) for index in range(5)]
+    for user_id in reversed(user_ids):
+        users_table.put_user(user_id)
+        users_table.update_subscription(user_id, [HANKYU])
+
+    pages = list(users_table.query_subscriber_id_pages(HANKYU, limit=PAGE_SIZE))
+    resumed = list(users_table.query_subscriber_id_pages(
+        HANKYU, start_key=pages[0].last_key, limit=PAGE_SIZE))
+
+    assert [user_id for page in pages for user_id in page.user_ids] == user_ids
+    assert pages[-1].last_key is None
+    assert [user_id for page in resumed for user_id in page.user_ids] == user_ids[PAGE_SIZE:]
@@ -0,0 +1,68 @@
+"""Webhookのイベント処理のテスト"""
+
+import json
+import uuid
+
+from benchmark import offline
+from benchmark.stub_server import MESSAGE_PATH_PREFIX
+from functions import reply
+
+# 定数群
+REPLY_PATH = f"{MESSAGE_PATH_PREFIX}reply"
+
+
+def create_event(event_type: str, **fields) -> dict:
+    """Webhookイベントを作成する
+
+    Args:
+        event_type: イベント種類
+        fields: イベント種類毎の項目
+
+    Returns:
+        Webhookイベント
+    """
+    return dict({
+        'type': event_type,
+        'mode': 'active',
+        'timestamp': 1600000000000,
+        'source': {'type': 'user', 'userId': offline.create_user_id(1)},
+        'webhookEventId': uuid.uuid4().hex.upper(),
+        'deliveryContext': {'isRedelivery': False},
+    }, **fields)
+
+
+def send(events: list) -> None:
+    """Webhookイベント群を応答処理に送信する
+
+    Args:
+        events: Webhookイベント群
+    """
+    body = json.dumps({'destination': 'dummy', 'events': events}, ensure_ascii=False)
+    reply.main(offline.create_webhook_request(body), None)
+
+
+def test_redelivered_event_is_discarded_after_unknown_event_type(
+        environment: offline.OfflineEnvironment) -> None:
+    """SDKが破棄する未対応の種類のイベントが前にあっても、再送されたイベントを破棄する"""
+    message_event = create_event(
+        'message', replyToken='dummy',
+        message={'type': 'text', 'id': '1', 'text': '使い方'})
+
+    send([create_event('unknown_event_type'), message_event])
+    send([dict(message_event, deliveryContext={'isRedelivery': True})])
+
+    assert environment.line_requests([REPLY_PATH]) == 1
+
+
+def test_unknown_event_type_does_not_discard_following_events(
+        environment: offline.OfflineEnvironment) -> None:
+    """未対応の種類のイベントと同じリクエストの他のイベントは処理する"""
+    send([
+        create_event('unknown_event_type'),
+        create_event('message', replyToken='dummy',
+                     message={'type': 'text', 'id': '1', 'text': '使い方'}),
+        create_event('message', replyToken='dummy',
+                     message={'type': 'text', 'id': '2', 'text': 'ありがとう'}),
+    ])
+
+    assert environment.line_requests([REPLY_PATH]) == 2